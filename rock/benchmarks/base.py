@@ -0,0 +1,208 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Helpers shared by the benchmarks."""
+
+from __future__ import print_function
+
+import functools
+import math
+import multiprocessing
+import os
+import resource
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_db import options as db_options
+from oslo_log import log as logging
+from six.moves import queue
+
+from rock.db import api as db_api
+from rock import utils
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+cli_opts = [
+    cfg.StrOpt('db-url',
+               help='Database URL the samples are written to, an in-memory '
+                    'sqlite database when not set. Its sample tables are '
+                    'emptied, never point it at a production database'),
+]
+
+
+def setup(name, argv, extra_opts=()):
+    """Load the options of a benchmark from the command line only."""
+    utils.register_all_options()
+    CONF.register_cli_opts(cli_opts)
+    CONF.register_cli_opts(list(extra_opts))
+    logging.register_options(CONF)
+    # The engine logs every evaluation at INFO, keep that out of the
+    # timings unless --debug is given.
+    logging.set_defaults(default_log_levels=logging.get_default_log_levels() +
+                         ['rock=WARNING'])
+    db_options.set_defaults(CONF, connection='sqlite://')
+    CONF.set_default('sample_ring_dir', '')
+    CONF(argv, project='rock', default_config_files=[])
+    if CONF.db_url:
+        CONF.set_override('connection', CONF.db_url, group='database')
+    logging.setup(CONF, name)
+
+
+def create_tables(*models):
+    """Create the tables of models if needed and empty them."""
+    # The backend opens its session on import, after CONF is loaded.
+    from rock.db.sqlalchemy import api
+    engine = api.get_engine()
+    for model in models:
+        model.metadata.create_all(engine, tables=[model.__table__])
+        engine.execute(model.__table__.delete())
+    return engine
+
+
+def rss():
+    """Resident set size of this process in bytes."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError):
+        # Peak instead of current RSS, in KB on Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def mb(size):
+    return size / 1024.0 / 1024.0
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of values, None if there are none."""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+class MemorySampler(object):
+    """Track the peak RSS between start() and stop()."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.peak = rss()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='Memory-Sampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss())
+        return self.peak
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, rss())
+
+
+class DBTimer(object):
+    """Time the calls of the functions of rock.db.api while active.
+
+    The functions are replaced on the module, so every caller going
+    through `db_api.<function>` is timed, fetching and building the rows
+    included.
+    """
+
+    def __init__(self):
+        self.elapsed = 0.0
+        self.calls = 0
+        self._originals = {}
+
+    def _wrap(self, func):
+        @functools.wraps(func)
+        def _timed(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.elapsed += time.time() - start
+                self.calls += 1
+        return _timed
+
+    def reset(self):
+        self.elapsed = 0.0
+        self.calls = 0
+
+    def __enter__(self):
+        for name in dir(db_api):
+            func = getattr(db_api, name)
+            if name.startswith('_') or name == 'get_instance' or \
+                    not callable(func) or \
+                    getattr(func, '__module__', None) != db_api.__name__:
+                continue
+            self._originals[name] = func
+            setattr(db_api, name, self._wrap(func))
+        return self
+
+    def __exit__(self, *exc_info):
+        for name, func in self._originals.items():
+            setattr(db_api, name, func)
+        self._originals = {}
+
+
+def _call(results, func, args):
+    try:
+        results.put((True, func(*args)))
+    except Exception as e:
+        LOG.exception("Benchmark failed.")
+        results.put((False, '%s: %s' % (type(e).__name__, e)))
+
+
+def run_isolated(func, *args):
+    """Call func(*args) in a child process and return its result."""
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_call,
+                                      args=(results, func, args))
+    process.start()
+    result = None
+    while result is None:
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            if not process.is_alive():
+                process.join()
+                raise RuntimeError("Benchmark process exited with %s" %
+                                   process.exitcode)
+    process.join()
+    ok, value = result
+    if not ok:
+        raise RuntimeError(value)
+    return value
+
+
+def print_table(headers, rows):
+    """Print rows of values aligned under headers."""
+    cells = [list(headers)] + [['-' if value is None else
+                                ('%.1f' % value if isinstance(value, float)
+                                 else str(value)) for value in row]
+                               for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    for row in cells:
+        print('  '.join(cell.rjust(width)
+                        for cell, width in zip(row, widths)))
@@ -0,0 +1,418 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Local stand-ins of the services a recovery flow talks to.
+
+FakeCloud serves the few Keystone v3 and Nova calls made by the tasks of
+rock over HTTP, so the real keystoneauth and novaclient code runs.
+Evacuations finish after a simulated latency. FakeStompBroker accepts the
+messages of message_report, and write_ipmitool puts an ipmitool script on
+disk which reports every host as powered off.
+"""
+
+import collections
+import datetime
+import json
+import os
+import random
+import re
+import socket
+import stat
+import threading
+import time
+import uuid
+
+from oslo_log import log as logging
+from oslo_utils import timeutils
+from six.moves import socketserver
+from six.moves.urllib import parse
+from wsgiref import simple_server
+
+LOG = logging.getLogger(__name__)
+
+IPMITOOL = """#!/bin/sh
+# Fake ipmitool written by rock.benchmarks, every host is powered off.
+sleep %(latency)s
+case "$*" in
+    *"power status"*) echo "Chassis Power is off" ;;
+    *"power off"*) echo "Chassis Power Control: Down/Off" ;;
+esac
+exit 0
+"""
+
+
+def write_ipmitool(directory, latency=0.0):
+    """Write an ipmitool script in directory and return its path."""
+    path = os.path.join(directory, 'ipmitool')
+    with open(path, 'w') as f:
+        f.write(IPMITOOL % {'latency': latency})
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP |
+             stat.S_IXOTH)
+    return path
+
+
+def _isotime(when):
+    return when.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class FakeServer(object):
+    """A server as stored by FakeCloud."""
+
+    def __init__(self, host, index, spare):
+        self.id = str(uuid.uuid4())
+        self.name = 'vm-%s-%d' % (host, index)
+        self.host = host
+        self.spare = spare
+        self.ip = '10.%d.%d.%d' % (index // 65536 % 256, index // 256 % 256,
+                                   index % 256)
+        self.vm_state = 'active'
+        self.task_state = None
+        self.updated_at = timeutils.utcnow()
+        # Time the evacuation in progress finishes, and how.
+        self.finish_at = None
+        self.fails = False
+
+    def refresh(self, now):
+        if self.task_state is not None and time.time() >= self.finish_at:
+            self.task_state = None
+            if self.fails:
+                self.vm_state = 'error'
+            else:
+                self.host = self.spare
+            self.updated_at = now
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': 'ACTIVE' if self.vm_state == 'active' else 'ERROR',
+            'addresses': {'private': [{'addr': self.ip, 'version': 4}]},
+            'updated': _isotime(self.updated_at),
+            'links': [],
+            'OS-EXT-SRV-ATTR:host': self.host,
+            'OS-EXT-STS:vm_state': self.vm_state,
+            'OS-EXT-STS:task_state': self.task_state,
+        }
+
+
+class FakeCloud(object):
+    """Keystone v3 and Nova endpoints on a local port.
+
+    :param evacuate_latency: seconds an evacuation takes, on average.
+    :param latency_jitter: evacuations take up to that many more seconds.
+    :param api_latency: seconds every request waits before its answer.
+    :param failure_rate: share of the evacuations ending in error.
+    """
+
+    def __init__(self, evacuate_latency=2.0, latency_jitter=0.0,
+                 api_latency=0.0, failure_rate=0.0):
+        self.evacuate_latency = evacuate_latency
+        self.latency_jitter = latency_jitter
+        self.api_latency = api_latency
+        self.failure_rate = failure_rate
+        self.servers = collections.OrderedDict()
+        self.services = {}
+        self.requests = collections.Counter()
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._routes = [
+            ('GET', r'/v3/?$', 'keystone', self._keystone_version),
+            ('POST', r'/v3/auth/tokens$', 'keystone', self._token),
+            ('GET', r'/v2.1/?$', 'nova', self._nova_version),
+            ('GET', r'/v2.1/os-services$', 'nova', self._list_services),
+            ('PUT', r'/v2.1/os-services/disable-log-reason$', 'nova',
+             self._disable_service),
+            ('GET', r'/v2.1/servers/detail$', 'nova', self._list_servers),
+            ('GET', r'/v2.1/servers/(?P<id>[^/]+)$', 'nova',
+             self._get_server),
+            ('POST', r'/v2.1/servers/(?P<id>[^/]+)/action$', 'nova',
+             self._server_action),
+        ]
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self._server.server_port
+
+    def add_host(self, host, vms, spare):
+        """Add a dead compute host running vms active servers, which are
+        evacuated to the spare host.
+        """
+        with self._lock:
+            self.services[host] = {'status': 'enabled', 'state': 'down',
+                                   'disabled_reason': None}
+            for index in range(vms):
+                server = FakeServer(host, index, spare)
+                self.servers[server.id] = server
+
+    def nova_requests(self):
+        return sum(count for (service, name), count
+                   in self.requests.items() if service == 'nova')
+
+    def start(self):
+        app = self._app
+
+        class _Server(socketserver.ThreadingMixIn,
+                      simple_server.WSGIServer):
+            daemon_threads = True
+
+        class _Handler(simple_server.WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        self._server = simple_server.make_server(
+            '127.0.0.1', 0, app, server_class=_Server,
+            handler_class=_Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='Fake-Cloud')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _app(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        path = environ['PATH_INFO']
+        query = dict(parse.parse_qsl(environ.get('QUERY_STRING', '')))
+        body = None
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        if length:
+            body = json.loads(environ['wsgi.input'].read(length))
+        if self.api_latency:
+            time.sleep(self.api_latency)
+
+        for route_method, pattern, service, handler in self._routes:
+            match = re.match(pattern, path)
+            if route_method != method or match is None:
+                continue
+            with self._lock:
+                status, headers, result, name = handler(
+                    query=query, body=body, **match.groupdict())
+                self.requests[(service, name)] += 1
+            break
+        else:
+            with self._lock:
+                self.requests[('unknown', '%s %s' % (method, path))] += 1
+            status, headers, result = '404 Not Found', [], {
+                'itemNotFound': {'message': 'No route for %s' % path,
+                                 'code': 404}}
+
+        payload = b'' if result is None else json.dumps(result).encode()
+        headers = headers + [('Content-Type', 'application/json'),
+                             ('Content-Length', str(len(payload)))]
+        start_response(status, headers)
+        return [payload]
+
+    def _keystone_version(self, **kwargs):
+        return '200 OK', [], {'version': {
+            'id': 'v3.10',
+            'status': 'stable',
+            'updated': '2018-02-28T00:00:00Z',
+            'links': [{'rel': 'self', 'href': self.url + '/v3/'}],
+            'media-types': [{'base': 'application/json',
+                             'type': 'application/vnd.openstack.identity-'
+                                     'v3+json'}]}}, 'GET /v3'
+
+    def _token(self, body, **kwargs):
+        now = timeutils.utcnow()
+        domain = {'id': 'default', 'name': 'Default'}
+        token = {
+            'methods': ['password'],
+            'issued_at': _isotime(now),
+            'expires_at': _isotime(now + datetime.timedelta(hours=1)),
+            'user': {'id': 'admin', 'name': 'admin', 'domain': domain},
+            'project': {'id': 'admin', 'name': 'admin', 'domain': domain},
+            'roles': [{'id': 'admin', 'name': 'admin'}],
+            'catalog': [{
+                'type': 'compute',
+                'name': 'nova',
+                'id': 'nova',
+                'endpoints': [{'id': 'nova-public', 'interface': interface,
+                               'region': 'RegionOne',
+                               'region_id': 'RegionOne',
+                               'url': self.url + '/v2.1'}
+                              for interface in ('public', 'internal',
+                                                'admin')]}],
+        }
+        return ('201 Created', [('X-Subject-Token', uuid.uuid4().hex)],
+                {'token': token}, 'POST /v3/auth/tokens')
+
+    def _nova_version(self, **kwargs):
+        return '200 OK', [], {'version': {
+            'id': 'v2.1',
+            'status': 'CURRENT',
+            'version': '2.1',
+            'min_version': '2.1',
+            'updated': '2013-07-23T11:33:21Z',
+            'links': [{'rel': 'self', 'href': self.url + '/v2.1/'}]}}, \
+            'GET /'
+
+    def _service_dict(self, host):
+        service = self.services[host]
+        return {'id': host, 'binary': 'nova-compute', 'host': host,
+                'zone': 'nova', 'status': service['status'],
+                'state': service['state'],
+                'disabled_reason': service['disabled_reason'],
+                'updated_at': _isotime(timeutils.utcnow())}
+
+    def _list_services(self, query, **kwargs):
+        hosts = [query['host']] if 'host' in query else list(self.services)
+        return '200 OK', [], {'services': [
+            self._service_dict(host) for host in hosts
+            if host in self.services]}, 'GET /os-services'
+
+    def _disable_service(self, body, **kwargs):
+        service = self.services[body['host']]
+        service['status'] = 'disabled'
+        service['disabled_reason'] = body.get('disabled_reason')
+        return '200 OK', [], {'service': {
+            'host': body['host'], 'binary': body['binary'],
+            'status': 'disabled',
+            'disabled_reason': body.get('disabled_reason')}}, \
+            'PUT /os-services/disable-log-reason'
+
+    def _list_servers(self, query, **kwargs):
+        now = timeutils.utcnow()
+        since = query.get('changes-since')
+        servers = []
+        for server in self.servers.values():
+            server.refresh(now)
+            if 'host' in query and server.host != query['host']:
+                continue
+            if 'status' in query and \
+                    server.vm_state != query['status'].lower():
+                continue
+            if since and _isotime(server.updated_at) < since[:19] + 'Z':
+                continue
+            servers.append(server.to_dict())
+        return '200 OK', [], {'servers': servers}, 'GET /servers/detail'
+
+    def _get_server(self, id, **kwargs):
+        server = self.servers.get(id)
+        if server is None:
+            return '404 Not Found', [], {'itemNotFound': {
+                'message': 'Instance %s could not be found.' % id,
+                'code': 404}}, 'GET /servers/{id}'
+        server.refresh(timeutils.utcnow())
+        return '200 OK', [], {'server': server.to_dict()}, \
+            'GET /servers/{id}'
+
+    def _server_action(self, id, body, **kwargs):
+        server = self.servers[id]
+        action = list(body)[0]
+        if action == 'evacuate':
+            server.task_state = 'rebuilding'
+            server.updated_at = timeutils.utcnow()
+            server.finish_at = time.time() + self.evacuate_latency + \
+                random.uniform(0, self.latency_jitter)
+            server.fails = random.random() < self.failure_rate
+            return '200 OK', [], {'adminPass': uuid.uuid4().hex}, \
+                'POST /servers/{id}/action evacuate'
+        if action == 'os-resetState':
+            server.vm_state = body[action]['state']
+            return '202 Accepted', [], None, \
+                'POST /servers/{id}/action os-resetState'
+        return '400 Bad Request', [], {'badRequest': {
+            'message': 'Unsupported action %s' % action, 'code': 400}}, \
+            'POST /servers/{id}/action %s' % action
+
+
+class FakeStompBroker(object):
+    """Accept STOMP connections and count the messages sent."""
+
+    def __init__(self):
+        self.messages = []
+        self._server = None
+        self._open = 0
+        self._cond = threading.Condition()
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        broker = self
+
+        class _Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                with broker._cond:
+                    broker._open += 1
+                try:
+                    broker._handle(self.request)
+                finally:
+                    with broker._cond:
+                        broker._open -= 1
+                        broker._cond.notify_all()
+
+        class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        thread = threading.Thread(target=self._server.serve_forever,
+                                  name='Fake-Stomp')
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def wait_closed(self, timeout=5):
+        """Wait until every client disconnected, the frames they sent
+        before are handled by then.
+        """
+        deadline = time.time() + timeout
+        with self._cond:
+            while self._open and time.time() < deadline:
+                self._cond.wait(deadline - time.time())
+            return not self._open
+
+    def _handle(self, sock):
+        buf = b''
+        while True:
+            try:
+                data = sock.recv(65536)
+            except socket.error:
+                return
+            if not data:
+                return
+            buf += data
+            while b'\x00' in buf:
+                frame, buf = buf.split(b'\x00', 1)
+                if not self._frame(sock, frame.lstrip(b'\r\n')):
+                    sock.close()
+                    return
+
+    def _frame(self, sock, frame):
+        head, _, body = frame.partition(b'\n\n')
+        lines = head.decode('utf-8').splitlines()
+        if not lines:
+            return True
+        command = lines[0]
+        headers = dict(line.split(':', 1) for line in lines[1:] if ':' in line)
+        if command in ('CONNECT', 'STOMP'):
+            sock.sendall(b'CONNECTED\nversion:1.1\nheart-beat:0,0\n\n\x00')
+        elif command == 'SEND':
+            self.messages.append(body)
+        elif command == 'DISCONNECT':
+            if 'receipt' in headers:
+                sock.sendall(('RECEIPT\nreceipt-id:%s\n\n\x00' %
+                              headers['receipt']).encode('utf-8'))
+            return False
+        return True
@@ -0,0 +1,346 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measure the write path of rock-mon on synthetic regions.
+
+    python -m rock.benchmarks.ingestion --hosts 100,500,2000 \\
+        --strategies writer,bulk_insert,save_all
+
+Two fake extensions, one writing ping and one nova_service samples for
+every host, run through ExtensionManager and its PeriodicScheduler like
+the real ones for --duration seconds. The strategy tells how they write:
+
+    writer       sample_writer.put_all, the writer thread bulk inserts.
+    bulk_insert  db_api.bulk_insert from the extension itself.
+    save_all     db_api.save_all of model objects from the extension.
+
+The latency of a row goes from the collection of its sample to the return
+of the insert call. The thread count, RSS and writer queue depth are
+sampled every --interval seconds, and the cycles which outlasted their
+interval are counted.
+"""
+
+from __future__ import print_function
+
+import functools
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_utils import timeutils
+from sqlalchemy import func as sa_func
+
+from rock.benchmarks import base
+from rock.db import api as db_api
+from rock.db.sqlalchemy.model_host_status import ModelHostStatus
+from rock.db.sqlalchemy.model_nova_service import ModelNovaService
+from rock.db.sqlalchemy.model_ping import ModelPing
+from rock import extension_manager
+from rock import sample_writer
+
+CONF = cfg.CONF
+
+STRATEGIES = ('writer', 'bulk_insert', 'save_all')
+HEADERS = ('hosts', 'strategy', 'samples/s', 'rows/s', 'db rows',
+           'p50 ms', 'p95 ms', 'p99 ms', 'slowest cycle ms', 'overruns',
+           'skipped', 'max queue', 'dropped', 'drain s', 'max threads',
+           'peak rss MB')
+TIMELINE_HEADERS = ('hosts', 'strategy', 't s', 'rows', 'rows/s', 'queue',
+                    'threads', 'rss MB')
+
+cli_opts = [
+    cfg.ListOpt('hosts',
+                default=['100', '500', '2000'],
+                help='Sizes of the regions to run, in hosts'),
+    cfg.ListOpt('strategies',
+                default=list(STRATEGIES),
+                help='Write strategies to compare, among %s' %
+                     ', '.join(STRATEGIES)),
+    cfg.FloatOpt('interval',
+                 default=10.0,
+                 min=0.1,
+                 help='Seconds between two cycles of an extension'),
+    cfg.FloatOpt('duration',
+                 default=60.0,
+                 min=1,
+                 help='Seconds every size and strategy runs'),
+    cfg.FloatOpt('failure-rate',
+                 default=0.01,
+                 min=0,
+                 max=1,
+                 help='Chance of a sample to fail'),
+    cfg.StrOpt('storage-mode',
+               default='full',
+               choices=['full', 'delta'],
+               help='[monitor] storage_mode of the run'),
+    cfg.IntOpt('workers',
+               default=4,
+               min=1,
+               help='[monitor] scheduler_workers of the run'),
+    cfg.BoolOpt('timeline',
+                default=True,
+                help='Print the samples taken every interval'),
+]
+
+
+def ping_sample(target, result, created_at):
+    return {'target': target, 'result': result,
+            'management_ip_result': result,
+            'management_ip_delay': 0.2 if result else None,
+            'created_at': created_at}
+
+
+def nova_service_sample(target, result, created_at):
+    return {'target': target, 'result': result, 'service_state': result,
+            'service_status': True, 'disabled_reason': None,
+            'created_at': created_at}
+
+
+SAMPLES = {ModelPing: ping_sample, ModelNovaService: nova_service_sample}
+
+
+class FakeExtension(extension_manager.ExtensionDescriptor):
+    """Collect one sample of model per host on every cycle."""
+
+    def __init__(self, model, hosts, strategy, failure_rate):
+        self.model = model
+        self.hosts = hosts
+        self.strategy = strategy
+        self.failure_rate = failure_rate
+        self.samples = 0
+        self.durations = []
+
+    def get_name(self):
+        return 'Fake %s' % self.model.__tablename__
+
+    def get_alias(self):
+        return 'fake-%s' % self.model.__tablename__
+
+    def get_description(self):
+        return 'Samples of %d fake hosts.' % self.hosts
+
+    def periodic_task(self):
+        self.collect()
+
+    def collect(self):
+        start = time.time()
+        created_at = timeutils.utcnow()
+        make = SAMPLES[self.model]
+        samples = [make('server-%05d' % index,
+                        random.random() >= self.failure_rate, created_at)
+                   for index in range(self.hosts)]
+        if self.strategy == 'writer':
+            sample_writer.put_all(self.model, samples)
+        elif self.strategy == 'bulk_insert':
+            db_api.bulk_insert(self.model, samples)
+        else:
+            db_api.save_all([self.model(**sample) for sample in samples])
+        self.samples += len(samples)
+        self.durations.append(time.time() - start)
+
+
+def fake_extension(model, hosts, interval, strategy='writer',
+                   failure_rate=0.0):
+    """Return a FakeExtension whose periodic task runs every interval."""
+    class _FakeExtension(FakeExtension):
+        @extension_manager.ExtensionDescriptor.period_decorator(interval)
+        def periodic_task(self):
+            self.collect()
+
+    return _FakeExtension(model, hosts, strategy, failure_rate)
+
+
+class FakeExtensionManager(extension_manager.ExtensionManager):
+    """Extension manager running the given extensions only."""
+
+    def __init__(self, extensions):
+        self._fakes = extensions
+        super(FakeExtensionManager, self).__init__(path=None)
+
+    def _load_all_extensions(self):
+        for extension in self._fakes:
+            self.add_extension(extension)
+
+
+class InsertRecorder(object):
+    """Record the rows written through rock.db.api while active.
+
+    bulk_insert and save_all are replaced on the module, every row they
+    return from adds its age, from its created_at, to latencies.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.latencies = []
+        self._lock = threading.Lock()
+        self._originals = {}
+
+    def _wrap(self, func, rows_arg):
+        @functools.wraps(func)
+        def _recorded(*args, **kwargs):
+            result = func(*args, **kwargs)
+            now = timeutils.utcnow()
+            rows = args[rows_arg]
+            latencies = [timeutils.delta_seconds(self._created_at(row), now)
+                         for row in rows]
+            with self._lock:
+                self.rows += len(rows)
+                self.latencies.extend(latencies)
+            return result
+        return _recorded
+
+    @staticmethod
+    def _created_at(row):
+        if isinstance(row, dict):
+            return row['created_at']
+        return row.created_at
+
+    def __enter__(self):
+        for name, rows_arg in (('bulk_insert', 1), ('save_all', 0)):
+            func = getattr(db_api, name)
+            self._originals[name] = func
+            setattr(db_api, name, self._wrap(func, rows_arg))
+        return self
+
+    def __exit__(self, *exc_info):
+        for name, func in self._originals.items():
+            setattr(db_api, name, func)
+        self._originals = {}
+
+
+def count_rows(engine, *models):
+    return sum(engine.execute(sa_func.count(model.__table__.c.id)).scalar()
+               for model in models)
+
+
+def run_size(hosts, strategy='writer', interval=10.0, duration=60.0,
+             failure_rate=0.01, connection=None):
+    """Collect samples of hosts for duration seconds.
+
+    :return: a row of HEADERS and a row of TIMELINE_HEADERS per interval.
+    """
+    if connection:
+        CONF.set_override('connection', connection, group='database')
+    engine = base.create_tables(ModelPing, ModelNovaService, ModelHostStatus)
+    extensions = [fake_extension(model, hosts, interval, strategy,
+                                 failure_rate)
+                  for model in (ModelPing, ModelNovaService)]
+    manager = FakeExtensionManager(extensions)
+    writer = sample_writer.get_writer()
+
+    timeline = []
+    max_queue = max_threads = 0
+    memory = base.MemorySampler()
+    with InsertRecorder() as recorder:
+        memory.start()
+        start = time.time()
+        manager.start_collect_data()
+        last_rows, last_tick = 0, start
+        end = start + duration
+        while True:
+            now = time.time()
+            max_queue = max(max_queue, writer.qsize())
+            max_threads = max(max_threads, threading.active_count())
+            if now - last_tick >= interval or now >= end:
+                timeline.append((hosts, strategy, now - start, recorder.rows,
+                                 (recorder.rows - last_rows) /
+                                 (now - last_tick),
+                                 writer.qsize(), threading.active_count(),
+                                 base.mb(base.rss())))
+                last_rows, last_tick = recorder.rows, now
+            if now >= end:
+                break
+            time.sleep(min(0.1, end - now))
+        written = recorder.rows
+        manager.scheduler.stop()
+        drain_start = time.time()
+        writer.stop()
+        drain = time.time() - drain_start
+        peak = memory.stop()
+
+    entries = [manager.scheduler.entries[extension.get_alias()]
+               for extension in extensions]
+    durations = [d for extension in extensions
+                 for d in extension.durations]
+    latencies = [latency * 1000 for latency in recorder.latencies]
+    row = (hosts, strategy,
+           sum(extension.samples for extension in extensions) / duration,
+           written / duration,
+           count_rows(engine, ModelPing, ModelNovaService),
+           base.percentile(latencies, 50), base.percentile(latencies, 95),
+           base.percentile(latencies, 99),
+           max(durations) * 1000 if durations else None,
+           sum(entry.overruns for entry in entries),
+           sum(entry.skipped for entry in entries),
+           max_queue, writer.dropped, drain, max_threads, base.mb(peak))
+    return row, timeline
+
+
+def main(argv=None):
+    base.setup('rock-bench-ingestion',
+               sys.argv[1:] if argv is None else argv, cli_opts)
+    unknown = set(CONF.strategies) - set(STRATEGIES)
+    if unknown:
+        print("Unknown strategies: %s" % ', '.join(sorted(unknown)))
+        return 1
+    CONF.set_override('storage_mode', CONF.storage_mode, group='monitor')
+    CONF.set_override('scheduler_workers', CONF.workers, group='monitor')
+
+    tmp = None
+    if not CONF.db_url:
+        # An in-memory database hides the cost of the disk.
+        tmp = tempfile.mkdtemp()
+    print("Interval %.1fs, duration %.1fs, storage_mode %s, %d workers, "
+          "database %s" % (CONF.interval, CONF.duration, CONF.storage_mode,
+                           CONF.workers, CONF.db_url or 'sqlite file'))
+    rows = []
+    timeline = []
+    try:
+        for hosts in CONF.hosts:
+            for strategy in CONF.strategies:
+                connection = None
+                if tmp is not None:
+                    connection = 'sqlite:///' + os.path.join(
+                        tmp, '%s-%s.db' % (hosts, strategy))
+                row, ticks = base.run_isolated(
+                    run_size, int(hosts), strategy, CONF.interval,
+                    CONF.duration, CONF.failure_rate, connection)
+                rows.append(row)
+                timeline.extend(ticks)
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp)
+
+    if CONF.timeline:
+        base.print_table(TIMELINE_HEADERS, timeline)
+        print()
+    base.print_table(HEADERS, rows)
+
+    for row in rows:
+        hosts, strategy, slowest, overruns, skipped = (
+            row[0], row[1], row[8], row[9], row[10])
+        if slowest is None:
+            continue
+        print("%s hosts, %s: slowest cycle %.1f ms, %.1f%% of the "
+              "interval%s" % (hosts, strategy, slowest,
+                              slowest / (CONF.interval * 10),
+                              ', OVERRUN' if overruns or skipped else ''))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
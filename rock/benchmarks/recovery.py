@@ -0,0 +1,240 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Time the recovery of a dead host against a fake cloud.
+
+    python -m rock.benchmarks.recovery --vms 1,10,50,200
+
+For every size a dead compute host running that many servers is added to
+a FakeCloud, then the flow rock-engine submits for host_down runs through
+rock.tasks.manager.run_flow: power_manager with a fake ipmitool,
+host_evacuate and host_disable against the fake Nova API, message_report
+to a fake STOMP broker. The total and per task durations and the requests
+the fake Nova API served are reported.
+"""
+
+from __future__ import print_function
+
+import contextlib
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+from oslo_config import cfg
+from taskflow.listeners import base as listener_base
+from taskflow import states
+
+from rock.benchmarks import base
+from rock.benchmarks import fakes
+from rock import clients
+
+CONF = cfg.CONF
+
+HOST = 'compute-0'
+SPARE = 'compute-1'
+MANAGEMENT_IPS = ['10.0.0.1', '10.0.0.2']
+TASKS = ['power_manager', 'host_evacuate', 'host_disable', 'message_report']
+HEADERS = ('vms', 'total s', 'power s', 'evacuate s', 'disable s',
+           'report s', 'nova reqs', 'evacuated', 'messages')
+
+cli_opts = [
+    cfg.ListOpt('vms',
+                default=['1', '10', '50', '200'],
+                help='Servers on the dead host, one run per value'),
+    cfg.FloatOpt('evacuate-latency',
+                 default=2.0,
+                 min=0,
+                 help='Seconds an evacuation takes in the fake Nova'),
+    cfg.FloatOpt('latency-jitter',
+                 default=1.0,
+                 min=0,
+                 help='Evacuations take up to that many more seconds'),
+    cfg.FloatOpt('api-latency',
+                 default=0.0,
+                 min=0,
+                 help='Seconds every fake Nova and Keystone request takes'),
+    cfg.FloatOpt('ipmi-latency',
+                 default=0.1,
+                 min=0,
+                 help='Seconds every fake ipmitool call takes'),
+    cfg.FloatOpt('failure-rate',
+                 default=0.0,
+                 min=0,
+                 max=1,
+                 help='Share of the evacuations ending in error'),
+    cfg.IntOpt('check-interval',
+               default=1,
+               min=1,
+               help='[host_evacuate] check_interval of the run'),
+    cfg.IntOpt('max-concurrent',
+               default=10,
+               min=1,
+               help='[host_evacuate] max_concurrent_evacuations of the run'),
+]
+
+
+class TaskTimer(listener_base.Listener):
+    """Record the duration of every task of a flow."""
+
+    def __init__(self, engine):
+        super(TaskTimer, self).__init__(engine,
+                                        task_listen_for=(states.RUNNING,
+                                                         states.SUCCESS,
+                                                         states.FAILURE))
+        self.started = {}
+        self.durations = {}
+
+    def _task_receiver(self, state, details):
+        name = details['task_name'].split('.')[-1]
+        if state == states.RUNNING:
+            self.started[name] = time.time()
+        elif name in self.started:
+            self.durations[name] = time.time() - self.started.pop(name)
+
+
+@contextlib.contextmanager
+def overrides(values):
+    """Override (group, name) -> value options while active."""
+    for (group, name), value in values.items():
+        CONF.set_override(name, value, group=group)
+    try:
+        yield
+    finally:
+        for group, name in values:
+            CONF.clear_override(name, group=group)
+
+
+def run_size(vms, evacuate_latency=2.0, latency_jitter=1.0, api_latency=0.0,
+             ipmi_latency=0.1, failure_rate=0.0, check_interval=1,
+             max_concurrent=10):
+    """Recover a dead host running vms servers.
+
+    :return: a row of HEADERS and the requests served, by route.
+    """
+    tmp = tempfile.mkdtemp()
+    cloud = fakes.FakeCloud(evacuate_latency=evacuate_latency,
+                            latency_jitter=latency_jitter,
+                            api_latency=api_latency,
+                            failure_rate=failure_rate)
+    broker = fakes.FakeStompBroker()
+    path = os.environ.get('PATH', '')
+    try:
+        cloud.start()
+        broker.start()
+        cloud.add_host(HOST, vms, SPARE)
+        fakes.write_ipmitool(tmp, latency=ipmi_latency)
+        os.environ['PATH'] = tmp + os.pathsep + path
+        target_file = os.path.join(tmp, 'target.json')
+        with open(target_file, 'w') as f:
+            json.dump({HOST: {'ip': '10.255.0.1', 'username': 'root',
+                              'password': 'secret'}}, f)
+
+        # Wait long enough for the slowest evacuation.
+        check_times = max(6, int(math.ceil(
+            2 * (evacuate_latency + latency_jitter) / check_interval)) + 1)
+        flows_db = 'sqlite:///' + os.path.join(tmp, 'flows.db')
+        with overrides({
+                ('database', 'connection'): flows_db,
+                ('openstack_credential', 'auth_url'): cloud.url + '/v3',
+                ('openstack_credential', 'password'): 'secret',
+                ('openstack_credential', 'region_name'): 'RegionOne',
+                ('host_mgmt_ping', 'compute_hosts'): [HOST, SPARE],
+                ('host_mgmt_ping', 'management_network_ip'): MANAGEMENT_IPS,
+                ('activemq', 'server_port'): broker.port,
+                ('power_manager', 'target_file'): target_file,
+                ('power_manager', 'power_off_wait'): 0,
+                ('host_evacuate', 'check_interval'): check_interval,
+                ('host_evacuate', 'check_times'): check_times,
+                ('host_evacuate', 'max_concurrent_evacuations'): max_concurrent
+        }):
+            clients.reset()
+            return _run_flow(cloud, broker, vms)
+    finally:
+        os.environ['PATH'] = path
+        clients.reset()
+        broker.stop()
+        cloud.stop()
+        shutil.rmtree(tmp)
+
+
+def _run_flow(cloud, broker, vms):
+    from taskflow.persistence.backends import impl_sqlalchemy
+
+    from rock.tasks import manager
+
+    backend = impl_sqlalchemy.SQLAlchemyBackend(
+        dict(connection=CONF.database.connection))
+    with contextlib.closing(backend.get_connection()) as conn:
+        conn.upgrade()
+
+    timers = []
+
+    def _timer(engine):
+        timer = TaskTimer(engine)
+        timers.append(timer)
+        return timer
+
+    flow_uuid = str(uuid.uuid4())
+    store_spec = {'taskflow_uuid': flow_uuid, 'target': HOST,
+                  'disabled_reason': 'host_down_disable_by_rock'}
+    start = time.time()
+    manager.run_flow(flow_uuid, store_spec, list(TASKS), listeners=[_timer])
+    total = time.time() - start
+    broker.wait_closed()
+
+    durations = timers[0].durations
+    evacuated = sum(1 for server in cloud.servers.values()
+                    if server.host != HOST)
+    row = (vms, total, durations.get('PowerManager'),
+           durations.get('HostEvacuate'), durations.get('HostDisable'),
+           durations.get('MessageReport'), cloud.nova_requests(),
+           evacuated, len(broker.messages))
+    requests = dict(('%s %s' % key, count)
+                    for key, count in cloud.requests.items())
+    return row, requests
+
+
+def main(argv=None):
+    base.setup('rock-bench-recovery',
+               sys.argv[1:] if argv is None else argv, cli_opts)
+    print("Evacuations take %.1f-%.1fs, check_interval %ds, at most %d in "
+          "progress" % (CONF.evacuate_latency,
+                        CONF.evacuate_latency + CONF.latency_jitter,
+                        CONF.check_interval, CONF.max_concurrent))
+    rows = []
+    requests = []
+    for vms in CONF.vms:
+        row, served = base.run_isolated(
+            run_size, int(vms), CONF.evacuate_latency, CONF.latency_jitter,
+            CONF.api_latency, CONF.ipmi_latency, CONF.failure_rate,
+            CONF.check_interval, CONF.max_concurrent)
+        rows.append(row)
+        requests.append((vms, served))
+    base.print_table(HEADERS, rows)
+
+    print()
+    routes = sorted(set(route for vms, served in requests
+                        for route in served))
+    base.print_table(['requests'] + [size for size, counts in requests],
+                     [[route] + [counts.get(route, 0)
+                                 for size, counts in requests]
+                      for route in routes])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
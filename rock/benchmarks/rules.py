@@ -0,0 +1,230 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Time one cycle of the rule engine on synthetic regions.
+
+    python -m rock.benchmarks.rules --hosts 100,1000,10000 --mode parser
+
+The ping and nova_service windows of every host are written to the
+database, then the case is evaluated --cycles times, one new round of
+samples being written before each cycle after the first. Actions are
+counted instead of submitted, so no flow runs. For every cycle the wall
+time is split into the time spent in rock.db.api, fetching and building
+the rows included, and the time left to the interpreter.
+"""
+
+from __future__ import print_function
+
+import datetime
+import json
+import os
+import sys
+import time
+
+from oslo_config import cfg
+from oslo_utils import timeutils
+
+from rock.benchmarks import base
+from rock.db import api as db_api
+from rock.db.sqlalchemy.model_nova_service import ModelNovaService
+from rock.db.sqlalchemy.model_ping import ModelPing
+from rock.rules import rule_compiler
+from rock.rules import rule_parser
+from rock.rules import sample_cache
+from rock.tasks import dispatcher
+
+CONF = cfg.CONF
+
+CASE_FILE = os.path.join(os.path.dirname(__file__), '..', '..', 'etc',
+                         'cases', 'host_down.json')
+
+# healthy: every sample passes.
+# host_down: the first host fails its last samples, the case triggers.
+# flapping: failing hosts alternate failed and passed samples.
+# rack_down: failing hosts fail their last samples, too many to trigger.
+PATTERNS = ('healthy', 'host_down', 'flapping', 'rack_down')
+TRAILING_FAILURES = 10
+
+HEADERS = ('hosts', 'cycle', 'wall ms', 'db ms', 'db calls', 'interp ms',
+           'peak rss MB', 'actions')
+
+cli_opts = [
+    cfg.ListOpt('hosts',
+                default=['100', '1000', '10000'],
+                help='Sizes of the regions to run, in hosts'),
+    cfg.IntOpt('cycles',
+               default=3,
+               min=1,
+               help='Evaluations of the case per region'),
+    cfg.StrOpt('mode',
+               default='parser',
+               choices=['parser', 'tree', 'columnar', 'incremental'],
+               help="'parser' evaluates the case with RuleParser, the "
+                    "others compile it in that evaluation_mode"),
+    cfg.StrOpt('pattern',
+               default='host_down',
+               choices=PATTERNS,
+               help='Failure pattern of the samples'),
+    cfg.FloatOpt('failure-rate',
+                 default=0.01,
+                 min=0,
+                 max=1,
+                 help='Share of the hosts failing in the flapping and '
+                      'rack_down patterns'),
+    cfg.StrOpt('case-file',
+               default=CASE_FILE,
+               help='Case evaluated'),
+    cfg.IntOpt('interval',
+               default=10,
+               min=1,
+               help='Seconds between two samples of a host'),
+    cfg.BoolOpt('sample-cache',
+                default=True,
+                help='Keep the windows in memory between cycles, see '
+                     '[rule_engine] sample_cache'),
+]
+
+
+def failing_hosts(hosts, pattern, failure_rate):
+    if pattern == 'healthy':
+        return 0
+    if pattern == 'host_down':
+        return 1
+    return max(1, int(hosts * failure_rate))
+
+
+def sample_result(pattern, failing, index, step, last_step):
+    """Result of the sample of host index at step, last_step is newest."""
+    if index >= failing:
+        return True
+    if pattern == 'flapping':
+        return step % 2 == 0
+    return last_step - step >= TRAILING_FAILURES
+
+
+def sample_rows(hosts, pattern, failing, step, last_step, created_at):
+    ping, service = [], []
+    for index in range(hosts):
+        target = 'server-%05d' % index
+        result = sample_result(pattern, failing, index, step, last_step)
+        ping.append({'target': target, 'result': result,
+                     'management_ip_result': result,
+                     'management_ip_delay': 0.2 if result else None,
+                     'created_at': created_at})
+        service.append({'target': target, 'result': result,
+                        'service_state': result, 'service_status': True,
+                        'disabled_reason': None, 'created_at': created_at})
+    return ping, service
+
+
+def write_samples(hosts, pattern, failing, steps, last_step, now,
+                  interval):
+    for step in steps:
+        created_at = now - datetime.timedelta(
+            seconds=(last_step - step) * interval)
+        ping, service = sample_rows(hosts, pattern, failing, step,
+                                    last_step, created_at)
+        db_api.bulk_insert(ModelPing, ping)
+        db_api.bulk_insert(ModelNovaService, service)
+
+
+def window_of(case):
+    return max(int(value['data'][2])
+               for value in case['collect_data'].values()
+               if value['data'][0] == '%get_by_time')
+
+
+def run_size(hosts, mode='parser', pattern='host_down', cycles=3,
+             failure_rate=0.01, case_file=CASE_FILE, interval=10):
+    """Evaluate the case cycles times on a region of hosts.
+
+    :return: a row of HEADERS per cycle.
+    """
+    with open(case_file) as f:
+        case = json.load(f)
+    base.create_tables(ModelPing, ModelNovaService)
+    failing = failing_hosts(hosts, pattern, failure_rate)
+    samples = window_of(case) // interval
+    write_samples(hosts, pattern, failing, range(samples), samples - 1,
+                  timeutils.utcnow(), interval)
+
+    if mode == 'parser':
+        def _evaluate():
+            rule_parser.RuleParser(case).calculate()
+    else:
+        _evaluate = rule_compiler.compile_rule(case, mode=mode).calculate
+    cache = None
+    if CONF.rule_engine.sample_cache:
+        cache = sample_cache.get_cache()
+        cache.register_case(case)
+
+    submitted = []
+
+    def _submit(target, flow_name, store_spec, tasks):
+        submitted.append(target)
+        return True
+
+    rows = []
+    submit, dispatcher.submit = dispatcher.submit, _submit
+    try:
+        with base.DBTimer() as db_timer:
+            for cycle in range(cycles):
+                if cycle:
+                    # The failures go on in the new samples.
+                    step = samples - 1 + cycle
+                    write_samples(hosts, pattern, failing, [step], step,
+                                  timeutils.utcnow(), interval)
+                db_timer.reset()
+                del submitted[:]
+                memory = base.MemorySampler()
+                memory.start()
+                start = time.time()
+                if cache is not None:
+                    cache.refresh()
+                _evaluate()
+                wall = time.time() - start
+                peak = memory.stop()
+                rows.append((hosts, cycle + 1, wall * 1000,
+                             db_timer.elapsed * 1000, db_timer.calls,
+                             (wall - db_timer.elapsed) * 1000,
+                             base.mb(peak), len(submitted)))
+    finally:
+        dispatcher.submit = submit
+    return rows
+
+
+def main(argv=None):
+    base.setup('rock-bench-rules',
+               sys.argv[1:] if argv is None else argv, cli_opts)
+    CONF.set_override('sample_cache', CONF.sample_cache, group='rule_engine')
+    print("Case %s, mode %s, pattern %s, database %s" % (
+        os.path.basename(CONF.case_file), CONF.mode, CONF.pattern,
+        CONF.database.connection))
+    rows = []
+    for hosts in CONF.hosts:
+        rows.extend(base.run_isolated(
+            run_size, int(hosts), CONF.mode, CONF.pattern, CONF.cycles,
+            CONF.failure_rate, CONF.case_file, CONF.interval))
+    base.print_table(HEADERS, rows)
+
+    budget = CONF.check_cases_interval * 1000.0
+    for hosts in CONF.hosts:
+        worst = max(row[2] for row in rows if row[0] == int(hosts))
+        print("%s hosts: slowest cycle %.1f ms, %.1f%% of "
+              "check_cases_interval%s" % (
+                  hosts, worst, worst * 100 / budget,
+                  '' if worst < budget else ', OVERRUN'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
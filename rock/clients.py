@@ -0,0 +1,141 @@
+# Copyright 2011 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Process wide OpenStack clients.
+
+A keystoneauth1 session keeps its token in the auth plugin and only asks
+Keystone for a new one when it is about to expire, and its requests session
+keeps HTTP connections open. Sessions and clients are therefore built once
+per credential and region and shared by every caller of the process.
+
+The duration of every request sent through the sessions is observed in
+API_DURATION, ids in the path being replaced by {id}.
+"""
+
+import re
+import threading
+
+from keystoneauth1 import identity
+from keystoneauth1 import session
+from novaclient import client as nova_client
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+from six.moves.urllib import parse
+
+from rock import metrics
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+API_DURATION = metrics.histogram(
+    'rock_api_request_duration_seconds',
+    'Duration of the requests to the OpenStack APIs, by endpoint.',
+    ['method', 'endpoint'])
+_ID = re.compile(r'^([0-9a-f]{32}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-'
+                 r'[0-9a-f]{4}-[0-9a-f]{12}|\d+)$', re.IGNORECASE)
+
+_SESSIONS = {}
+_NOVA_CLIENTS = {}
+_LOCK = threading.Lock()
+
+
+def _credential():
+    credential = CONF.openstack_credential
+    return (credential.auth_url,
+            credential.username,
+            credential.password,
+            credential.user_domain_id,
+            credential.project_name,
+            credential.project_domain_id)
+
+
+def endpoint_of(request):
+    """Path of request with ids replaced, plus the name of actions.
+
+    e.g. '/v2.1/servers/{id}/action evacuate'
+    """
+    path = parse.urlsplit(request.url).path
+    endpoint = '/'.join('{id}' if _ID.match(part) else part
+                        for part in path.split('/'))
+    if endpoint.endswith('/action') and request.body:
+        try:
+            endpoint += ' ' + next(iter(jsonutils.loads(request.body)))
+        except (ValueError, TypeError, StopIteration):
+            pass
+    return endpoint
+
+
+def _observe_response(response, *args, **kwargs):
+    try:
+        API_DURATION.observe(response.elapsed.total_seconds(),
+                             method=response.request.method,
+                             endpoint=endpoint_of(response.request))
+    except Exception as e:
+        LOG.debug("Can't observe request to %s due to %s", response.url, e)
+
+
+def _get_session(credential):
+    sess = _SESSIONS.get(credential)
+    if sess is None:
+        (auth_url, username, password, user_domain_id, project_name,
+         project_domain_id) = credential
+        auth = identity.Password(
+            username=username,
+            password=password,
+            project_name=project_name,
+            auth_url=auth_url,
+            project_domain_id=project_domain_id,
+            user_domain_id=user_domain_id)
+        sess = session.Session(auth=auth, verify=False)
+        sess.session.hooks['response'].append(_observe_response)
+        _SESSIONS[credential] = sess
+        LOG.info("Created keystone session for user %s of project %s at %s.",
+                 username, project_name, auth_url)
+    return sess
+
+
+def get_session():
+    """Return the shared keystone session of the configured credential."""
+    with _LOCK:
+        return _get_session(_credential())
+
+
+def get_nova_client(version=None, region_name=None):
+    """Return the shared nova client of the configured credential.
+
+    :param version: compute API version, defaults to
+                    [openstack_credential] nova_client_version.
+    :param region_name: defaults to [openstack_credential] region_name.
+    """
+    version = version or CONF.openstack_credential.nova_client_version
+    region_name = region_name or CONF.openstack_credential.region_name
+    credential = _credential()
+    key = (credential, region_name, version)
+    with _LOCK:
+        n_client = _NOVA_CLIENTS.get(key)
+        if n_client is None:
+            n_client = nova_client.Client(version,
+                                          session=_get_session(credential),
+                                          region_name=region_name)
+            _NOVA_CLIENTS[key] = n_client
+        return n_client
+
+
+def reset():
+    """Drop all cached sessions and clients."""
+    with _LOCK:
+        _SESSIONS.clear()
+        _NOVA_CLIENTS.clear()
@@ -20,41 +20,120 @@ from oslo_config import cfg
 from oslo_db import api as db_api
 from oslo_utils import timeutils
 
+from rock import metrics
+
 _BACKEND_MAPPING = {'sqlalchemy': 'rock.db.sqlalchemy.api'}
 _IMPL = db_api.DBAPI.from_config(cfg.CONF,
                                  backend_mapping=_BACKEND_MAPPING,
                                  lazy=True)
 
+PERIOD_ROWS = metrics.histogram(
+    'rock_db_period_records_rows',
+    'Rows returned by get_period_records.',
+    ['table'], buckets=metrics.SIZE_BUCKETS)
+PERIOD_DURATION = metrics.histogram(
+    'rock_db_period_records_duration_seconds',
+    'Duration of get_period_records, building the rows included.',
+    ['table'])
+
 
 def get_instance():
     """Return a DB API instance."""
     return _IMPL
 
 
-def get_last_n_records(model, n, sort_key='id', sort_dir='desc'):
+def get_last_n_records(model, n, sort_key='id', sort_dir='desc',
+                       target=None):
     """Get the last n records of a table.
 
     :param model: Model class.
     :param n: number of results.
     :param sort_key: Used to sort the result.
     :param sort_dir: 'asc' or 'desc'.
+    :param target: only get records of this target.
     """
     return _IMPL.get_last_n_records(model, n,
                                     sort_key=sort_key,
-                                    sort_dir=sort_dir)
+                                    sort_dir=sort_dir,
+                                    target=target)
 
 
 def get_period_records(model,
                        start_time,
                        end_time=lambda: timeutils.utcnow(),
                        sort_key='id',
-                       sort_dir='desc'):
-    """Get records create_at between start_time and end_time."""
-    return _IMPL.get_period_records(model,
+                       sort_dir='desc',
+                       target=None):
+    """Get records create_at between start_time and end_time.
+
+    In delta storage mode the samples which were not written because they
+    did not change are rebuilt, so the result is the same as in full mode.
+    """
+    table = getattr(model, '__tablename__', model)
+    with PERIOD_DURATION.time(table=table):
+        records = _IMPL.get_period_records(model,
+                                           start_time,
+                                           end_time,
+                                           sort_key=sort_key,
+                                           sort_dir=sort_dir,
+                                           target=target)
+    PERIOD_ROWS.observe(len(records), table=table)
+    return records
+
+
+def get_records_after_id(model, last_id, start_time=None):
+    """Get the records stored with an id above last_id, oldest first.
+
+    :param model: Model class.
+    :param last_id: id of the last record already read, 0 for none.
+    :param start_time: only get records created since start_time.
+    """
+    return _IMPL.get_records_after_id(model, last_id, start_time=start_time)
+
+
+def expand_delta_records(model, records, start_time, end_time):
+    """Rebuild the samples created between start_time and end_time from
+    records of a delta storage mode table, read from keyframe_interval
+    before start_time.
+    """
+    return _IMPL.expand_delta_records(model, records, start_time, end_time)
+
+
+def get_rollup_records(model,
+                       start_time,
+                       end_time=lambda: timeutils.utcnow(),
+                       target=None,
+                       max_points=None):
+    """Get per-target rollups of the samples of a period.
+
+    The finest resolution which gives at most max_points periods per
+    target over the period is used, so a long period reads a few hourly
+    rows per target instead of every sample.
+
+    :param model: Model class or table name of the samples.
+    :param max_points: defaults to [rollup] max_points.
+    :return: the resolution in seconds and the rollups, oldest first.
+    """
+    return _IMPL.get_rollup_records(model,
                                     start_time,
                                     end_time,
-                                    sort_key=sort_key,
-                                    sort_dir=sort_dir)
+                                    target=target,
+                                    max_points=max_points)
+
+
+def get_host_status(model=None, target=None):
+    """Get the latest status of targets.
+
+    :param model: Model class or table name of the samples.
+    :param target: only get the status of this target.
+    """
+    return _IMPL.get_host_status(model=getattr(model, '__tablename__', model),
+                                 target=target)
+
+
+def upsert_host_status(rows):
+    """Insert or update host_status rows by (model, target)."""
+    _IMPL.upsert_host_status(rows)
 
 
 def save(model_obj):
@@ -65,3 +144,14 @@ def save(model_obj):
 def save_all(model_objs):
     """Save many model objects at a time"""
     _IMPL.save_all(model_objs)
+
+
+def bulk_insert(model, rows, columns=None, batch_size=None):
+    """Insert many rows of one model, bypassing the ORM.
+
+    :param model: Model class.
+    :param rows: list of dicts, or list of tuples ordered as columns.
+    :param columns: column names of tuple rows.
+    :param batch_size: max rows per INSERT statement.
+    """
+    _IMPL.bulk_insert(model, rows, columns=columns, batch_size=batch_size)
@@ -0,0 +1,205 @@
+# Copyright 2011 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Move old samples to the history database in small chunks.
+
+Rows are moved in primary key order, chunk_size rows per transaction: the
+rows are copied to the history table and deleted from the live table in
+the same transaction, so a failure never leaves them in both. The
+progress of a run is saved in archive_checkpoint in that transaction too,
+an interrupted run resumes where it stopped.
+"""
+
+from __future__ import absolute_import
+
+import datetime
+import sys
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import timeutils
+import sqlalchemy as sa
+
+from rock.db import partition
+from rock.db.sqlalchemy.model_archive_checkpoint import ModelArchiveCheckpoint
+from rock.db.sqlalchemy.model_nova_service import ModelNovaService
+from rock.db.sqlalchemy.model_ping import ModelPing
+from rock import utils
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+SAMPLE_MODELS = (ModelPing, ModelNovaService)
+
+cli_opts = [
+    cfg.BoolOpt('skip-archive',
+                default=False,
+                help='Do not move old samples to the history database'),
+    cfg.BoolOpt('skip-purge',
+                default=False,
+                help='Do not delete expired samples of the history database'),
+]
+
+
+class Archiver(object):
+    """Move rows older than a cutoff to the same table of history_schema.
+
+    :param engine: engine of the rock database, the history database must
+                   be reachable from its connections as history_schema.
+    :param chunk_size: rows moved per transaction.
+    :param chunk_interval: seconds to sleep between two chunks.
+    """
+
+    def __init__(self, engine, history_schema, chunk_size=1000,
+                 chunk_interval=0.5):
+        self.engine = engine
+        self.history_schema = history_schema
+        self.chunk_size = chunk_size
+        self.chunk_interval = chunk_interval
+        self._metadata = sa.MetaData()
+        self.checkpoints = ModelArchiveCheckpoint.__table__
+
+    def _history_table(self, table):
+        return table.tometadata(self._metadata, schema=self.history_schema)
+
+    def get_checkpoint(self, table_name, conn=None):
+        """Return (cutoff, last_id) of the unfinished run of a table."""
+        conn = conn or self.engine
+        row = conn.execute(self.checkpoints.select().where(
+            self.checkpoints.c.table_name == table_name)).first()
+        if row is None or row.cutoff is None:
+            return None, 0
+        return row.cutoff, row.last_id
+
+    def _save_checkpoint(self, conn, table_name, cutoff, last_id):
+        values = {'cutoff': cutoff, 'last_id': last_id,
+                  'updated_at': timeutils.utcnow()}
+        updated = conn.execute(self.checkpoints.update().where(
+            self.checkpoints.c.table_name == table_name).values(**values))
+        if not updated.rowcount:
+            conn.execute(self.checkpoints.insert().values(
+                table_name=table_name, **values))
+
+    def archive(self, model, cutoff):
+        """Move rows of model created before cutoff, return their number.
+
+        An unfinished run is resumed with its own cutoff first, then rows
+        are moved up to cutoff.
+        """
+        table = model.__table__
+        history = self._history_table(table)
+        fresh_cutoff = cutoff
+        saved_cutoff, last_id = self.get_checkpoint(table.name)
+        if saved_cutoff is not None:
+            LOG.info("Resuming archival of %s before %s from id %s." %
+                     (table.name, saved_cutoff, last_id))
+            cutoff = saved_cutoff
+
+        columns = [column.name for column in table.columns]
+        moved = 0
+        start = time.time()
+        while True:
+            with self.engine.begin() as conn:
+                ids = [row[0] for row in conn.execute(
+                    sa.select([table.c.id]).where(sa.and_(
+                        table.c.id > last_id,
+                        table.c.created_at < cutoff)).order_by(
+                        table.c.id).limit(self.chunk_size))]
+                if not ids:
+                    self._save_checkpoint(conn, table.name, None, 0)
+                    if cutoff < fresh_cutoff:
+                        # The resumed run is done, newer rows of lower ids
+                        # than its last one are still left.
+                        cutoff, last_id = fresh_cutoff, 0
+                        continue
+                    break
+                # Rows left in both databases by an older backup are
+                # replaced instead of failing on their primary key.
+                conn.execute(history.delete().where(history.c.id.in_(ids)))
+                conn.execute(history.insert().from_select(
+                    columns,
+                    sa.select([table.c[name] for name in columns]).where(
+                        table.c.id.in_(ids))))
+                conn.execute(table.delete().where(table.c.id.in_(ids)))
+                last_id = ids[-1]
+                self._save_checkpoint(conn, table.name, cutoff, last_id)
+            moved += len(ids)
+            LOG.debug("Archived %d rows of %s up to id %s." %
+                      (len(ids), table.name, last_id))
+            if len(ids) < self.chunk_size:
+                continue
+            time.sleep(self.chunk_interval)
+        self._report('Archived', table.name, moved, start)
+        return moved
+
+    def purge(self, model, cutoff):
+        """Delete history rows of model created before cutoff."""
+        history = self._history_table(model.__table__)
+        deleted = 0
+        start = time.time()
+        while True:
+            with self.engine.begin() as conn:
+                ids = [row[0] for row in conn.execute(
+                    sa.select([history.c.id]).where(
+                        history.c.created_at < cutoff).order_by(
+                        history.c.id).limit(self.chunk_size))]
+                if not ids:
+                    break
+                conn.execute(history.delete().where(history.c.id.in_(ids)))
+            deleted += len(ids)
+            time.sleep(self.chunk_interval)
+        self._report('Purged', history.fullname, deleted, start)
+        return deleted
+
+    @staticmethod
+    def _report(action, table_name, rows, start):
+        used_time = time.time() - start
+        LOG.info("%s %d rows of %s in %.1f seconds, %.0f rows/s." % (
+            action, rows, table_name, used_time,
+            rows / used_time if used_time > 0 else 0))
+
+
+def run(engine, archive=True, purge=True):
+    archiver = Archiver(engine,
+                        partition.history_schema_name(engine.url.database),
+                        chunk_size=CONF.archive.chunk_size,
+                        chunk_interval=CONF.archive.chunk_interval)
+    now = timeutils.utcnow()
+    for model in SAMPLE_MODELS:
+        if archive:
+            archiver.archive(model, now - datetime.timedelta(
+                seconds=CONF.archive.archive_after))
+        if purge and CONF.partition.history_retention_days:
+            archiver.purge(model, now - datetime.timedelta(
+                days=CONF.partition.history_retention_days))
+
+
+def main():
+    utils.register_all_options()
+    CONF.register_cli_opts(cli_opts)
+    logging.register_options(CONF)
+    CONF(sys.argv[1:], project='rock',
+         default_config_files=['/etc/rock/rock.ini'])
+    logging.setup(CONF, 'rock-archive')
+    # The backend opens its session on import, after CONF is loaded.
+    from rock.db.sqlalchemy import api
+    engine = api.get_engine()
+    while True:
+        run(engine, archive=not CONF.skip_archive,
+            purge=not CONF.skip_purge)
+        if not CONF.archive.run_interval:
+            return 0
+        time.sleep(CONF.archive.run_interval)
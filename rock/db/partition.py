@@ -0,0 +1,263 @@
+# Copyright 2011 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Daily RANGE partitions of the sample tables on MySQL.
+
+Sample tables are partitioned by TO_DAYS(created_at), partition pYYYYMMDD
+holds the rows of that day (the first one also holds every older row) and
+pmax catches rows beyond the last day. Retention never deletes rows: an
+expired partition is exchanged with an empty table of the history
+database, and exchanged again into the partition of the same day there,
+then dropped. Both are metadata operations which do not lock the rows
+rock-mon is inserting. Old partitions of the history database are dropped.
+
+History tables which are not partitioned by day, like the ones rock-archive
+fills, are supported too: the rows of the exchanged partition are inserted
+into them and rock-archive --purge expires them.
+"""
+
+from __future__ import absolute_import
+
+import datetime
+import sys
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import timeutils
+import sqlalchemy as sa
+
+from rock import utils
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+SAMPLE_TABLES = ('ping', 'nova_service')
+MAX_PARTITION = 'pmax'
+
+
+def partition_name(day):
+    return 'p' + day.strftime('%Y%m%d')
+
+
+def partition_day(name):
+    """Return the day of a daily partition, None for other partitions."""
+    try:
+        return datetime.datetime.strptime(name, 'p%Y%m%d').date()
+    except ValueError:
+        return None
+
+
+def partition_clause(day):
+    return "PARTITION %s VALUES LESS THAN (TO_DAYS('%s'))" % (
+        partition_name(day), (day + datetime.timedelta(days=1)).isoformat())
+
+
+def _days(first_day, last_day):
+    day = first_day
+    while day <= last_day:
+        yield day
+        day += datetime.timedelta(days=1)
+
+
+def partition_by_sql(table, first_day, last_day):
+    """ALTER TABLE partitioning table from first_day to last_day."""
+    clauses = [partition_clause(day) for day in _days(first_day, last_day)]
+    clauses.append("PARTITION %s VALUES LESS THAN MAXVALUE" % MAX_PARTITION)
+    return "ALTER TABLE %s PARTITION BY RANGE (TO_DAYS(created_at)) (%s)" % (
+        table, ', '.join(clauses))
+
+
+def add_partitions_sql(schema, table, days):
+    """ALTER TABLE splitting pmax into partitions of days and pmax."""
+    clauses = [partition_clause(day) for day in days]
+    clauses.append("PARTITION %s VALUES LESS THAN MAXVALUE" % MAX_PARTITION)
+    return "ALTER TABLE %s.%s REORGANIZE PARTITION %s INTO (%s)" % (
+        schema, table, MAX_PARTITION, ', '.join(clauses))
+
+
+def list_partitions(conn, schema, table):
+    """Return the partition names of a table, in range order."""
+    rows = conn.execute(sa.text(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = :schema AND TABLE_NAME = :table "
+        "AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"),
+        schema=schema, table=table)
+    return [row[0] for row in rows]
+
+
+def covering_partition(partitions, day):
+    """Return the partition which holds the rows of day."""
+    for name in partitions:
+        partition = partition_day(name)
+        if partition is not None and partition >= day:
+            return name
+    return MAX_PARTITION
+
+
+def is_partitioned_by_day(conn, schema, table):
+    return any(partition_day(name) is not None
+               for name in list_partitions(conn, schema, table))
+
+
+def ensure_partitions(conn, schema, table, last_day):
+    """Create the daily partitions missing up to last_day."""
+    days = [partition_day(name) for name in list_partitions(conn, schema,
+                                                            table)]
+    days = [day for day in days if day is not None]
+    if not days:
+        LOG.warning("Table %s.%s is not partitioned by day." %
+                    (schema, table))
+        return []
+    new_days = list(_days(max(days) + datetime.timedelta(days=1), last_day))
+    if new_days:
+        conn.execute(add_partitions_sql(schema, table, new_days))
+        LOG.info("Created partitions %s of %s.%s." % (
+            ' '.join(partition_name(day) for day in new_days), schema, table))
+    return new_days
+
+
+def _is_empty(conn, schema, table, partition):
+    return conn.execute("SELECT 1 FROM %s.%s PARTITION (%s) LIMIT 1" % (
+        schema, table, partition)).first() is None
+
+
+def _table_exists(conn, schema, table):
+    return conn.execute(sa.text(
+        "SELECT 1 FROM information_schema.TABLES "
+        "WHERE TABLE_SCHEMA = :schema AND TABLE_NAME = :table"),
+        schema=schema, table=table).first() is not None
+
+
+def _move_staging(conn, history_schema, table, staging, day):
+    """Move the rows of a staging table into history and drop it.
+
+    :return: the history partition which received the rows, None when
+             the history table is not partitioned by day.
+    """
+    target = None
+    if is_partitioned_by_day(conn, history_schema, table):
+        ensure_partitions(conn, history_schema, table, day)
+        target = covering_partition(
+            list_partitions(conn, history_schema, table), day)
+    # The first partition also holds the rows of older days, which do not
+    # fit into the partition of its day in the history table.
+    oldest = conn.execute("SELECT MIN(created_at) FROM %s.%s" % (
+        history_schema, staging)).scalar()
+    if oldest is None:
+        pass
+    elif target is not None and oldest.date() >= day and \
+            _is_empty(conn, history_schema, table, target):
+        conn.execute(
+            "ALTER TABLE %s.%s EXCHANGE PARTITION %s WITH TABLE %s.%s" %
+            (history_schema, table, target, history_schema, staging))
+    else:
+        # Only the staging table is read, the live table is not locked.
+        # IGNORE skips the rows a run which stopped before dropping the
+        # staging table already inserted.
+        conn.execute("INSERT IGNORE INTO %s.%s SELECT * FROM %s.%s" % (
+            history_schema, table, history_schema, staging))
+    conn.execute("DROP TABLE %s.%s" % (history_schema, staging))
+    return target
+
+
+def archive_partition(conn, schema, table, partition, history_schema):
+    """Move the rows of a partition to the same table of history_schema.
+
+    The partition is left empty. A staging table left by a run which
+    stopped midway is moved into history first, once the partition was
+    exchanged it holds the only copy of its rows.
+    """
+    day = partition_day(partition)
+    staging = '%s_%s' % (table, partition)
+    if _table_exists(conn, history_schema, staging):
+        LOG.warning("Resuming the archive of partition %s of %s.%s from "
+                    "%s.%s." % (partition, schema, table, history_schema,
+                                staging))
+        _move_staging(conn, history_schema, table, staging, day)
+    conn.execute("CREATE TABLE %s.%s LIKE %s.%s" % (
+        history_schema, staging, schema, table))
+    conn.execute("ALTER TABLE %s.%s REMOVE PARTITIONING" % (
+        history_schema, staging))
+    conn.execute("ALTER TABLE %s.%s EXCHANGE PARTITION %s WITH TABLE %s.%s" %
+                 (schema, table, partition, history_schema, staging))
+    target = _move_staging(conn, history_schema, table, staging, day)
+    LOG.info("Archived partition %s of %s.%s into %s.%s%s." % (
+        partition, schema, table, history_schema, table,
+        ' partition %s' % target if target else ''))
+
+
+def expire_partitions(conn, schema, table, before_day, history_schema=None):
+    """Drop the daily partitions of days before before_day.
+
+    With history_schema, their rows are archived there first.
+    """
+    expired = []
+    for name in list_partitions(conn, schema, table):
+        day = partition_day(name)
+        if day is None or day >= before_day:
+            continue
+        if history_schema:
+            archive_partition(conn, schema, table, name, history_schema)
+        conn.execute("ALTER TABLE %s.%s DROP PARTITION %s" % (
+            schema, table, name))
+        LOG.info("Dropped partition %s of %s.%s." % (name, schema, table))
+        expired.append(name)
+    return expired
+
+
+def history_schema_name(schema):
+    return CONF.partition.history_database or schema + '_history'
+
+
+def run(engine, today=None):
+    """Pre-create future partitions and expire old ones of every table."""
+    today = today or timeutils.utcnow().date()
+    schema = engine.url.database
+    history_schema = history_schema_name(schema)
+    last_day = today + datetime.timedelta(days=CONF.partition.days_ahead)
+    with engine.connect() as conn:
+        for table in SAMPLE_TABLES:
+            ensure_partitions(conn, schema, table, last_day)
+            expire_partitions(
+                conn, schema, table,
+                today - datetime.timedelta(
+                    days=CONF.partition.retention_days),
+                history_schema if CONF.partition.archive else None)
+            if CONF.partition.archive and \
+                    is_partitioned_by_day(conn, history_schema, table):
+                ensure_partitions(conn, history_schema, table, last_day)
+                if CONF.partition.history_retention_days:
+                    expire_partitions(
+                        conn, history_schema, table,
+                        today - datetime.timedelta(
+                            days=CONF.partition.history_retention_days))
+
+
+def main():
+    utils.register_all_options()
+    logging.register_options(CONF)
+    CONF(sys.argv[1:], project='rock',
+         default_config_files=['/etc/rock/rock.ini'])
+    logging.setup(CONF, 'rock-partition')
+    # The backend opens its session on import, after CONF is loaded.
+    from rock.db.sqlalchemy import api
+    engine = api.get_engine()
+    if engine.dialect.name != 'mysql':
+        LOG.error("Partitioning is only supported on MySQL, not %s." %
+                  engine.dialect.name)
+        return 1
+    run(engine)
+    return 0
@@ -0,0 +1,351 @@
+# Copyright 2011 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Aggregate samples into per-target rollups of every resolution.
+
+A period is rolled up once, after it ended and rollup delay seconds passed
+for the last samples to be written. The periods of the finest resolution
+are built from the samples, the others from the resolution before them.
+The high-water mark of a resolution is the end of its latest period, every
+run continues from there, so samples are read once. Periods older than the
+retention of their resolution are then deleted, once they are rolled up
+into the next resolution.
+"""
+
+from __future__ import absolute_import
+
+import datetime
+import sys
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import timeutils
+import sqlalchemy as sa
+
+from rock.db.sqlalchemy.model_nova_service import ModelNovaService
+from rock.db.sqlalchemy.model_ping import ModelPing
+from rock.db.sqlalchemy import model_rollup
+from rock import utils
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+SAMPLE_MODELS = (ModelPing, ModelNovaService)
+
+FALSE_VALUES = [False, 'false', 'False']
+
+# Option of [rollup] with the days of periods kept, per resolution.
+RETENTION_OPTS = {60: 'minute_retention_days', 3600: 'hour_retention_days'}
+
+
+class RollupBucket(object):
+    """Aggregates of one target over one period."""
+
+    def __init__(self, rollup_model, resolution, target, start):
+        self.stat_columns = rollup_model.stat_columns
+        self.ignored_values = rollup_model.ignored_values
+        self.row = {'resolution': resolution,
+                    'target': target,
+                    'period_start': start,
+                    'sample_count': 0,
+                    'failure_count': 0,
+                    'state_changes': 0,
+                    'last_result': None}
+        self._sums = dict((column, 0.0) for column in self.stat_columns)
+        for column in self.stat_columns:
+            self.row[column + '_min'] = None
+            self.row[column + '_max'] = None
+            self.row[column + '_count'] = 0
+
+    def _add_stat(self, column, low, high, total, count):
+        row = self.row
+        if row[column + '_min'] is None or low < row[column + '_min']:
+            row[column + '_min'] = low
+        if row[column + '_max'] is None or high > row[column + '_max']:
+            row[column + '_max'] = high
+        row[column + '_count'] += count
+        self._sums[column] += total
+
+    def add_sample(self, sample, previous=None):
+        """Add a sample, previous is the result of the sample before it."""
+        result = sample.result not in FALSE_VALUES
+        if previous is not None and previous != result:
+            self.row['state_changes'] += 1
+        self.row['last_result'] = result
+        self.row['sample_count'] += 1
+        if not result:
+            self.row['failure_count'] += 1
+        for column in self.stat_columns:
+            value = getattr(sample, column)
+            if value is not None and value not in self.ignored_values:
+                self._add_stat(column, value, value, value, 1)
+
+    def add_rollup(self, rollup):
+        """Add a finer rollup of the period, in time order."""
+        self.row['state_changes'] += rollup.state_changes
+        self.row['last_result'] = rollup.last_result
+        self.row['sample_count'] += rollup.sample_count
+        self.row['failure_count'] += rollup.failure_count
+        for column in self.stat_columns:
+            count = getattr(rollup, column + '_count')
+            if count:
+                self._add_stat(column,
+                               getattr(rollup, column + '_min'),
+                               getattr(rollup, column + '_max'),
+                               getattr(rollup, column + '_avg') * count,
+                               count)
+
+    def to_dict(self):
+        row = dict(self.row)
+        for column in self.stat_columns:
+            count = row[column + '_count']
+            row[column + '_avg'] = \
+                self._sums[column] / count if count else None
+        return row
+
+
+def aggregate(rollup_model, resolution, rows, previous=None,
+              from_rollups=False):
+    """Aggregate rows into rollup dicts of resolution.
+
+    :param rows: samples, or rollups of a finer resolution when
+                 from_rollups, in time order.
+    :param previous: {target: last result before rows} of samples, it is
+                     updated with the last result of rows. Rollups already
+                     count the change from the period before them.
+    """
+    previous = {} if previous is None else previous
+    buckets = {}
+    for row in rows:
+        at = row.period_start if from_rollups else row.created_at
+        key = (row.target, model_rollup.period_start(at, resolution))
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = RollupBucket(rollup_model, resolution, *key)
+            buckets[key] = bucket
+        if from_rollups:
+            bucket.add_rollup(row)
+        else:
+            bucket.add_sample(row, previous.get(row.target))
+            previous[row.target] = row.result not in FALSE_VALUES
+    return [buckets[period].to_dict() for period in sorted(buckets)]
+
+
+class Rollup(object):
+    """Roll up the closed periods of the sample tables.
+
+    :param engine: engine of the rock database.
+    :param window: seconds of samples read per query and written per
+                   transaction, rounded to a whole number of periods.
+    """
+
+    def __init__(self, engine, window=3600):
+        self.engine = engine
+        self.window = window
+
+    def high_water(self, rollup_model, resolution):
+        """Return the end of the latest period of resolution, or None."""
+        table = rollup_model.__table__
+        latest = self.engine.execute(
+            sa.select([sa.func.max(table.c.period_start)]).where(
+                table.c.resolution == resolution)).scalar()
+        if latest is None:
+            return None
+        return latest + datetime.timedelta(seconds=resolution)
+
+    def _last_results(self, rollup_model, resolution, before):
+        """Return {target: last_result} of the latest periods before."""
+        table = rollup_model.__table__
+        since = before - datetime.timedelta(days=1)
+        latest = sa.select([
+            table.c.target,
+            sa.func.max(table.c.period_start).label('period_start')]).where(
+            sa.and_(table.c.resolution == resolution,
+                    table.c.period_start >= since,
+                    table.c.period_start < before)).group_by(
+            table.c.target).alias('latest')
+        rows = self.engine.execute(
+            sa.select([table.c.target, table.c.last_result]).select_from(
+                table.join(latest, sa.and_(
+                    table.c.target == latest.c.target,
+                    table.c.period_start == latest.c.period_start))).where(
+                table.c.resolution == resolution))
+        return dict((row.target, row.last_result) for row in rows)
+
+    def _first_sample(self, model):
+        table = model.__table__
+        return self.engine.execute(
+            sa.select([sa.func.min(table.c.created_at)])).scalar()
+
+    def _first_rollup(self, rollup_model, resolution):
+        table = rollup_model.__table__
+        return self.engine.execute(
+            sa.select([sa.func.min(table.c.period_start)]).where(
+                table.c.resolution == resolution)).scalar()
+
+    def _samples(self, model, start, end):
+        """Samples created from start to before end, in time order."""
+        table = model.__table__
+        query_start = start
+        if CONF.monitor.storage_mode == 'delta':
+            query_start -= datetime.timedelta(
+                seconds=CONF.monitor.keyframe_interval)
+        rows = self.engine.execute(
+            sa.select([table]).where(sa.and_(
+                table.c.created_at >= query_start,
+                table.c.created_at < end)).order_by(
+                table.c.created_at, table.c.id)).fetchall()
+        if CONF.monitor.storage_mode == 'delta':
+            # The backend opens its session on import, only import it
+            # when it is needed.
+            from rock.db.sqlalchemy import api
+            rows = [row for row in api.expand_delta_rows(
+                model, rows, start, end, CONF.monitor.sample_interval,
+                CONF.monitor.keyframe_interval) if row.created_at < end]
+            rows.sort(key=lambda row: row.created_at)
+        return rows
+
+    def _rollups(self, rollup_model, resolution, start, end):
+        table = rollup_model.__table__
+        return self.engine.execute(
+            sa.select([table]).where(sa.and_(
+                table.c.resolution == resolution,
+                table.c.period_start >= start,
+                table.c.period_start < end)).order_by(
+                table.c.period_start, table.c.target)).fetchall()
+
+    def rollup(self, model, resolution, until):
+        """Roll up the periods of model ended before until.
+
+        :return: number of rollup rows written.
+        """
+        rollup_model = model_rollup.ROLLUP_MODELS[model.__tablename__]
+        table = rollup_model.__table__
+        index = model_rollup.RESOLUTIONS.index(resolution)
+        finer = model_rollup.RESOLUTIONS[index - 1] if index else None
+        if finer is not None:
+            # Only periods whose finer periods are all built.
+            finer_end = self.high_water(rollup_model, finer)
+            if finer_end is None:
+                return 0
+            until = min(until, finer_end)
+
+        start = self.high_water(rollup_model, resolution)
+        if start is None:
+            if finer is None:
+                start = self._first_sample(model)
+            else:
+                start = self._first_rollup(rollup_model, finer)
+            if start is None:
+                return 0
+            start = model_rollup.period_start(start, resolution)
+        end = model_rollup.period_start(until, resolution)
+        step = datetime.timedelta(
+            seconds=max(1, self.window // resolution) * resolution)
+
+        if finer is None:
+            previous = self._last_results(rollup_model, resolution, start)
+        written = 0
+        begin = time.time()
+        while start < end:
+            stop = min(start + step, end)
+            if finer is None:
+                rows = aggregate(rollup_model, resolution,
+                                 self._samples(model, start, stop), previous)
+            else:
+                rows = aggregate(rollup_model, resolution,
+                                 self._rollups(rollup_model, finer,
+                                               start, stop),
+                                 from_rollups=True)
+            if rows:
+                with self.engine.begin() as conn:
+                    conn.execute(table.insert(), rows)
+            written += len(rows)
+            LOG.debug("Rolled up %s from %s to %s by %s seconds into %d "
+                      "rows." % (model.__tablename__, start, stop,
+                                 resolution, len(rows)))
+            start = stop
+        if written:
+            LOG.info("Rolled up %s by %s seconds into %d rows in %.1f "
+                     "seconds." % (model.__tablename__, resolution, written,
+                                   time.time() - begin))
+        return written
+
+    def expire(self, rollup_model, resolution, before):
+        """Delete the periods of resolution started before before.
+
+        Periods not rolled up into the next resolution yet are kept. One
+        window of periods is deleted per transaction.
+
+        :return: number of rollup rows deleted.
+        """
+        table = rollup_model.__table__
+        index = model_rollup.RESOLUTIONS.index(resolution)
+        if index + 1 < len(model_rollup.RESOLUTIONS):
+            coarser_end = self.high_water(
+                rollup_model, model_rollup.RESOLUTIONS[index + 1])
+            if coarser_end is None:
+                return 0
+            before = min(before, coarser_end)
+        start = self._first_rollup(rollup_model, resolution)
+        if start is None:
+            return 0
+        step = datetime.timedelta(
+            seconds=max(1, self.window // resolution) * resolution)
+        deleted = 0
+        begin = time.time()
+        while start < before:
+            stop = min(start + step, before)
+            with self.engine.begin() as conn:
+                deleted += conn.execute(table.delete().where(sa.and_(
+                    table.c.resolution == resolution,
+                    table.c.period_start < stop))).rowcount
+            start = stop
+        if deleted:
+            LOG.info("Expired %d rows of %s by %s seconds in %.1f seconds." %
+                     (deleted, table.name, resolution, time.time() - begin))
+        return deleted
+
+
+def run(engine, now=None):
+    now = now or timeutils.utcnow()
+    until = now - datetime.timedelta(seconds=CONF.rollup.delay)
+    rollup = Rollup(engine, window=CONF.rollup.window)
+    for model in SAMPLE_MODELS:
+        for resolution in model_rollup.RESOLUTIONS:
+            rollup.rollup(model, resolution, until)
+        rollup_model = model_rollup.ROLLUP_MODELS[model.__tablename__]
+        for resolution in model_rollup.RESOLUTIONS:
+            days = getattr(CONF.rollup, RETENTION_OPTS[resolution])
+            if days:
+                rollup.expire(rollup_model, resolution,
+                              now - datetime.timedelta(days=days))
+
+
+def main():
+    utils.register_all_options()
+    logging.register_options(CONF)
+    CONF(sys.argv[1:], project='rock',
+         default_config_files=['/etc/rock/rock.ini'])
+    logging.setup(CONF, 'rock-rollup')
+    # The backend opens its session on import, after CONF is loaded.
+    from rock.db.sqlalchemy import api
+    engine = api.get_engine()
+    while True:
+        run(engine)
+        if not CONF.rollup.run_interval:
+            return 0
+        time.sleep(CONF.rollup.run_interval)
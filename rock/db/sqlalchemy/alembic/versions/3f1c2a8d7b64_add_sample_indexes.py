@@ -0,0 +1,30 @@
+"""Add created_at indexes to sample tables
+
+Revision ID: 3f1c2a8d7b64
+Revises: 9b7a49e317a6
+Create Date: 2016-10-18 10:21:37.204651
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a8d7b64'
+down_revision = '9b7a49e317a6'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+
+SAMPLE_TABLES = ('ping', 'nova_service')
+
+
+def upgrade():
+    for table in SAMPLE_TABLES:
+        op.create_index('ix_%s_created_at' % table, table, ['created_at'])
+        op.create_index('ix_%s_target_created_at' % table, table,
+                        ['target', 'created_at'])
+
+
+def downgrade():
+    for table in SAMPLE_TABLES:
+        op.drop_index('ix_%s_target_created_at' % table, table_name=table)
+        op.drop_index('ix_%s_created_at' % table, table_name=table)
@@ -0,0 +1,33 @@
+"""Add host_status table
+
+Revision ID: 5d2e8b1c9a47
+Revises: 3f1c2a8d7b64
+Create Date: 2016-10-24 15:02:11.380162
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5d2e8b1c9a47'
+down_revision = '3f1c2a8d7b64'
+branch_labels = None
+depends_on = None
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def upgrade():
+    op.create_table(
+        'host_status',
+        sa.Column('model', sa.String(64), primary_key=True),
+        sa.Column('target', sa.String(36), primary_key=True),
+        sa.Column('result', sa.Boolean(), nullable=False),
+        sa.Column('failure_count', sa.Integer(), nullable=False,
+                  default=0),
+        sa.Column('last_changed_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('data', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_table('host_status')
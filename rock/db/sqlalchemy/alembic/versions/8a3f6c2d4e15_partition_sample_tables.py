@@ -0,0 +1,47 @@
+"""Partition sample tables by day on MySQL
+
+Revision ID: 8a3f6c2d4e15
+Revises: 5d2e8b1c9a47
+Create Date: 2016-10-27 09:41:52.615230
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8a3f6c2d4e15'
+down_revision = '5d2e8b1c9a47'
+branch_labels = None
+depends_on = None
+
+import datetime
+
+from alembic import op
+from oslo_utils import timeutils
+
+from rock.db import partition
+
+# Partitions created up front, rock-partition creates the later ones.
+DAYS_AHEAD = 7
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    today = timeutils.utcnow().date()
+    for table in partition.SAMPLE_TABLES:
+        # Every unique key of a partitioned table must contain the
+        # partitioning column.
+        op.execute("ALTER TABLE %s DROP PRIMARY KEY, "
+                   "ADD PRIMARY KEY (id, created_at)" % table)
+        # Older rows all go into the partition of yesterday.
+        op.execute(partition.partition_by_sql(
+            table, today - datetime.timedelta(days=1),
+            today + datetime.timedelta(days=DAYS_AHEAD)))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    for table in partition.SAMPLE_TABLES:
+        op.execute("ALTER TABLE %s REMOVE PARTITIONING" % table)
+        op.execute("ALTER TABLE %s DROP PRIMARY KEY, ADD PRIMARY KEY (id)"
+                   % table)
@@ -0,0 +1,29 @@
+"""Add archive_checkpoint table
+
+Revision ID: b4c71e9f0a26
+Revises: 8a3f6c2d4e15
+Create Date: 2016-11-02 14:12:05.842397
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b4c71e9f0a26'
+down_revision = '8a3f6c2d4e15'
+branch_labels = None
+depends_on = None
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def upgrade():
+    op.create_table(
+        'archive_checkpoint',
+        sa.Column('table_name', sa.String(64), primary_key=True),
+        sa.Column('cutoff', sa.DateTime(), nullable=True),
+        sa.Column('last_id', sa.Integer(), nullable=False, default=0),
+        sa.Column('updated_at', sa.DateTime(), nullable=False))
+
+
+def downgrade():
+    op.drop_table('archive_checkpoint')
@@ -0,0 +1,56 @@
+"""Add ping_rollup and nova_service_rollup tables
+
+Revision ID: d2a95e7c3f18
+Revises: b4c71e9f0a26
+Create Date: 2016-11-07 10:21:43.519206
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd2a95e7c3f18'
+down_revision = 'b4c71e9f0a26'
+branch_labels = None
+depends_on = None
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def _rollup_columns():
+    return [
+        sa.Column('resolution', sa.Integer(), primary_key=True,
+                  autoincrement=False),
+        sa.Column('target', sa.String(36), primary_key=True),
+        sa.Column('period_start', sa.DateTime(), primary_key=True),
+        sa.Column('sample_count', sa.Integer(), nullable=False, default=0),
+        sa.Column('failure_count', sa.Integer(), nullable=False, default=0),
+        sa.Column('state_changes', sa.Integer(), nullable=False, default=0),
+        sa.Column('last_result', sa.Boolean(), nullable=False)]
+
+
+def _stat_columns(name):
+    return [
+        sa.Column(name + '_min', sa.Float(), nullable=True),
+        sa.Column(name + '_avg', sa.Float(), nullable=True),
+        sa.Column(name + '_max', sa.Float(), nullable=True),
+        sa.Column(name + '_count', sa.Integer(), nullable=False, default=0)]
+
+
+def upgrade():
+    op.create_table(
+        'ping_rollup',
+        *(_rollup_columns() +
+          _stat_columns('management_ip_delay') +
+          _stat_columns('tunnel_ip_delay') +
+          _stat_columns('storage_ip_delay')))
+    op.create_table('nova_service_rollup', *_rollup_columns())
+    for table in ('ping_rollup', 'nova_service_rollup'):
+        op.create_index('ix_%s_resolution_period_start' % table, table,
+                        ['resolution', 'period_start'])
+
+
+def downgrade():
+    for table in ('ping_rollup', 'nova_service_rollup'):
+        op.drop_index('ix_%s_resolution_period_start' % table,
+                      table_name=table)
+        op.drop_table(table)
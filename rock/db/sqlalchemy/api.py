@@ -16,12 +16,21 @@
 """SQLAlchemy storage backend.
 """
 
+import datetime
+import math
+
 from oslo_config import cfg
 from oslo_db.sqlalchemy import session as db_session
 from oslo_log import log as logging
+from oslo_utils import timeutils
+from sqlalchemy import and_
+from sqlalchemy import bindparam
 from sqlalchemy import desc
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 
 from rock.db.sqlalchemy.model_base import ModelBase
+from rock.db.sqlalchemy.model_host_status import ModelHostStatus
+from rock.db.sqlalchemy import model_rollup
 
 CONF = cfg.CONF
 
@@ -63,6 +72,65 @@ def model_query(model, *args, **kwargs):
     return query
 
 
+def expand_delta_rows(model, rows, start_time, end_time, sample_interval,
+                      keyframe_interval):
+    """Rebuild the samples of a period from change-only rows.
+
+    Every stored row stands for the samples taken every sample_interval
+    seconds until the next stored row of its target, and for at most
+    keyframe_interval seconds, after which a keyframe would have been
+    written if the target was still monitored. Rebuilt samples are
+    transient copies of the stored row with their own created_at.
+
+    :param rows: stored rows from keyframe_interval before start_time up
+                 to end_time, in any order.
+    :return: rows created between start_time and end_time, in no order.
+    """
+    columns = [column.name for column in model.__table__.columns]
+    half_step = datetime.timedelta(seconds=sample_interval / 2.0)
+    keyframe = datetime.timedelta(seconds=keyframe_interval)
+
+    by_target = {}
+    for row in sorted(rows, key=lambda r: (r.created_at, r.id)):
+        by_target.setdefault(row.target, []).append(row)
+
+    result = []
+    for target_rows in by_target.values():
+        for i, row in enumerate(target_rows):
+            # Sampling times drift a little, stop half a step early so the
+            # next stored row is not doubled by a rebuilt one.
+            stop = row.created_at + keyframe - half_step
+            if i + 1 < len(target_rows):
+                stop = min(stop, target_rows[i + 1].created_at - half_step)
+            offset = (start_time - row.created_at).total_seconds()
+            k = max(0, int(math.ceil(offset / sample_interval)))
+            while True:
+                created_at = row.created_at + \
+                    datetime.timedelta(seconds=k * sample_interval)
+                if created_at > end_time or (k > 0 and created_at >= stop):
+                    break
+                if k == 0:
+                    result.append(row)
+                else:
+                    sample = model(**dict((column, getattr(row, column))
+                                          for column in columns))
+                    sample.created_at = created_at
+                    result.append(sample)
+                k += 1
+    return result
+
+
+def pick_resolution(start_time, end_time, max_points):
+    """Return the finest rollup resolution giving at most max_points
+    periods over the time range, or the coarsest one when none does.
+    """
+    seconds = (end_time - start_time).total_seconds()
+    for resolution in model_rollup.RESOLUTIONS:
+        if seconds / resolution <= max_points:
+            return resolution
+    return model_rollup.RESOLUTIONS[-1]
+
+
 class Connection(object):
     """SQLAlchemy connection"""
 
@@ -70,60 +138,272 @@ class Connection(object):
         pass
 
     @staticmethod
-    def get_last_n_records(model, n, sort_key='id', sort_dir='desc'):
-        query = model_query(model)
-        query = query.order_by(desc(model.id))
-        query = query.limit(n)
-        if sort_dir == 'desc':
-            try:
-                result = query.all()
-                return result
-            except Exception as err:
-                LOG.error("Database exception: %s" % err.message)
-                return []
+    def last_n_query(model, n, target=None, session=None):
+        """Query of the last n records, newest first.
+
+        Served by the primary key, or by the (target, created_at) index when
+        a target is given.
+        """
+        query = model_query(model, session=session)
+        if target is not None:
+            query = query.filter(model.target == target)
+            query = query.order_by(desc(model.created_at), desc(model.id))
         else:
-            try:
-                result = query.from_self(). \
-                    order_by(getattr(model, sort_key)).all()
-                return result
-            except Exception as err:
-                LOG.error("Database exception: %s" % err.message)
-                return []
+            query = query.order_by(desc(model.id))
+        return query.limit(n)
+
+    @staticmethod
+    def period_query(model, start_time, end_time, sort_key='id',
+                     sort_dir='desc', target=None, session=None):
+        """Query of the records created between start_time and end_time.
+
+        The created_at range is served by the (created_at) index, or by the
+        (target, created_at) index when a target is given, which also
+        returns rows already ordered when sort_key is created_at.
+        """
+        query = model_query(model, session=session)
+        if target is not None:
+            query = query.filter(model.target == target)
+        query = query.filter(model.created_at >= start_time,
+                             model.created_at <= end_time)
+        sort_column = getattr(model, sort_key)
+        if sort_dir == 'desc':
+            sort_column = desc(sort_column)
+        return query.order_by(sort_column)
+
+    @staticmethod
+    def get_last_n_records(model, n, sort_key='id', sort_dir='desc',
+                           target=None):
+        query = Connection.last_n_query(model, n, target=target)
+        try:
+            result = query.all()
+        except Exception as err:
+            LOG.error("Database exception: %s" % err.message)
+            return []
+        if sort_dir != 'desc':
+            result.sort(key=lambda record: getattr(record, sort_key))
+        return result
 
     @staticmethod
     def get_period_records(model,
                            start_time,
                            end_time,
                            sort_key='id',
-                           sort_dir='desc'):
+                           sort_dir='desc',
+                           target=None):
 
         if hasattr(end_time, '__call__'):
             _end_time = end_time()
         else:
             _end_time = end_time
 
-        query = model_query(model)
-        query = query.filter(model.created_at >= start_time,
-                             model.created_at <= _end_time)
-        if sort_dir == 'desc':
-            try:
-                result = query.from_self(). \
-                    order_by(desc(getattr(model, sort_key))).all()
-                return result
-            except Exception as err:
-                LOG.error("Database exception: %s" % err.message)
-                return []
+        if CONF.monitor.storage_mode == 'delta':
+            return Connection.get_delta_period_records(
+                model, start_time, _end_time, sort_key=sort_key,
+                sort_dir=sort_dir, target=target)
+
+        query = Connection.period_query(model, start_time, _end_time,
+                                        sort_key=sort_key,
+                                        sort_dir=sort_dir,
+                                        target=target)
+        try:
+            return query.all()
+        except Exception as err:
+            LOG.error("Database exception: %s" % err.message)
+            return []
+
+    @staticmethod
+    def get_delta_period_records(model, start_time, end_time, sort_key='id',
+                                 sort_dir='desc', target=None):
+        """get_period_records of tables written in delta storage mode.
+
+        The window is extended back by keyframe_interval to find the row
+        every target was in at start_time, then the skipped samples are
+        rebuilt.
+        """
+        keyframe_interval = CONF.monitor.keyframe_interval
+        query = Connection.period_query(
+            model,
+            start_time - datetime.timedelta(seconds=keyframe_interval),
+            end_time, sort_key='created_at', sort_dir='asc', target=target)
+        try:
+            rows = query.all()
+        except Exception as err:
+            LOG.error("Database exception: %s" % err.message)
+            return []
+        rows = expand_delta_rows(model, rows, start_time, end_time,
+                                 CONF.monitor.sample_interval,
+                                 keyframe_interval)
+        rows.sort(key=lambda row: (getattr(row, sort_key), row.created_at),
+                  reverse=sort_dir == 'desc')
+        return rows
+
+    @staticmethod
+    def get_records_after_id(model, last_id, start_time=None):
+        """Get the stored records with an id above last_id, oldest first.
+
+        Served by the primary key, or by the (created_at) index when
+        start_time is given. Records are returned as stored, delta storage
+        mode tables are not expanded.
+        """
+        query = model_query(model).filter(model.id > last_id)
+        if start_time is not None:
+            query = query.filter(model.created_at >= start_time)
+        query = query.order_by(model.id)
+        try:
+            return query.all()
+        except Exception as err:
+            LOG.error("Database exception: %s" % err.message)
+            return []
+
+    @staticmethod
+    def expand_delta_records(model, records, start_time, end_time):
+        """Rebuild the samples of a period from delta mode records."""
+        return expand_delta_rows(model, records, start_time, end_time,
+                                 CONF.monitor.sample_interval,
+                                 CONF.monitor.keyframe_interval)
+
+    @staticmethod
+    def get_rollup_records(model, start_time, end_time, target=None,
+                           max_points=None):
+        """Get the rollups of model of a period at one resolution.
+
+        The periods are read by the (resolution, period_start) index, or
+        by the primary key when a target is given.
+
+        :param model: Model class or table name of the samples.
+        :return: the resolution and its rollups, oldest first.
+        """
+        if hasattr(end_time, '__call__'):
+            end_time = end_time()
+        rollup_model = model_rollup.ROLLUP_MODELS[
+            getattr(model, '__tablename__', model)]
+        resolution = pick_resolution(
+            start_time, end_time, max_points or CONF.rollup.max_points)
+        query = model_query(rollup_model).filter(
+            rollup_model.resolution == resolution,
+            rollup_model.period_start >= model_rollup.period_start(
+                start_time, resolution),
+            rollup_model.period_start <= end_time)
+        if target is not None:
+            query = query.filter(rollup_model.target == target)
+        query = query.order_by(rollup_model.period_start,
+                               rollup_model.target)
+        try:
+            return resolution, query.all()
+        except Exception as err:
+            LOG.error("Database exception: %s" % err.message)
+            return resolution, []
+
+    @staticmethod
+    def bulk_insert(model, rows, columns=None, batch_size=None):
+        """Insert many rows of one model through SQLAlchemy core.
+
+        Rows skip the ORM unit of work, every batch is sent as a single
+        executemany, which MySQL drivers turn into one multi-values INSERT.
+
+        :param model: model class of rock.
+        :param rows: list of dicts, or list of tuples ordered as columns.
+        :param columns: column names of tuple rows.
+        :param batch_size: max rows per INSERT statement.
+        :raises: the database error, no row is inserted then.
+        """
+        if not rows:
+            return
+        if columns is not None:
+            rows = [dict(zip(columns, row)) for row in rows]
         else:
-            try:
-                result = query.from_self(). \
-                    order_by(getattr(model, sort_key)).all()
-                return result
-            except Exception as err:
-                LOG.error("Database exception: %s" % err.message)
-                return []
+            # Rows are completed below, the caller keeps its samples.
+            rows = [dict(row) for row in rows]
+        batch_size = batch_size or CONF.monitor.insert_batch_size
+
+        # executemany needs every row to bind the same columns.
+        keys = set()
+        for row in rows:
+            keys.update(row)
+        now = timeutils.utcnow()
+        for row in rows:
+            for key in keys:
+                row.setdefault(key, None)
+            if row.get('created_at') is None:
+                row['created_at'] = now
+
+        table = model.__table__
+        with get_engine().begin() as conn:
+            for i in range(0, len(rows), batch_size):
+                conn.execute(table.insert(), rows[i:i + batch_size])
+
+    @staticmethod
+    def get_host_status(model=None, target=None):
+        """Get host_status rows, by primary key when both are given.
+
+        :param model: table name of the sample model.
+        :param target: target of the samples.
+        """
+        query = model_query(ModelHostStatus)
+        if model is not None:
+            query = query.filter(ModelHostStatus.model == model)
+        if target is not None:
+            query = query.filter(ModelHostStatus.target == target)
+        try:
+            return query.all()
+        except Exception as err:
+            LOG.error("Database exception: %s" % err.message)
+            return []
+
+    @staticmethod
+    def upsert_host_status(rows):
+        """Insert or update host_status rows by (model, target).
+
+        MySQL does it in one INSERT ... ON DUPLICATE KEY UPDATE, other
+        databases update the existing rows and insert the others in one
+        transaction.
+
+        :param rows: list of dicts with every column of host_status.
+        :raises: the database error, no row is written then.
+        """
+        if not rows:
+            return
+        table = ModelHostStatus.__table__
+        engine = get_engine()
+        with engine.begin() as conn:
+            if engine.dialect.name == 'mysql':
+                stmt = mysql_insert(table)
+                stmt = stmt.on_duplicate_key_update(
+                    **dict((column.name, stmt.inserted[column.name])
+                           for column in table.columns
+                           if not column.primary_key))
+                conn.execute(stmt, rows)
+                return
+
+            existing = set(tuple(key) for key in conn.execute(
+                table.select().with_only_columns(
+                    [table.c.model, table.c.target]).where(and_(
+                        table.c.model.in_(set(r['model'] for r in rows)),
+                        table.c.target.in_(
+                            set(r['target'] for r in rows))))))
+            updates = []
+            inserts = []
+            for row in rows:
+                if (row['model'], row['target']) in existing:
+                    update = dict(row)
+                    update['b_model'] = row['model']
+                    update['b_target'] = row['target']
+                    updates.append(update)
+                else:
+                    inserts.append(row)
+            if updates:
+                conn.execute(
+                    table.update().where(and_(
+                        table.c.model == bindparam('b_model'),
+                        table.c.target == bindparam('b_target'))),
+                    updates)
+            if inserts:
+                conn.execute(table.insert(), inserts)
 
     @staticmethod
-    def save(model_obj, session=get_session()):
+    def save(model_obj, session=None):
+        session = session or get_session()
         try:
             model_obj.save(session=session)
         except Exception as e:
@@ -134,7 +414,8 @@ class Connection(object):
             session.close()
 
     @staticmethod
-    def save_all(model_objs, session=get_session()):
+    def save_all(model_objs, session=None):
+        session = session or get_session()
         try:
             ModelBase.save_all(model_objs, session=session)
         except Exception as e:
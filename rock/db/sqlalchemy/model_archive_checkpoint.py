@@ -0,0 +1,37 @@
+# Copyright 2011 OpenStack Foundation.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from oslo_db.sqlalchemy import models
+from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import Integer
+from sqlalchemy import String
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+
+
+class ModelArchiveCheckpoint(models.ModelBase, Base):
+    """Progress of the archival run of a sample table.
+
+    cutoff is the created_at bound of the run in progress and last_id the
+    last id it moved, cutoff is NULL when the last run completed.
+    """
+    __tablename__ = 'archive_checkpoint'
+
+    table_name = Column(String(64), primary_key=True)
+    cutoff = Column(DateTime(), nullable=True)
+    last_id = Column(Integer(), nullable=False, default=0)
+    updated_at = Column(DateTime(), nullable=False)
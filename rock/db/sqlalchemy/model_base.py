@@ -26,6 +26,10 @@ from oslo_utils import timeutils
 
 
 class ModelBase(models.ModelBase):
+    # Columns compared by the delta storage mode of the monitor, a sample
+    # is only written when one of them changed.
+    delta_columns = ('result',)
+
     id = Column(Integer(), primary_key=True)
     created_at = Column(DateTime(),
                         default=lambda: timeutils.utcnow(),
@@ -0,0 +1,43 @@
+# Copyright 2011 OpenStack Foundation.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from oslo_db.sqlalchemy import models
+from sqlalchemy import Boolean
+from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import Integer
+from sqlalchemy import String
+from sqlalchemy import Text
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+
+
+class ModelHostStatus(models.ModelBase, Base):
+    """Latest sample of every target of every sample table.
+
+    model is the table name of the sample, data the JSON encoded columns of
+    the latest sample, failure_count the number of consecutive samples
+    with a false result and last_changed_at the time result last changed.
+    """
+    __tablename__ = 'host_status'
+
+    model = Column(String(64), primary_key=True)
+    target = Column(String(36), primary_key=True)
+    result = Column(Boolean(), nullable=False)
+    failure_count = Column(Integer(), nullable=False, default=0)
+    last_changed_at = Column(DateTime(), nullable=False)
+    updated_at = Column(DateTime(), nullable=False)
+    data = Column(Text(), nullable=True)
@@ -14,6 +14,7 @@
 # under the License.
 
 from sqlalchemy import Column
+from sqlalchemy import Index
 from sqlalchemy import Boolean
 from sqlalchemy import String
 from sqlalchemy.ext.declarative import declarative_base
@@ -25,6 +26,12 @@ Base = declarative_base()
 
 class ModelNovaService(ModelBase, Base):
     __tablename__ = 'nova_service'
+    __table_args__ = (
+        Index('ix_nova_service_created_at', 'created_at'),
+        Index('ix_nova_service_target_created_at', 'target', 'created_at'),
+    )
+    delta_columns = ('result', 'service_state', 'service_status',
+                     'disabled_reason')
 
     service_state = Column(Boolean(), nullable=False)
     service_status = Column(Boolean(), nullable=False)
@@ -14,6 +14,7 @@
 # under the License.
 
 from sqlalchemy import Column
+from sqlalchemy import Index
 from sqlalchemy import Float
 from sqlalchemy import Boolean
 from sqlalchemy.ext.declarative import declarative_base
@@ -22,9 +23,18 @@ from rock.db.sqlalchemy.model_base import ModelBase
 
 Base = declarative_base()
 
+# Delay stored for an ip which did not answer, not a round trip time.
+UNREACHABLE_DELAY = 9999.0
+
 
 class ModelPing(ModelBase, Base):
     __tablename__ = 'ping'
+    __table_args__ = (
+        Index('ix_ping_created_at', 'created_at'),
+        Index('ix_ping_target_created_at', 'target', 'created_at'),
+    )
+    delta_columns = ('result', 'management_ip_result', 'tunnel_ip_result',
+                     'storage_ip_result')
 
     management_ip_result = Column(Boolean(), nullable=True)
     management_ip_delay = Column(Float(), nullable=True)
@@ -0,0 +1,106 @@
+# Copyright 2011 OpenStack Foundation.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""SQLAlchemy models of the sample rollups
+"""
+
+import datetime
+
+from oslo_db.sqlalchemy import models
+from sqlalchemy import Boolean
+from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import Float
+from sqlalchemy import Index
+from sqlalchemy import Integer
+from sqlalchemy import String
+from sqlalchemy.ext.declarative import declarative_base
+
+from rock.db.sqlalchemy.model_ping import UNREACHABLE_DELAY
+
+Base = declarative_base()
+
+# Seconds of the rollup periods, finest first. Every resolution is built
+# from the one before it, the first one from the samples.
+RESOLUTIONS = (60, 3600)
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def period_start(when, resolution):
+    """Start of the period of resolution seconds which holds when."""
+    seconds = int((when - _EPOCH).total_seconds())
+    return _EPOCH + datetime.timedelta(
+        seconds=seconds - seconds % resolution)
+
+
+class RollupBase(models.ModelBase):
+    """Samples of a target aggregated over resolution seconds.
+
+    period_start is aligned on resolution. state_changes counts the result
+    changes of the period, including the one from the last sample of the
+    previous period, which is last_result of that period.
+    """
+    # Columns of the sample model aggregated into min/avg/max/count.
+    stat_columns = ()
+    # Values of stat_columns which are markers, not measures.
+    ignored_values = ()
+
+    resolution = Column(Integer(), primary_key=True, autoincrement=False)
+    target = Column(String(36), primary_key=True)
+    period_start = Column(DateTime(), primary_key=True)
+    sample_count = Column(Integer(), nullable=False, default=0)
+    failure_count = Column(Integer(), nullable=False, default=0)
+    state_changes = Column(Integer(), nullable=False, default=0)
+    last_result = Column(Boolean(), nullable=False)
+
+
+class ModelPingRollup(RollupBase, Base):
+    __tablename__ = 'ping_rollup'
+    __table_args__ = (
+        Index('ix_ping_rollup_resolution_period_start',
+              'resolution', 'period_start'),
+    )
+    stat_columns = ('management_ip_delay', 'tunnel_ip_delay',
+                    'storage_ip_delay')
+    ignored_values = (UNREACHABLE_DELAY,)
+
+    management_ip_delay_min = Column(Float(), nullable=True)
+    management_ip_delay_avg = Column(Float(), nullable=True)
+    management_ip_delay_max = Column(Float(), nullable=True)
+    management_ip_delay_count = Column(Integer(), nullable=False, default=0)
+    tunnel_ip_delay_min = Column(Float(), nullable=True)
+    tunnel_ip_delay_avg = Column(Float(), nullable=True)
+    tunnel_ip_delay_max = Column(Float(), nullable=True)
+    tunnel_ip_delay_count = Column(Integer(), nullable=False, default=0)
+    storage_ip_delay_min = Column(Float(), nullable=True)
+    storage_ip_delay_avg = Column(Float(), nullable=True)
+    storage_ip_delay_max = Column(Float(), nullable=True)
+    storage_ip_delay_count = Column(Integer(), nullable=False, default=0)
+
+
+class ModelNovaServiceRollup(RollupBase, Base):
+    __tablename__ = 'nova_service_rollup'
+    __table_args__ = (
+        Index('ix_nova_service_rollup_resolution_period_start',
+              'resolution', 'period_start'),
+    )
+
+
+# Rollup model of every sample table.
+ROLLUP_MODELS = {
+    'ping': ModelPingRollup,
+    'nova_service': ModelNovaServiceRollup,
+}
@@ -0,0 +1,135 @@
+# Copyright 2011 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Wake rock-engine up when rock-mon writes failing samples.
+
+rock-mon sends a datagram on a unix socket with the targets of every
+failing sample it wrote, rock-engine listens on that socket and evaluates
+the cases reading those samples right away instead of waiting for the
+next check_cases_interval. Sending never blocks: when rock-engine is not
+running or does not keep up, events are dropped and the periodic check
+still finds the failures.
+"""
+
+import errno
+import os
+import socket
+import stat
+import threading
+
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+
+LOG = logging.getLogger(__name__)
+
+# Targets per datagram, keeps datagrams well below the socket buffer.
+MAX_TARGETS = 100
+MAX_DATAGRAM = 65536
+
+
+class EventSender(object):
+    """Send failing targets of a model to the engine socket at path."""
+
+    def __init__(self, path):
+        self.path = path
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self.sent = 0
+        self.dropped = 0
+
+    def send(self, model_name, targets):
+        targets = sorted(targets)
+        for i in range(0, len(targets), MAX_TARGETS):
+            payload = jsonutils.dumps({'model': model_name,
+                                       'targets': targets[i:i + MAX_TARGETS]})
+            try:
+                self._sock.sendto(payload, self.path)
+                self.sent += 1
+            except socket.error as e:
+                # ENOENT/ECONNREFUSED: rock-engine is not listening,
+                # EAGAIN: its socket buffer is full.
+                self.dropped += 1
+                LOG.debug("Dropped event of %s due to %s", model_name, e)
+
+    def close(self):
+        self._sock.close()
+
+
+class EventListener(object):
+    """Receive events on the socket at path and hand them to callback.
+
+    :param callback: called as callback(model_name, targets) from the
+                     listener thread.
+    """
+
+    def __init__(self, path, callback):
+        self.path = path
+        self.callback = callback
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        try:
+            if stat.S_ISSOCK(os.stat(self.path).st_mode):
+                os.unlink(self.path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._thread = threading.Thread(target=self._run,
+                                        name='Event-Listener')
+        self._thread.daemon = True
+        self._thread.start()
+        LOG.info("Listening for events on %s.", self.path)
+
+    def stop(self):
+        if self._sock is None:
+            return
+        # Wake the blocked recv up with an empty datagram.
+        sock, self._sock = self._sock, None
+        try:
+            sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sender.sendto(b'', self.path)
+            sender.close()
+        except socket.error:
+            pass
+        self._thread.join(5)
+        sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def _run(self):
+        sock = self._sock
+        while self._sock is not None:
+            try:
+                payload = sock.recv(MAX_DATAGRAM)
+            except socket.error as e:
+                if e.errno == errno.EINTR:
+                    continue
+                LOG.error("Event socket %s failed due to %s", self.path, e)
+                return
+            if not payload:
+                continue
+            try:
+                event = jsonutils.loads(payload)
+                self.callback(event['model'], event['targets'])
+            except Exception:
+                LOG.exception("Can't handle event %r.", payload)
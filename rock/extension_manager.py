@@ -14,17 +14,37 @@
 #    under the License.
 
 import abc
+import heapq
 import imp
+import itertools
 import os
+import random
 import threading
 import time
 
 import six
+from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_utils import timeutils
+from six.moves import queue
+
 from rock import exceptions
+from rock import metrics
+from rock import sample_writer
 
+CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
 
+# What to do with the runs of a periodic task which were due while its
+# previous run was still in progress.
+SKIP = 'skip'
+CATCH_UP = 'catch_up'
+
+TASK_DURATION = metrics.histogram(
+    'rock_periodic_task_duration_seconds',
+    'Duration of the runs of periodic tasks, extensions and cases.',
+    ['task'])
+
 
 @six.add_metaclass(abc.ABCMeta)
 class ExtensionDescriptor(object):
@@ -59,7 +79,19 @@ class ExtensionDescriptor(object):
         """
 
     @staticmethod
-    def period_decorator(interval=10):
+    def period_decorator(interval=10, jitter=0.0, policy=SKIP):
+        """Declare a method as a periodic task of the extension.
+
+        The PeriodicScheduler calls the decorated function once per tick,
+        on deadlines interval seconds apart, delayed by a random value in
+        [0, jitter) to spread the load of tasks with the same interval.
+        policy tells what to do with ticks which were due while a run was
+        still in progress, SKIP drops them and CATCH_UP runs them one
+        after the other once the run finishes.
+
+        Called directly, the decorated method keeps running func in a loop
+        like before.
+        """
         def wrapper(func):
             def _wrapper(*args, **kwargs):
                 result = None
@@ -77,11 +109,195 @@ class ExtensionDescriptor(object):
                         time.sleep(interval - used_time)
                 return result
 
+            _wrapper.periodic_spec = PeriodicSpec(func, interval, jitter,
+                                                  policy)
             return _wrapper
 
         return wrapper
 
 
+class PeriodicSpec(object):
+    """Schedule of a method decorated with period_decorator."""
+
+    def __init__(self, func, interval, jitter=0.0, policy=SKIP):
+        if policy not in (SKIP, CATCH_UP):
+            raise ValueError("Unknown periodic policy %s" % policy)
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.policy = policy
+
+
+class PeriodicEntry(object):
+    """A periodic task registered in a PeriodicScheduler."""
+
+    def __init__(self, name, func, interval, jitter=0.0, policy=SKIP):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.policy = policy
+        self.deadline = None
+        self.running = False
+        self.missed = 0
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.overruns = 0
+        self.last_duration = None
+
+
+class PeriodicScheduler(object):
+    """Run periodic tasks on absolute deadlines with a pool of workers.
+
+    A task added at time T is due at T + k * interval for every k, so the
+    time a run takes never shifts the following deadlines. A single timer
+    thread pops due tasks from a heap and hands them to the worker pool.
+    A task never runs twice at the same time, and an exception only ends
+    the current run, the task runs again on its next tick.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._work = queue.Queue()
+        self._workers = []
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._stopped = False
+        self._thread = None
+        self.entries = {}
+
+    def add(self, name, func, interval, jitter=0.0, policy=SKIP,
+            start=None):
+        """Run func every interval seconds, the first time at start."""
+        entry = PeriodicEntry(name, func, interval, jitter, policy)
+        with self._cond:
+            if name in self.entries:
+                raise ValueError("Periodic task %s already exists" % name)
+            self.entries[name] = entry
+            self._push(entry, timeutils.now() if start is None else start)
+            self._cond.notify()
+        return entry
+
+    def add_periodic_task(self, name, task):
+        """Add a bound method decorated with period_decorator."""
+        spec = task.periodic_spec
+        return self.add(name,
+                        six.create_bound_method(spec.func,
+                                                six.get_method_self(task)),
+                        spec.interval, jitter=spec.jitter,
+                        policy=spec.policy)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._worker,
+                                      name='Periodic-Worker-%d' % i)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+        self._thread = threading.Thread(target=self._run,
+                                        name='Periodic-Scheduler')
+        self._thread.start()
+
+    def stop(self, wait=True):
+        """Stop scheduling, and wait for the runs in progress if wait."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        for worker in self._workers:
+            self._work.put(None)
+        if wait:
+            for worker in self._workers:
+                worker.join()
+        self._workers = []
+
+    def wait(self):
+        """Block until the scheduler is stopped."""
+        if self._thread is not None:
+            self._thread.join()
+
+    def _push(self, entry, deadline):
+        entry.deadline = deadline
+        fire_at = deadline
+        if entry.jitter:
+            fire_at += random.uniform(0, entry.jitter)
+        heapq.heappush(self._heap, (fire_at, next(self._seq), entry))
+
+    def _run(self):
+        with self._cond:
+            while True:
+                now = timeutils.now()
+                while not self._stopped and \
+                        (not self._heap or self._heap[0][0] > now):
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._cond.wait(timeout)
+                    now = timeutils.now()
+                if self._stopped:
+                    return
+                entry = heapq.heappop(self._heap)[2]
+                self._fire(entry, now)
+
+    def _fire(self, entry, now):
+        if not entry.running:
+            entry.running = True
+            self._work.put(entry)
+        elif entry.policy == CATCH_UP:
+            entry.missed += 1
+        else:
+            entry.skipped += 1
+            LOG.warning("Periodic task %s is still running, skipped the run "
+                        "due %.3f seconds ago." % (entry.name,
+                                                   now - entry.deadline))
+
+        deadline = entry.deadline + entry.interval
+        if entry.policy == SKIP and deadline <= now:
+            # Keep the deadlines on the original grid.
+            behind = int((now - deadline) // entry.interval) + 1
+            entry.skipped += behind
+            deadline += behind * entry.interval
+        self._push(entry, deadline)
+
+    def _worker(self):
+        while True:
+            entry = self._work.get()
+            if entry is None:
+                return
+            self._execute(entry)
+
+    def _execute(self, entry):
+        while True:
+            start_time = timeutils.now()
+            try:
+                entry.func()
+            except Exception:
+                entry.failures += 1
+                LOG.exception("Periodic task %s failed, it will run again on "
+                              "its next tick." % entry.name)
+            used_time = timeutils.now() - start_time
+            TASK_DURATION.observe(used_time, task=entry.name)
+            if used_time > entry.interval:
+                LOG.warning("Periodic task %s run outlasted interval by %.3f "
+                            "seconds." % (entry.name,
+                                          used_time - entry.interval))
+            with self._cond:
+                entry.runs += 1
+                entry.last_duration = used_time
+                if used_time > entry.interval:
+                    entry.overruns += 1
+                if entry.missed and not self._stopped:
+                    entry.missed -= 1
+                    LOG.info("Periodic task %s is catching up, %d runs "
+                             "left." % (entry.name, entry.missed))
+                    continue
+                entry.running = False
+                return
+
+
 class ExtensionManager(object):
     """Load extensions from the configured extension path.
 
@@ -92,6 +308,7 @@ class ExtensionManager(object):
         self.path = path
         self.extensions = {}
         self.periodic_tasks = {}
+        self.scheduler = None
         self._load_all_extensions()
 
     def _load_all_extensions(self):
@@ -142,32 +359,31 @@ class ExtensionManager(object):
 
     @ExtensionDescriptor.period_decorator(60)
     def report_status(self):
-        current_thread_list = threading.enumerate()
-        thread_name = []
-        for thread in current_thread_list:
-            if thread.name in self.extensions:
-                thread_name.append(thread.name)
-        LOG.info("Current plugin threads: " + " ".join(thread_name))
-
-        # If some extensions threads exit unexpectedly, create a new thread
-        # for it
-        none_thread_extensions = [i for i in self.extensions
-                                  if i not in thread_name]
-        if len(none_thread_extensions) > 0:
-            LOG.info("Recreating thread(s) for extension(s): " + " ".join(
-                none_thread_extensions))
-            for ext in none_thread_extensions:
-                task = getattr(self.extensions[ext], 'periodic_task')
-                task_name = ext
-                t = threading.Thread(target=task, name=task_name)
-                t.start()
+        status = []
+        for name, entry in sorted(self.scheduler.entries.items()):
+            status.append("%s(runs: %d, failures: %d, skipped: %d, "
+                          "overruns: %d%s)" % (
+                              name, entry.runs, entry.failures,
+                              entry.skipped, entry.overruns,
+                              ', running' if entry.running else ''))
+        LOG.info("Current plugin tasks: " + " ".join(status))
 
     def start_collect_data(self):
-        for extension in self.extensions:
-            task = getattr(self.extensions[extension], 'periodic_task')
-            task_name = extension
-            t = threading.Thread(target=task, name=task_name)
-            t.start()
-        t = threading.Thread(
-            target=self.report_status, name='Plugins-Status-Report')
-        t.start()
+        sample_writer.get_writer().start()
+        self.scheduler = PeriodicScheduler(
+            max_workers=CONF.monitor.scheduler_workers)
+        for alias, extension in self.extensions.items():
+            task = getattr(extension, 'periodic_task')
+            if getattr(task, 'periodic_spec', None) is None:
+                # Not decorated, it schedules itself.
+                LOG.warning("Periodic task of extension %s is not decorated "
+                            "with period_decorator, running it in its own "
+                            "thread." % alias)
+                t = threading.Thread(target=task, name=alias)
+                t.start()
+                continue
+            self.periodic_tasks[alias] = \
+                self.scheduler.add_periodic_task(alias, task)
+        self.scheduler.add_periodic_task('Plugins-Status-Report',
+                                         self.report_status)
+        self.scheduler.start()
@@ -14,17 +14,20 @@
 #    under the License.
 
 import commands
+import socket
 import threading
 
 from oslo_config import cfg
+from oslo_log import log as logging
 
-from rock.db import api as db_api
+from rock import icmp
+from rock import sample_writer
 from rock.db.sqlalchemy.model_ping import ModelPing
+from rock.db.sqlalchemy.model_ping import UNREACHABLE_DELAY
 from rock.extension_manager import ExtensionDescriptor
 
 CONF = cfg.CONF
-DATA_LIST = []
-LOCK = threading.RLock()
+LOG = logging.getLogger(__name__)
 
 
 class PingThread(threading.Thread):
@@ -34,7 +37,6 @@ class PingThread(threading.Thread):
         self.host_ip_map = host_ip_map
 
     def run(self):
-        global DATA_LIST
         data = dict()
         data['target'] = self.host_name
         data['result'] = False
@@ -42,31 +44,42 @@ class PingThread(threading.Thread):
             # Send total 3 packets to the ip address and the interval between
             # each packet is 0.3s. And wait for each response of the packet
             # at most 1s.
-            if ip_name == 'm':
-                db_filed_1 = 'management_ip_result'
-                db_filed_2 = 'management_ip_delay'
-            elif ip_name == 't':
-                db_filed_1 = 'tunnel_ip_result'
-                db_filed_2 = 'tunnel_ip_delay'
-            else:
-                db_filed_1 = 'storage_ip_result'
-                db_filed_2 = 'storage_ip_delay'
             cmd = "ping -c 3 -W 1 -i 0.3 %s" % ip
             status, output = commands.getstatusoutput(cmd)
             if status == 0:
-                data[db_filed_2] = output.split('\n')[-1].split('/')[-3]
-                if float(data[db_filed_2]) < 1.0:
-                    data[db_filed_1] = True
-                    data['result'] = True
-                else:
-                    data[db_filed_1] = False
+                delay = output.split('\n')[-1].split('/')[-3]
             else:
-                data[db_filed_2] = '9999'
-                data[db_filed_1] = False
-        ping_obj = ModelPing(**data)
-        LOCK.acquire()
-        DATA_LIST.append(ping_obj)
-        LOCK.release()
+                delay = None
+            fill_network_result(data, ip_name, delay)
+        sample_writer.put(ModelPing, data)
+
+
+def fill_network_result(data, ip_name, delay):
+    """Fill the result and delay columns of one network into data.
+
+    :param ip_name: 'm', 't' or 's'.
+    :param delay: average round trip time in ms, None if the ip is
+                  unreachable.
+    """
+    if ip_name == 'm':
+        db_filed_1 = 'management_ip_result'
+        db_filed_2 = 'management_ip_delay'
+    elif ip_name == 't':
+        db_filed_1 = 'tunnel_ip_result'
+        db_filed_2 = 'tunnel_ip_delay'
+    else:
+        db_filed_1 = 'storage_ip_result'
+        db_filed_2 = 'storage_ip_delay'
+    if delay is not None:
+        data[db_filed_2] = delay
+        if float(data[db_filed_2]) < 1.0:
+            data[db_filed_1] = True
+            data['result'] = True
+        else:
+            data[db_filed_1] = False
+    else:
+        data[db_filed_2] = UNREACHABLE_DELAY
+        data[db_filed_1] = False
 
 
 class Hostmgmtping(ExtensionDescriptor):
@@ -79,6 +92,8 @@ class Hostmgmtping(ExtensionDescriptor):
         self.tunnel_network_ip = CONF.host_mgmt_ping.tunnel_network_ip
         self.storage_network_ip = CONF.host_mgmt_ping.storage_network_ip
         self.host_ip_map = self.map_host_and_ips()
+        self.ping_mode = CONF.host_mgmt_ping.ping_mode
+        self.prober = icmp.IcmpProber(count=3, interval=0.3, timeout=1.0)
 
     def map_host_and_ips(self):
         i = 0
@@ -106,16 +121,22 @@ class Hostmgmtping(ExtensionDescriptor):
     def get_description(cls):
         return "Delay of ping to management IP of host."
 
-    @staticmethod
-    def save_data():
-        global DATA_LIST
-        LOCK.acquire()
-        db_api.save_all(DATA_LIST)
-        del DATA_LIST[:]
-        LOCK.release()
-
-    @ExtensionDescriptor.period_decorator(10)
-    def periodic_task(self):
+    def ping_by_icmp(self):
+        """Probe every network of every host at once from one socket."""
+        addresses = [ip for host_ip_map in self.host_ip_map.values()
+                     for ip in host_ip_map.values()]
+        delays = self.prober.probe(addresses)
+        samples = []
+        for host_name, host_ip_map in self.host_ip_map.items():
+            data = dict()
+            data['target'] = host_name
+            data['result'] = False
+            for ip_name, ip in host_ip_map.items():
+                fill_network_result(data, ip_name, delays.get(ip))
+            samples.append(data)
+        sample_writer.put_all(ModelPing, samples)
+
+    def ping_by_subprocess(self):
         current_thread_list = threading.enumerate()
         current_thread_name_list = list()
         current_thread_name_list.append(thread.name
@@ -125,6 +146,16 @@ class Hostmgmtping(ExtensionDescriptor):
                 continue
             pt = PingThread(host_name, host_ip_map)
             pt.start()
-        t = threading.Thread(target=self.save_data,
-                             name='Plugin-Ping-Data-Save')
-        t.start()
+
+    @ExtensionDescriptor.period_decorator(10)
+    def periodic_task(self):
+        if self.ping_mode == 'icmp':
+            try:
+                self.ping_by_icmp()
+            except socket.error as err:
+                LOG.warning("ICMP probing is unavailable due to %s, falling "
+                            "back to subprocess ping." % err)
+                self.prober.close()
+                self.ping_mode = 'subprocess'
+        if self.ping_mode == 'subprocess':
+            self.ping_by_subprocess()
@@ -16,10 +16,9 @@
 from oslo_config import cfg
 from oslo_log import log as logging
 
-from keystoneauth1 import identity, session
-from novaclient import client
+from rock import clients
 from rock.extension_manager import ExtensionDescriptor
-from rock.db import api as db_api
+from rock import sample_writer
 from rock.db.sqlalchemy.model_nova_service import ModelNovaService
 
 CONF = cfg.CONF
@@ -62,37 +61,21 @@ class Novaservicestatus(ExtensionDescriptor):
                     'disabled_reason': service.disabled_reason
                 }
 
-        objs = []
+        samples = []
         for k, v in data.items():
             if v['disabled_reason'] is not None:
                 disabled_reason = str(v['disabled_reason'])
             else:
                 disabled_reason = v['disabled_reason']
-            objs.append(
-                ModelNovaService(
-                    target=str(k),
-                    result=True if v['state'] == u'up' else False,
-                    service_state=True if v['state'] == u'up' else False,
-                    service_status=True
-                    if v['status'] == u'enabled' else False,
-                    disabled_reason=disabled_reason))
-        db_api.save_all(objs)
+            samples.append(dict(
+                target=str(k),
+                result=True if v['state'] == u'up' else False,
+                service_state=True if v['state'] == u'up' else False,
+                service_status=True
+                if v['status'] == u'enabled' else False,
+                disabled_reason=disabled_reason))
+        sample_writer.put_all(ModelNovaService, samples)
 
     def _get_client(self):
-        """Get a nova client"""
-
-        auth = identity.Password(
-            auth_url=CONF.openstack_credential.auth_url,
-            username=CONF.openstack_credential.username,
-            password=CONF.openstack_credential.password,
-            user_domain_id=CONF.openstack_credential.user_domain_id,
-            project_domain_name=CONF.openstack_credential.project_domain_id,
-            project_name=CONF.openstack_credential.project_name)
-
-        sess = session.Session(auth=auth, verify=False)
-        nova_client_version = CONF.openstack_credential.nova_client_version
-        n_client = client.Client(
-            nova_client_version,
-            session=sess,
-            region_name=CONF.openstack_credential.region_name)
-        return n_client
+        """Get the shared nova client"""
+        return clients.get_nova_client()
@@ -0,0 +1,239 @@
+# Copyright 2011 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""ICMP echo prober that multiplexes many hosts over one socket."""
+
+import collections
+import errno
+import os
+import select
+import socket
+import struct
+import time
+
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+_HEADER = struct.Struct('!BBHHH')
+_PAYLOAD = b'rock-icmp-prober'
+# A burst of requests to hundreds of hosts fills the default send buffer.
+SNDBUF_SIZE = 1024 * 1024
+# sendto errors of a full send buffer or device queue, the request is sent
+# again later instead of counting its host as unreachable.
+_RETRY_ERRNOS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS)
+# Seconds to wait before sending again after such an error, select does not
+# report a full device queue.
+RETRY_DELAY = 0.01
+
+
+def checksum(data):
+    """Internet checksum (RFC 1071) of a byte string."""
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def build_echo_request(ident, seq, payload=_PAYLOAD):
+    header = _HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    csum = checksum(header + payload)
+    return _HEADER.pack(ICMP_ECHO_REQUEST, 0, csum, ident, seq) + payload
+
+
+def parse_echo_reply(packet, has_ip_header):
+    """Return (ident, seq) of an echo reply, or None for other packets."""
+    offset = 0
+    if has_ip_header:
+        if len(packet) < 1:
+            return None
+        offset = (bytearray(packet[:1])[0] & 0x0f) * 4
+    if len(packet) < offset + _HEADER.size:
+        return None
+    icmp_type, code, _csum, ident, seq = _HEADER.unpack_from(packet, offset)
+    if icmp_type != ICMP_ECHO_REPLY or code != 0:
+        return None
+    return ident, seq
+
+
+class IcmpProber(object):
+    """Probe many addresses with ICMP echo on a single event loop.
+
+    Every round sends one echo request to each address; replies are matched
+    back to their request by identifier and sequence number, so any number
+    of requests can be in flight at once. An unprivileged datagram ICMP
+    socket is preferred and a raw socket is used when the kernel does not
+    allow it (see net.ipv4.ping_group_range).
+    """
+
+    def __init__(self, count=3, interval=0.3, timeout=1.0):
+        self.count = count
+        self.interval = interval
+        self.timeout = timeout
+        self._sock = None
+        self._raw = False
+        self._ident = os.getpid() & 0xffff
+        self._seq = 0
+
+    def open(self):
+        """Open the ICMP socket, raise socket.error if it is not allowed."""
+        if self._sock is not None:
+            return
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
+                                 socket.IPPROTO_ICMP)
+            self._raw = False
+        except socket.error:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_RAW,
+                                 socket.IPPROTO_ICMP)
+            self._raw = True
+        sock.setblocking(False)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SNDBUF_SIZE)
+        except socket.error as err:
+            LOG.debug("Can't raise the send buffer of the ICMP socket: %s",
+                      err)
+        self._sock = sock
+        LOG.info("Opened %s ICMP socket for probing.",
+                 'raw' if self._raw else 'datagram')
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _send(self, address, in_flight):
+        """Send one echo request, return False if it must be sent again."""
+        seq = (self._seq + 1) & 0xffff
+        packet = build_echo_request(self._ident, seq)
+        try:
+            self._sock.sendto(packet, (address, 0))
+        except socket.error as err:
+            if err.args[0] in _RETRY_ERRNOS:
+                return False
+            LOG.debug("Failed to send echo request to %s: %s", address, err)
+            return True
+        self._seq = seq
+        in_flight[seq] = (address, time.time())
+        return True
+
+    def _send_pending(self, pending, in_flight):
+        """Send queued requests in order until the send buffer is full.
+
+        :return: False if some requests are left in pending.
+        """
+        while pending:
+            if not self._send(pending[0][0], in_flight):
+                return False
+            pending.popleft()
+        return True
+
+    def _receive(self, in_flight, rtts):
+        while True:
+            try:
+                packet, peer = self._sock.recvfrom(2048)
+            except socket.error as err:
+                if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+            reply = parse_echo_reply(packet, self._raw)
+            if reply is None:
+                continue
+            ident, seq = reply
+            # Datagram ICMP sockets rewrite the identifier, and the kernel
+            # already filters replies per socket, so only raw sockets need
+            # to check it.
+            if self._raw and ident != self._ident:
+                continue
+            request = in_flight.get(seq)
+            if request is None or request[0] != peer[0]:
+                continue
+            del in_flight[seq]
+            rtts[request[0]].append((time.time() - request[1]) * 1000.0)
+
+    def probe(self, addresses):
+        """Ping every address and collect the round trip times.
+
+        :param addresses: iterable of IPv4 address strings.
+        :return: dict mapping each address to the average round trip time
+                 in milliseconds, or None when no reply was received.
+        """
+        self.open()
+        addresses = list(set(addresses))
+        rtts = dict((address, []) for address in addresses)
+        in_flight = {}
+        # Requests not sent yet, with the time they were queued at.
+        pending = collections.deque()
+        unsent = 0
+        writable = False
+        retry_at = 0
+        start = time.time()
+        rounds_sent = 0
+        while True:
+            now = time.time()
+            if rounds_sent < self.count and \
+                    now >= start + rounds_sent * self.interval:
+                pending.extend((address, now) for address in addresses)
+                rounds_sent += 1
+                writable = True
+            if pending and writable:
+                if not self._send_pending(pending, in_flight):
+                    retry_at = time.time() + RETRY_DELAY
+                now = time.time()
+
+            for seq, (address, sent_at) in list(in_flight.items()):
+                if now - sent_at >= self.timeout:
+                    del in_flight[seq]
+            # A request which could not be sent within the timeout is lost
+            # like one without a reply.
+            while pending and now - pending[0][1] >= self.timeout:
+                pending.popleft()
+                unsent += 1
+
+            if rounds_sent >= self.count and not in_flight and not pending:
+                break
+
+            deadlines = [sent_at + self.timeout
+                         for _address, sent_at in in_flight.values()]
+            if rounds_sent < self.count:
+                deadlines.append(start + rounds_sent * self.interval)
+            wlist = []
+            if pending:
+                deadlines.append(pending[0][1] + self.timeout)
+                if now < retry_at:
+                    deadlines.append(retry_at)
+                else:
+                    wlist = [self._sock]
+            wait = max(0, min(deadlines) - now) if deadlines else 0
+            readable, writable, _x = select.select([self._sock], wlist, [],
+                                                   wait)
+            if readable:
+                self._receive(in_flight, rtts)
+
+        if unsent:
+            LOG.warning("Could not send %d echo requests within %ss, the "
+                        "send buffer of the ICMP socket stayed full.",
+                        unsent, self.timeout)
+        result = {}
+        for address, samples in rtts.items():
+            if samples:
+                result[address] = round(sum(samples) / len(samples), 3)
+            else:
+                result[address] = None
+        return result
@@ -0,0 +1,246 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Expose metrics of rock-mon and rock-engine to Prometheus.
+
+Modules declare their histograms and gauges once with histogram() and
+gauge(), the metrics of the process are served in the Prometheus text
+format on http://<bind_host>:<port>/metrics once serve() is called, the
+port being [metrics] rock_mon_port or rock_engine_port. Observing a value
+only takes a lock and a few additions, so hot paths are always measured,
+served or not.
+"""
+
+import bisect
+import collections
+import contextlib
+import threading
+import time
+from wsgiref import simple_server
+
+from oslo_config import cfg
+from oslo_log import log as logging
+import six
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+INF = float('inf')
+# Seconds, from a ping to an evacuation.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                    10.0, 30.0, 60.0, 120.0, 300.0, INF)
+# Rows, from one target to a 2,000 hosts region.
+SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, INF)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_METRICS = collections.OrderedDict()
+_LOCK = threading.Lock()
+
+
+def _escape(value):
+    return six.text_type(value).replace('\\', r'\\').replace('\n', r'\n') \
+        .replace('"', r'\"')
+
+
+def _format_value(value):
+    if value == INF:
+        return '+Inf'
+    if value == -INF:
+        return '-Inf'
+    return repr(float(value))
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value))
+                             for name, value in zip(names, values))
+
+
+class Histogram(object):
+    """Count observed values in buckets, per set of label values."""
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DURATION_BUCKETS):
+        buckets = sorted(buckets)
+        if buckets[-1] != INF:
+            buckets.append(INF)
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [[0] * len(self.buckets), 0.0,
+                                              0]
+            values[0][index] += 1
+            values[1] += value
+            values[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in the with block."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - start, **labels)
+
+    def count(self, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            values = self._values.get(key)
+            return values[2] if values else 0
+
+    def render(self):
+        with self._lock:
+            values = sorted((key, list(counts), total, count)
+                            for key, (counts, total, count)
+                            in self._values.items())
+        lines = ['# HELP %s %s' % (self.name, self.documentation),
+                 '# TYPE %s histogram' % self.name]
+        bucket_names = self.labelnames + ('le',)
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append('%s_bucket%s %d' % (
+                    self.name,
+                    _format_labels(bucket_names,
+                                   key + (_format_value(bound),)),
+                    cumulative))
+            labels = _format_labels(self.labelnames, key)
+            lines.append('%s_sum%s %s' % (self.name, labels,
+                                          _format_value(total)))
+            lines.append('%s_count%s %d' % (self.name, labels, count))
+        return lines
+
+
+class Gauge(object):
+    """Value read from func every time the metrics are served."""
+
+    def __init__(self, name, documentation, func):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation),
+                 '# TYPE %s gauge' % self.name]
+        try:
+            lines.append('%s %s' % (self.name, _format_value(self.func())))
+        except Exception as e:
+            LOG.debug("Can't read gauge %s due to %s", self.name, e)
+        return lines
+
+
+def _register(cls, name, *args):
+    with _LOCK:
+        metric = _METRICS.get(name)
+        if metric is None:
+            metric = _METRICS[name] = cls(name, *args)
+        elif not isinstance(metric, cls):
+            raise ValueError("Metric %s is already registered as a %s" %
+                             (name, type(metric).__name__))
+        return metric
+
+
+def histogram(name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+    """Return the histogram name, registering it on first use."""
+    return _register(Histogram, name, documentation, labelnames, buckets)
+
+
+def gauge(name, documentation, func):
+    """Return the gauge name, registering it on first use."""
+    return _register(Gauge, name, documentation, func)
+
+
+def render():
+    """All the metrics of the process in the Prometheus text format."""
+    with _LOCK:
+        metrics = list(_METRICS.values())
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+gauge('rock_threads', 'Live threads of the process.', threading.active_count)
+
+
+def _application(environ, start_response):
+    if environ.get('PATH_INFO') != '/metrics':
+        start_response('404 Not Found', [('Content-Type', 'text/plain')])
+        return [b'Not Found\n']
+    body = render().encode('utf-8')
+    start_response('200 OK', [('Content-Type', CONTENT_TYPE),
+                              ('Content-Length', str(len(body)))])
+    return [body]
+
+
+class _QuietHandler(simple_server.WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        LOG.debug("Metrics request from %s: %s", self.client_address[0],
+                  format % args)
+
+
+class MetricsServer(object):
+    """Serve /metrics on host:port from a daemon thread."""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self._server = simple_server.make_server(
+            host, port, _application, handler_class=_QuietHandler)
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='Metrics-Server')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def serve(service_name):
+    """Serve the metrics of service_name on its configured port.
+
+    :return: the MetricsServer, None if its port is 0 or can't be bound.
+    """
+    port = {'rock-mon': CONF.metrics.rock_mon_port,
+            'rock-engine': CONF.metrics.rock_engine_port}[service_name]
+    if not port:
+        return None
+    try:
+        server = MetricsServer(CONF.metrics.bind_host, port)
+    except Exception as e:
+        # Metrics are not worth stopping the service for.
+        LOG.error("Can't serve metrics on %s:%s due to %s",
+                  CONF.metrics.bind_host, port, e)
+        return None
+    server.start()
+    LOG.info("Serving metrics on http://%s:%d/metrics", server.host,
+             server.port)
+    return server
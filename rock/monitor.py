@@ -15,6 +15,7 @@
 
 import os
 
+from rock import metrics
 from rock import utils
 from oslo_utils import importutils
 
@@ -26,6 +27,7 @@ def main(manager='rock.extension_manager.ExtensionManager'):
     utils.prepare_log(service_name='rock-mon')
     log = logging.getLogger(__name__)
     log.info('Start rock monitor.')
+    metrics.serve('rock-mon')
     mgr_class = importutils.import_class(manager)
     file_path = os.path.abspath(__file__)
     file_dir = os.path.dirname(file_path)
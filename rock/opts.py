@@ -32,7 +32,19 @@ default_opts = [
                help='rock engine log file name'),
     cfg.IntOpt('check_cases_interval',
                default=300,
-               help="Time interval to check all cases.")
+               help="Time interval to check all cases."),
+    cfg.StrOpt('event_socket',
+               default='/var/run/rock/rock-engine.sock',
+               help="Unix socket rock-mon uses to wake rock-engine up when "
+                    "it writes failing samples, so cases are checked right "
+                    "away. Empty disables it"),
+    cfg.StrOpt('sample_ring_dir',
+               default='/var/run/rock/samples',
+               help="Directory of the memory-mapped files rock-mon "
+                    "publishes recent samples to, rock-engine reads the "
+                    "windows of cases from them when both run on the same "
+                    "node and falls back to the database otherwise. Empty "
+                    "disables it")
 ]
 
 host_mgmt_ping_opts = [
@@ -52,7 +64,14 @@ host_mgmt_ping_opts = [
     cfg.ListOpt(
         'storage_network_ip',
         default=[],
-        help="Storage network ip of compute hosts")
+        help="Storage network ip of compute hosts"),
+    cfg.StrOpt(
+        'ping_mode',
+        default='icmp',
+        choices=['icmp', 'subprocess'],
+        help="How to ping compute hosts. 'icmp' probes all hosts from one "
+             "ICMP socket and falls back to 'subprocess' if the socket can "
+             "not be opened, 'subprocess' runs the ping command per host")
 ]
 
 openstack_credential_opts = [
@@ -76,7 +95,29 @@ host_evacuate_opts = [
         default=6,
         help="how many times to check the evacuated server's status"),
     cfg.IntOpt(
-        'check_interval', default=15, help='check interval')
+        'check_interval', default=15, help='check interval'),
+    cfg.IntOpt(
+        'max_concurrent_evacuations',
+        default=1,
+        min=1,
+        help='Max number of servers of a host evacuated at the same time. '
+             '1 evacuates servers one by one, a greater value keeps that '
+             'many evacuations in progress and starts the next one as soon '
+             'as one of them finishes')
+]
+
+power_manager_opts = [
+    cfg.StrOpt(
+        'target_file',
+        default='/etc/rock/target.json',
+        help='JSON file with the IPMI address, username and password of '
+             'every compute host'),
+    cfg.IntOpt(
+        'power_off_wait',
+        default=30,
+        min=0,
+        help='Seconds to wait after powering a host off before checking '
+             'its power status')
 ]
 
 activemq_opts = [
@@ -103,6 +144,241 @@ activemq_opts = [
              'where the message reported to')
 ]
 
+monitor_opts = [
+    cfg.IntOpt(
+        'sample_queue_size',
+        default=10000,
+        help='Max number of samples waiting to be written to the database. '
+             'Extensions block when the queue is full'),
+    cfg.IntOpt(
+        'flush_size',
+        default=500,
+        help='Write pending samples once this many have been queued'),
+    cfg.FloatOpt(
+        'flush_interval',
+        default=2.0,
+        help='Write pending samples once the oldest one has waited this '
+             'many seconds'),
+    cfg.FloatOpt(
+        'put_timeout',
+        default=5.0,
+        help='Seconds an extension waits for room in a full sample queue '
+             'before the sample is dropped'),
+    cfg.IntOpt(
+        'insert_batch_size',
+        default=1000,
+        help='Max number of rows sent in one INSERT statement'),
+    cfg.StrOpt(
+        'storage_mode',
+        default='full',
+        choices=['full', 'delta'],
+        help="'full' writes every sample. 'delta' only writes a sample when "
+             "the result or status columns of its target changed, plus a "
+             "keyframe every keyframe_interval seconds, and rebuilds the "
+             "skipped samples when records are read"),
+    cfg.IntOpt(
+        'keyframe_interval',
+        default=300,
+        min=1,
+        help='In delta storage mode, seconds after which an unchanged '
+             'sample is written anyway'),
+    cfg.FloatOpt(
+        'sample_interval',
+        default=10.0,
+        help='Seconds between two samples of a target, used to rebuild '
+             'skipped samples in delta storage mode'),
+    cfg.BoolOpt(
+        'track_host_status',
+        default=True,
+        help='Keep the latest sample, the number of consecutive failures '
+             'and the time of the last change of every target in the '
+             'host_status table'),
+    cfg.IntOpt(
+        'event_failures',
+        default=8,
+        min=1,
+        help='Consecutive failing samples of a target reported to '
+             'rock-engine through event_socket. Set it to the largest '
+             'boundary of the judges of the cases, a target failing for '
+             'longer is only checked every check_cases_interval'),
+    cfg.IntOpt(
+        'scheduler_workers',
+        default=4,
+        min=1,
+        help='Number of threads running the periodic tasks of extensions'),
+    cfg.IntOpt(
+        'sample_ring_size',
+        default=65536,
+        min=1,
+        help='Samples kept per table in the files of sample_ring_dir. '
+             'Should be above hosts * window / sample interval of the '
+             'largest %get_by_time window, e.g. 60000 for 2000 hosts '
+             'sampled every 10 seconds and a 300 seconds window')
+]
+
+rule_engine_opts = [
+    cfg.StrOpt(
+        'evaluation_mode',
+        default='tree',
+        choices=['tree', 'columnar', 'incremental'],
+        help="How cases are evaluated. 'tree' evaluates every target with "
+             "the compiled case, 'columnar' evaluates judges and l1_rule for "
+             "all targets at once with NumPy, 'incremental' keeps the state "
+             "of every target between cycles and only applies the new "
+             "samples. 'columnar' and 'incremental' fall back to 'tree' for "
+             "cases they do not support"),
+    cfg.IntOpt(
+        'flow_workers',
+        default=4,
+        min=1,
+        help='Max number of action flows running at the same time'),
+    cfg.IntOpt(
+        'flow_backlog',
+        default=64,
+        min=0,
+        help='Max number of action flows waiting for a worker, further '
+             'flows are skipped until the next cycle. 0 means unlimited'),
+    cfg.FloatOpt(
+        'event_delay',
+        default=0.5,
+        min=0,
+        help='Seconds rock-engine gathers events from rock-mon before it '
+             'checks the cases they affect'),
+    cfg.BoolOpt(
+        'sample_cache',
+        default=True,
+        help='Keep the samples of the windows read by cases in memory and '
+             'only read the new ones from the database every cycle'),
+    cfg.IntOpt(
+        'case_workers',
+        default=4,
+        min=1,
+        help='Max number of cases evaluated at the same time. Every case '
+             'runs on its own interval, check_cases_interval unless the '
+             'case sets one'),
+    cfg.FloatOpt(
+        'sample_ring_max_age',
+        default=30.0,
+        min=0,
+        help='Seconds after which the files of sample_ring_dir are '
+             'considered stale, because rock-mon stopped updating them, '
+             'and windows are read from the database')
+]
+
+partition_opts = [
+    cfg.IntOpt(
+        'days_ahead',
+        default=7,
+        min=1,
+        help='Days of partitions rock-partition creates in advance'),
+    cfg.IntOpt(
+        'retention_days',
+        default=1,
+        min=0,
+        help='Days of samples kept in the rock database besides the '
+             'current day, older partitions are expired'),
+    cfg.BoolOpt(
+        'archive',
+        default=True,
+        help='Move expired partitions to the history database instead of '
+             'dropping them'),
+    cfg.StrOpt(
+        'history_database',
+        default='',
+        help="Name of the history database, '<database>_history' when "
+             "empty"),
+    cfg.IntOpt(
+        'history_retention_days',
+        default=30,
+        min=0,
+        deprecated_opts=[cfg.DeprecatedOpt('history_retention_days',
+                                           group='archive')],
+        help='Days of samples kept in the history database, 0 keeps them '
+             'forever. rock-partition drops the expired partitions of '
+             'history tables partitioned by day, rock-archive --purge '
+             'deletes the expired rows of the others')
+]
+
+archive_opts = [
+    cfg.IntOpt(
+        'archive_after',
+        default=86400,
+        min=0,
+        help='Seconds after which rock-archive moves samples to the '
+             'history database'),
+    cfg.IntOpt(
+        'chunk_size',
+        default=1000,
+        min=1,
+        help='Rows moved or deleted per transaction'),
+    cfg.FloatOpt(
+        'chunk_interval',
+        default=0.5,
+        min=0,
+        help='Seconds to sleep between two chunks, to leave room for the '
+             'writes of rock-mon'),
+    cfg.IntOpt(
+        'run_interval',
+        default=0,
+        min=0,
+        help='Seconds between two runs of rock-archive, 0 runs once and '
+             'exits')
+]
+
+rollup_opts = [
+    cfg.IntOpt(
+        'delay',
+        default=60,
+        min=0,
+        help='Seconds rock-rollup waits after the end of a period for its '
+             'last samples to be written'),
+    cfg.IntOpt(
+        'window',
+        default=3600,
+        min=60,
+        help='Seconds of samples rock-rollup reads per query and writes '
+             'per transaction'),
+    cfg.IntOpt(
+        'max_points',
+        default=1000,
+        min=1,
+        help='Max periods per target returned by rollup queries, the '
+             'resolution is chosen to stay below it'),
+    cfg.IntOpt(
+        'minute_retention_days',
+        default=14,
+        min=0,
+        help='Days of 1-minute rollups kept, 0 keeps them forever. Minutes '
+             'not rolled up into hours yet are always kept'),
+    cfg.IntOpt(
+        'hour_retention_days',
+        default=400,
+        min=0,
+        help='Days of 1-hour rollups kept, 0 keeps them forever'),
+    cfg.IntOpt(
+        'run_interval',
+        default=0,
+        min=0,
+        help='Seconds between two runs of rock-rollup, 0 runs once and '
+             'exits')
+]
+
+metrics_opts = [
+    cfg.StrOpt(
+        'bind_host',
+        default='127.0.0.1',
+        help='Address the /metrics endpoints of rock-mon and rock-engine '
+             'listen on'),
+    cfg.PortOpt(
+        'rock_mon_port',
+        default=9331,
+        help='Port of the /metrics endpoint of rock-mon, 0 disables it'),
+    cfg.PortOpt(
+        'rock_engine_port',
+        default=9332,
+        help='Port of the /metrics endpoint of rock-engine, 0 disables it')
+]
+
 kiki_opts = [
     cfg.StrOpt(
         'mail_api_endpoint',
@@ -127,6 +403,13 @@ def list_opts():
         ('host_mgmt_ping', host_mgmt_ping_opts),
         ('openstack_credential', openstack_credential_opts),
         ('host_evacuate', host_evacuate_opts),
+        ('power_manager', power_manager_opts),
         ('activemq', activemq_opts),
+        ('monitor', monitor_opts),
+        ('rule_engine', rule_engine_opts),
+        ('partition', partition_opts),
+        ('archive', archive_opts),
+        ('rollup', rollup_opts),
+        ('metrics', metrics_opts),
         ('kiki', kiki_opts)
     ]
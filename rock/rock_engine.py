@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from rock import metrics
 from rock import utils
 from oslo_utils import importutils
 from oslo_log import log as logging
@@ -23,6 +24,7 @@ def main(manager='rock.rules.rule_manager.RuleManager'):
     utils.prepare_log(service_name='rock-engine')
     log = logging.getLogger(__name__)
     log.info('Start rock engine')
+    metrics.serve('rock-engine')
     mgr_class = importutils.import_class(manager)
     mgr = mgr_class('/etc/rock/cases')
     from rock.tasks.check_and_run import check_and_run
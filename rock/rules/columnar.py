@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Columnar evaluation of collect_data judges and l1_rule with NumPy.
+
+Samples of every data model are loaded into per-target arrays once per
+cycle, then judges such as %false_end_count_lt and the l1_rule are computed
+for all targets at once instead of target by target. Only the functions
+that have an exact vectorized equivalent are supported, cases using
+anything else are evaluated by the tree evaluator instead.
+"""
+
+import six
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FALSE_VALUES = [False, 'false', 'False']
+
+
+class UnsupportedRule(Exception):
+    """The case can not be evaluated in columnar mode."""
+
+
+def available():
+    return np is not None
+
+
+def _is_call(node):
+    return isinstance(node, list) and len(node) > 0 and \
+        isinstance(node[0], six.text_type) and node[0].startswith('%')
+
+
+def _truth(value, size):
+    if isinstance(value, np.ndarray):
+        return value.astype(bool)
+    return np.full(size, bool(value), dtype=bool)
+
+
+def _compare(op):
+    def _apply(a, b):
+        if not isinstance(a, np.ndarray) and not isinstance(b, np.ndarray):
+            return op(a, b)
+        return np.asarray(op(a, b), dtype=bool)
+    return _apply
+
+
+def _reduce(ufunc, identity):
+    def _apply(size, *args):
+        result = np.full(size, identity, dtype=bool)
+        for arg in args:
+            result = ufunc(result, _truth(arg, size))
+        return result
+    return _apply
+
+
+# Vector versions of RuleParser.Functions, keyed by rule alias.
+_FUNCTIONS = {
+    '%==': _compare(lambda a, b: a == b),
+    '%<=': _compare(lambda a, b: a <= b),
+}
+_REDUCERS = {
+    '%and': _reduce(np.logical_and, True) if np else None,
+    '%or': _reduce(np.logical_or, False) if np else None,
+}
+
+
+def leading_false_runs(is_false, offsets, counts):
+    """Length of the leading run of True values in every segment.
+
+    :param is_false: bool array, segments laid out one after another.
+    :param offsets: start of every segment.
+    :param counts: length of every segment.
+    """
+    end = offsets + counts
+    true_pos = np.flatnonzero(~is_false)
+    if len(true_pos) == 0:
+        return counts.copy()
+    idx = np.searchsorted(true_pos, offsets)
+    first_true = true_pos[np.minimum(idx, len(true_pos) - 1)]
+    first_true = np.where(idx < len(true_pos), first_true, end)
+    return np.minimum(first_true, end) - offsets
+
+
+class TargetFrame(object):
+    """Samples of every data model laid out per target.
+
+    :param targets: targets present in every data model.
+    :param latest: {key: list of the newest row of each target}.
+    :param runs: {key: leading false run length of each target}.
+    """
+
+    def __init__(self, targets):
+        self.targets = targets
+        self.index = dict((target, i) for i, target in enumerate(targets))
+        self.latest = {}
+        self.runs = {}
+        self.judges = {}
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.targets)
+
+    def load(self, key, rows):
+        """Lay out rows (newest first) of one data model per target."""
+        index = self.index
+        positions = np.fromiter(
+            (index.get(row['target'], -1) for row in rows),
+            dtype=np.int64, count=len(rows))
+        is_false = np.fromiter(
+            (row['result'] in FALSE_VALUES for row in rows),
+            dtype=bool, count=len(rows))
+        row_ids = np.flatnonzero(positions >= 0)
+        # A stable sort keeps every target's rows newest first.
+        order = row_ids[np.argsort(positions[row_ids], kind='mergesort')]
+        counts = np.bincount(positions[order], minlength=len(self))
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        self.runs[key] = leading_false_runs(is_false[order], offsets, counts)
+        self.latest[key] = [rows[i] for i in order[offsets]]
+
+    def column(self, key, path):
+        """Object array of a field of the newest row of every target."""
+        cache_key = (key,) + path
+        if cache_key not in self._columns:
+            values = []
+            for row in self.latest[key]:
+                value = row
+                for name in path:
+                    value = value[name]
+                values.append(value)
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+            self._columns[cache_key] = column
+        return self._columns[cache_key]
+
+    def value(self, key, path):
+        if path == ('judge_result',):
+            return self.judges[key]
+        return self.column(key, path)
+
+
+class ColumnarRule(object):
+    """Columnar evaluator of the collect_data judges and l1_rule of a case.
+
+    Raise UnsupportedRule at construction if the case uses anything that
+    has no exact vectorized equivalent.
+    """
+
+    def __init__(self, rule):
+        if not available():
+            raise UnsupportedRule("numpy is not installed")
+        self.judges = {}
+        for key, value in rule['collect_data'].items():
+            judge = value['judge']
+            if len(judge) != 2 or judge[0] != '%false_end_count_lt' or \
+                    isinstance(judge[1], list):
+                raise UnsupportedRule("judge %s of %s" % (judge, key))
+            self.judges[key] = int(judge[1])
+        if not _is_call(rule['l1_rule']):
+            raise UnsupportedRule("l1_rule is not a function call")
+        self.l1_rule = self._compile(rule['l1_rule'])
+
+    def _compile(self, node):
+        if _is_call(node):
+            name = node[0]
+            args = [self._compile(arg) for arg in node[1:]]
+            if name in _REDUCERS:
+                reducer = _REDUCERS[name]
+                return lambda frame: reducer(
+                    len(frame), *[arg(frame) for arg in args])
+            if name == '%not' and len(args) >= 1:
+                return lambda frame: ~_truth(args[0](frame), len(frame))
+            if name in _FUNCTIONS and len(args) == 2:
+                func = _FUNCTIONS[name]
+                return lambda frame: func(args[0](frame), args[1](frame))
+            raise UnsupportedRule("function %s" % name)
+        if isinstance(node, six.text_type) and node.startswith('$'):
+            path = node[1:].split('.')
+            if len(path) < 2:
+                raise UnsupportedRule("variable %s" % node)
+            key, path = path[0], tuple(path[1:])
+            return lambda frame: frame.value(key, path)
+        if isinstance(node, (list, dict)):
+            raise UnsupportedRule("literal %s" % node)
+        return lambda frame: node
+
+    def evaluate(self, raw_data):
+        """Judge every target and evaluate l1_rule for all of them at once.
+
+        :param raw_data: {key: rows of the data model, newest first}.
+        :return: the TargetFrame and the l1 result vector of its targets.
+        """
+        targets = None
+        for key in self.judges:
+            present = set(row['target'] for row in raw_data[key])
+            targets = present if targets is None else targets & present
+        frame = TargetFrame(sorted(targets or []))
+        if not len(frame):
+            # An empty window, or data models without a common target.
+            return frame, np.zeros(0, dtype=bool)
+        for key, boundary in self.judges.items():
+            frame.load(key, raw_data[key])
+            frame.judges[key] = frame.runs[key] < boundary
+        l1 = _truth(self.l1_rule(frame), len(frame))
+        return frame, l1
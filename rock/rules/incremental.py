@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Incremental evaluation of cases, sample by sample.
+
+Instead of judging the whole window of every target on every cycle, every
+target keeps the state its judges need: its newest sample and the times
+of the false samples which follow its last true one. Each cycle only the
+samples written since the previous cycle are applied, and samples leaving
+the window are expired. l1_rule is only evaluated again for targets whose
+inputs changed, l2_rule only when an l1 result or an input of l2_rule
+changed.
+
+Cases whose collect_data are %get_by_time windows judged by
+%false_end_count_lt, and whose l2_rule refers to $l1_data, $target_data or
+$flow_data only, are supported. Delta storage mode is not, samples which
+were not written would not be applied.
+"""
+
+import collections
+import datetime
+
+import six
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import timeutils
+
+from rock.db import api as db_api
+from rock.rules import rule_utils
+from rock.rules import sample_cache
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+FALSE_VALUES = [False, 'false', 'False']
+
+# Names l2_rule may refer to, $flow_data changes outside of the samples so
+# l2_rule is evaluated on every cycle when it is used.
+L2_NAMES = ('l1_data', 'target_data', 'flow_data')
+
+
+class UnsupportedRule(Exception):
+    """The case can not be evaluated incrementally."""
+
+
+def _strings(node):
+    if isinstance(node, list):
+        for item in node:
+            for value in _strings(item):
+                yield value
+    elif isinstance(node, six.string_types):
+        yield node
+
+
+def _path_getter(path):
+    keys = tuple(path.split('.'))
+
+    def _get(value):
+        for key in keys:
+            value = value[key]
+        return value
+    return _get
+
+
+def new_rows(obj_name, seconds, last_id, now):
+    """Rows of obj_name with an id above last_id, from the last seconds."""
+    if CONF.rule_engine.sample_cache:
+        rows = sample_cache.get_cache().get_after(obj_name, seconds, last_id)
+        if rows is not None:
+            return rows
+    return db_api.get_records_after_id(
+        rule_utils.get_model(obj_name), last_id,
+        start_time=now - datetime.timedelta(seconds=seconds))
+
+
+class TargetState(object):
+    """Newest sample of a target and its trailing false samples."""
+
+    __slots__ = ('latest', 'false_times')
+
+    def __init__(self):
+        self.latest = None
+        self.false_times = collections.deque()
+
+    def apply(self, row):
+        """Apply a sample, return False if it is older than the newest."""
+        if self.latest is not None and \
+                row['created_at'] < self.latest['created_at']:
+            return False
+        self.latest = row
+        if row['result'] in FALSE_VALUES:
+            self.false_times.append(row['created_at'])
+        else:
+            self.false_times.clear()
+        return True
+
+    def expire(self, start):
+        """Drop the samples created before start, return True if changed."""
+        changed = False
+        while self.false_times and self.false_times[0] < start:
+            self.false_times.popleft()
+            changed = True
+        return changed
+
+
+class IncrementalRule(object):
+    """State of a case kept between evaluations.
+
+    Raise UnsupportedRule at construction if the case can not be evaluated
+    incrementally.
+    """
+
+    def __init__(self, rule):
+        if CONF.monitor.storage_mode == 'delta':
+            raise UnsupportedRule("delta storage mode")
+        self.sources = {}
+        for key, value in rule['collect_data'].items():
+            data, judge = value['data'], value['judge']
+            if len(data) != 3 or data[0] != '%get_by_time':
+                raise UnsupportedRule("data %s of %s" % (data, key))
+            if len(judge) != 2 or judge[0] != '%false_end_count_lt' or \
+                    isinstance(judge[1], list):
+                raise UnsupportedRule("judge %s of %s" % (judge, key))
+            self.sources[key] = (data[1], int(data[2]), int(judge[1]))
+
+        # Values l1_rule reads from the data of a target.
+        self.l1_paths = []
+        for value in _strings(rule['l1_rule']):
+            if value.startswith('$'):
+                if value[1:].split('.')[0] not in self.sources:
+                    raise UnsupportedRule("variable %s" % value)
+                self.l1_paths.append(_path_getter(value[1:]))
+
+        # Values l2_rule reads from the data of every target.
+        self.l2_paths = []
+        self.l2_uses_flows = False
+        for value in _strings(rule['l2_rule']):
+            if value.startswith('$'):
+                name = value[1:].split('.')[0]
+                if name not in L2_NAMES:
+                    raise UnsupportedRule("variable %s" % value)
+                self.l2_uses_flows |= name == 'flow_data'
+            elif value.startswith('map.'):
+                self.l2_paths.append(_path_getter(value[4:]))
+
+        self.last_id = dict((key, 0) for key in self.sources)
+        self.states = dict((key, {}) for key in self.sources)
+        self.target_data = {}
+        self.l1_data = {}
+        self._l1_inputs = {}
+        self._l2_inputs = {}
+        self.l2_result = None
+        self._l2_dirty = True
+        self.stats = {'samples': 0, 'l1': 0, 'l2': 0}
+
+    def _signature(self, paths, data):
+        signature = []
+        for get in paths:
+            try:
+                signature.append(get(data))
+            except (KeyError, TypeError):
+                signature.append(None)
+        return tuple(signature)
+
+    def update(self, now=None):
+        """Apply the new samples, expire the old ones.
+
+        :return: targets whose data changed.
+        """
+        now = now or timeutils.utcnow()
+        changed = set()
+        for key, (obj_name, seconds, boundary) in self.sources.items():
+            states = self.states[key]
+            rows = sorted(new_rows(obj_name, seconds, self.last_id[key], now),
+                          key=lambda row: row['id'])
+            for row in rows:
+                state = states.get(row['target'])
+                if state is None:
+                    state = states[row['target']] = TargetState()
+                if state.apply(row):
+                    changed.add(row['target'])
+                self.last_id[key] = max(self.last_id[key], row['id'])
+            self.stats['samples'] += len(rows)
+
+            start = now - datetime.timedelta(seconds=seconds)
+            for target, state in list(states.items()):
+                if state.latest['created_at'] < start:
+                    del states[target]
+                    changed.add(target)
+                elif state.expire(start):
+                    changed.add(target)
+
+        for target in changed:
+            self._rebuild(target)
+        return changed
+
+    def _rebuild(self, target):
+        data = {}
+        for key, (obj_name, seconds, boundary) in self.sources.items():
+            state = self.states[key].get(target)
+            if state is None:
+                break
+            data[key] = {'judge_result': len(state.false_times) < boundary}
+            data[key].update(state.latest)
+        else:
+            self.target_data[target] = data
+            return
+        if target in self.target_data:
+            del self.target_data[target]
+            self.l1_data.pop(target, None)
+            self._l1_inputs.pop(target, None)
+            self._l2_inputs.pop(target, None)
+            self._l2_dirty = True
+        if any(target in states for states in self.states.values()):
+            LOG.warning("Find host %s do not match.", target)
+
+    def evaluate_l1(self, targets, l1_rule):
+        """Evaluate l1_rule(data) again for the targets whose inputs
+        changed.
+        """
+        for target in targets:
+            data = self.target_data.get(target)
+            if data is None:
+                continue
+            inputs = self._signature(self.l1_paths, data)
+            if target not in self.l1_data or \
+                    inputs != self._l1_inputs.get(target):
+                result = l1_rule(data)
+                self.stats['l1'] += 1
+                self._l1_inputs[target] = inputs
+                previous = self.l1_data.get(target)
+                if previous is None or previous['l1_result'] != result:
+                    self._l2_dirty = True
+                self.l1_data[target] = {'l1_result': result}
+            l2_inputs = self._signature(self.l2_paths, data)
+            if l2_inputs != self._l2_inputs.get(target):
+                self._l2_inputs[target] = l2_inputs
+                self._l2_dirty = True
+
+    def evaluate_l2(self, l2_rule):
+        """Evaluate l2_rule() again if one of its inputs changed."""
+        if self._l2_dirty or self.l2_uses_flows:
+            self.l2_result = l2_rule()
+            self.stats['l2'] += 1
+            self._l2_dirty = False
+        return self.l2_result
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compile case JSON into trees of pre-bound callables.
+
+RuleParser walks, deep-copies and re-resolves the case JSON on every
+evaluation. Here every expression is turned into a closure once, when the
+case is loaded: function aliases are looked up and `$var` / `map.var` paths
+are split at compile time, so an evaluation only binds the data of the
+current cycle. Results are the same as RuleParser.calculate().
+"""
+
+import json
+import uuid
+
+import six
+from oslo_log import log as logging
+from oslo_utils import timeutils
+
+from rock.rules import columnar
+from rock.rules import incremental
+from rock.rules.rule_parser import RuleParser
+from rock.tasks import dispatcher
+
+LOG = logging.getLogger(__name__)
+
+# Where `$var` is resolved. RuleParser resolves them in every nested list of
+# l1_rule, only in the operands of function calls for l2_rule and the action
+# filters, and not at all in collect_data.
+DEEP = 'deep'
+SHALLOW = 'shallow'
+RAW = 'raw'
+
+
+def _is_call(node):
+    return isinstance(node, list) and len(node) > 0 and \
+        isinstance(node[0], six.text_type) and node[0].startswith('%')
+
+
+def _is_var(node, prefix):
+    return isinstance(node, six.text_type) and node.startswith(prefix)
+
+
+def _path_getter(path):
+    """Split 'a.b.c' into 'a' and a getter of ['b']['c']."""
+    keys = path.split('.')
+    root, keys = keys[0], tuple(keys[1:])
+
+    def _get(value):
+        for key in keys:
+            value = value[key]
+        return value
+    return root, _get
+
+
+def _positive(rule, key):
+    value = rule.get(key)
+    if value is None:
+        return None
+    if isinstance(value, bool) or \
+            not isinstance(value, six.integer_types + (float,)) or value <= 0:
+        raise ValueError("%s of case %s must be a positive number, got %r"
+                         % (key, rule.get('rule_name'), value))
+    return value
+
+
+class Scope(object):
+    """Values visible to an expression during one evaluation.
+
+    :param lookup: callable resolving the first part of a `$var`.
+    :param map_item: the item bound by an enclosing %map.
+    """
+
+    __slots__ = ('lookup', 'map_item')
+
+    def __init__(self, lookup, map_item=None):
+        self.lookup = lookup
+        self.map_item = map_item
+
+    def with_map_item(self, map_item):
+        return Scope(self.lookup, map_item)
+
+
+class Compiler(object):
+    """Turn the expressions of a case into closures taking a Scope."""
+
+    def __init__(self, funcs=None):
+        self.funcs = funcs or RuleParser.Functions()
+
+    def bind(self, name):
+        return getattr(self.funcs, RuleParser.Functions.ALIAS.get(name) or
+                       name)
+
+    def compile(self, rule, mode, in_map=False):
+        """Compile a function call expression.
+
+        The returned callable takes a Scope, plus extra trailing arguments
+        appended to the call, as RuleParser does with judge rules.
+        """
+        func = self.bind(rule[0])
+        args = [self._compile_arg(arg, mode, in_map) for arg in rule[1:]]
+
+        def _call(scope, *extra):
+            return func(*([arg(scope) for arg in args] + list(extra)))
+        return _call
+
+    def _compile_arg(self, arg, mode, in_map, in_literal=False):
+        if not in_literal:
+            if isinstance(arg, list) and len(arg) > 0 and arg[0] == '%map':
+                return self._compile_map(arg, mode)
+            if _is_call(arg):
+                return self.compile(arg, mode, in_map)
+            if in_map and _is_var(arg, 'map.'):
+                return self._compile_map_var(arg[4:])
+        if mode != RAW and _is_var(arg, '$'):
+            if mode == DEEP or not in_literal:
+                return self._compile_var(arg[1:])
+        if mode == DEEP and isinstance(arg, list):
+            items = [self._compile_arg(item, mode, in_map, in_literal=True)
+                     for item in arg]
+            return lambda scope: [item(scope) for item in items]
+        return lambda scope: arg
+
+    def _compile_var(self, path):
+        root, get = _path_getter(path)
+        return lambda scope: get(scope.lookup(root))
+
+    def _compile_map_var(self, path):
+        root, get = _path_getter(path)
+        return lambda scope: get(scope.map_item[root])
+
+    def _compile_map(self, rule, mode):
+        items = self._compile_arg(rule[1], mode, False)
+        map_rule = self.compile(rule[2], mode, in_map=True)
+
+        def _map(scope):
+            ret = {}
+            for k, v in items(scope).items():
+                ret[k] = {'map_result': map_rule(scope.with_map_item(v))}
+            return ret
+        return _map
+
+
+class Evaluation(object):
+    """Data produced by one evaluation of a compiled case.
+
+    Attribute names match RuleParser so that `$l1_data`, `$target_data`
+    etc. resolve the same way.
+    """
+
+    def __init__(self):
+        self.raw_data = {}
+        self.target_data = {}
+        self.l1_data = {}
+        self.l2_data = {}
+        self.all_data = {}
+        self.l2_result = None
+        # {target: status} of the last action flow of every target, so
+        # l2_rule and filters can refer to `$flow_data`.
+        self.flow_data = {}
+        # Set by columnar evaluation: the TargetFrame and the l1 result
+        # vector of its targets.
+        self.frame = None
+        self.l1_vector = None
+        # Set when the evaluation ended after the deadline of the case.
+        self.timed_out = False
+
+
+class CompiledRule(object):
+    """A case compiled once at load time and evaluated every cycle.
+
+    :param mode: 'tree' evaluates every target with the compiled closures,
+                 'columnar' evaluates the judges and l1_rule of all targets
+                 at once with NumPy when the case allows it,
+                 'incremental' keeps the state of every target between
+                 evaluations and only applies the new samples when the case
+                 allows it.
+
+    The optional `interval` and `timeout` of the case, in seconds, are
+    kept as is, None when they are not given.
+    """
+
+    def __init__(self, rule, mode='tree'):
+        if isinstance(rule, six.string_types):
+            rule = json.loads(rule)
+        self.rule = rule
+        self.name = rule.get('rule_name')
+        self.interval = _positive(rule, 'interval')
+        self.timeout = _positive(rule, 'timeout')
+        compiler = Compiler()
+
+        self.columnar = None
+        if mode == 'columnar':
+            try:
+                self.columnar = columnar.ColumnarRule(rule)
+            except columnar.UnsupportedRule as e:
+                LOG.warning("Case %s falls back to tree evaluation, "
+                            "columnar mode does not support %s.",
+                            self.name, e)
+
+        self.incremental = None
+        if mode == 'incremental':
+            try:
+                self.incremental = incremental.IncrementalRule(rule)
+            except incremental.UnsupportedRule as e:
+                LOG.warning("Case %s falls back to tree evaluation, "
+                            "incremental mode does not support %s.",
+                            self.name, e)
+
+        self.collectors = []
+        for key, value in rule['collect_data'].items():
+            self.collectors.append(
+                (key,
+                 compiler.compile(value['data'], RAW),
+                 compiler.compile(value['judge'], RAW)))
+        self.l1_rule = compiler.compile(rule['l1_rule'], DEEP)
+        self.l2_rule = compiler.compile(rule['l2_rule'], SHALLOW)
+        self.filters = [(each_filter, compiler.compile(each_filter, SHALLOW))
+                        for each_filter in rule['action']['filters']]
+
+        self.tasks = []
+        self.task_params = {}
+        for task in rule['action']['tasks']:
+            self.tasks.append(task[0])
+            for input_params in task[1:]:
+                input_kv = input_params.split(':')
+                self.task_params[input_kv[0]] = input_kv[1]
+
+    def evaluate(self):
+        """Evaluate the case against fresh data, without running actions."""
+        evaluation = Evaluation()
+        evaluation.flow_data = dispatcher.get_dispatcher().snapshot()
+        empty_scope = Scope(lambda name: getattr(evaluation, name))
+        if self.incremental is not None:
+            self._evaluate_incremental(evaluation, empty_scope)
+            return evaluation
+        if self.columnar is not None:
+            self._evaluate_columnar(evaluation, empty_scope)
+        else:
+            self._collect_data(evaluation, empty_scope)
+            for target, data in evaluation.target_data.items():
+                scope = Scope(data.__getitem__)
+                evaluation.l1_data[target] = \
+                    {'l1_result': self.l1_rule(scope)}
+
+        evaluation.l2_result = self.l2_rule(empty_scope)
+        return evaluation
+
+    def calculate(self, deadline=None):
+        """Evaluate the case and run its actions.
+
+        :param deadline: timeutils.now() value after which the evaluation
+                         is considered stale, its actions are then skipped.
+        """
+        LOG.info("Starting collect data.")
+        evaluation = self.evaluate()
+        LOG.info("Got target data %s", evaluation.target_data)
+        LOG.info("Got l1 data %s", evaluation.l1_data)
+        LOG.info("Got l2 result %s", evaluation.l2_result)
+        if deadline is not None and timeutils.now() > deadline:
+            evaluation.timed_out = True
+            LOG.warning("Case %s ran past its timeout, skipped the actions "
+                        "of a stale evaluation.", self.name)
+            return evaluation
+        if evaluation.l2_result:
+            self._action(evaluation)
+        return evaluation
+
+    def _collect_data(self, evaluation, scope):
+        splited_raw_data = {}
+        for key, data_rule, judge_rule in self.collectors:
+            evaluation.raw_data[key] = data_rule(scope)
+            splited_raw_data[key] = {}
+            for item in evaluation.raw_data[key]:
+                splited_raw_data[key].setdefault(item['target'], []). \
+                    append(item)
+
+        target_data = evaluation.target_data
+        for key, data_rule, judge_rule in self.collectors:
+            for target, items in splited_raw_data[key].items():
+                data = target_data.setdefault(target, {})
+                data[key] = {'judge_result': judge_rule(scope, items)}
+                data[key].update(items[0])
+
+        target_required_len = len(self.collectors)
+        for key in list(target_data):
+            if len(target_data[key]) != target_required_len:
+                target_data.pop(key)
+                LOG.warning("Find host %s do not match.", key)
+
+    def _evaluate_columnar(self, evaluation, scope):
+        all_targets = set()
+        for key, data_rule, judge_rule in self.collectors:
+            evaluation.raw_data[key] = data_rule(scope)
+            all_targets.update(item['target']
+                               for item in evaluation.raw_data[key])
+
+        frame, l1_vector = self.columnar.evaluate(evaluation.raw_data)
+        evaluation.frame = frame
+        evaluation.l1_vector = l1_vector
+        for target in all_targets - set(frame.targets):
+            LOG.warning("Find host %s do not match.", target)
+
+        for i, target in enumerate(frame.targets):
+            data = {}
+            for key in frame.judges:
+                data[key] = {'judge_result': bool(frame.judges[key][i])}
+                data[key].update(frame.latest[key][i])
+            evaluation.target_data[target] = data
+            evaluation.l1_data[target] = {'l1_result': bool(l1_vector[i])}
+
+    def _evaluate_incremental(self, evaluation, scope):
+        state = self.incremental
+        changed = state.update()
+        state.evaluate_l1(changed,
+                          lambda data: self.l1_rule(Scope(data.__getitem__)))
+        evaluation.target_data = dict(state.target_data)
+        evaluation.l1_data = dict(state.l1_data)
+        evaluation.l2_result = state.evaluate_l2(lambda: self.l2_rule(scope))
+
+    def triggered_targets(self, evaluation):
+        """Targets whose l1 result is false and pass every filter."""
+        targets = []
+        for target in evaluation.l1_data:
+            if evaluation.l1_data[target]['l1_result']:
+                continue
+            scope = Scope(evaluation.target_data[target].__getitem__)
+            filter_flag = False
+            for each_filter, filter_rule in self.filters:
+                if not filter_rule(scope):
+                    filter_flag = True
+                    LOG.info('Skipped target %s due to filter %s.',
+                             target, each_filter)
+            if not filter_flag:
+                targets.append(target)
+        return targets
+
+    def _action(self, evaluation):
+        for target in self.triggered_targets(evaluation):
+            LOG.info("Triggered action on %s.", target)
+            task_uuid = str(uuid.uuid4())
+            store_spec = {'taskflow_uuid': task_uuid,
+                          'target': target}
+            store_spec.update(self.task_params)
+            dispatcher.submit(target, task_uuid, store_spec,
+                              list(self.tasks))
+
+
+def compile_rule(rule, mode='tree'):
+    """Compile a case, given as a dict or a JSON string."""
+    return CompiledRule(rule, mode=mode)
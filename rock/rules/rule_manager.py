@@ -13,29 +13,89 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import functools
 import json
 import os
+import threading
+import time
 
 from oslo_config import cfg
 from oslo_log import log as logging
-from oslo_service import loopingcall
+from oslo_utils import timeutils
 
-from rock.rules.rule_parser import RuleParser
+from rock import events
+from rock import extension_manager
+from rock import metrics
+from rock.rules import rule_compiler
+from rock.rules import sample_cache
+from rock.tasks import dispatcher
 
 CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
 
+# Cases due at the same time share one refresh of the sample cache.
+SAMPLE_REFRESH_INTERVAL = 1.0
+
+CASE_DURATION = metrics.histogram(
+    'rock_case_evaluation_duration_seconds',
+    'Duration of the evaluations of a case, actions submitted included.',
+    ['case'])
+
+
+class CaseStatus(object):
+    """Schedule of a case and the counters of its runs."""
+
+    def __init__(self, name, compiled_case):
+        self.name = name
+        self.case = compiled_case
+        self.interval = compiled_case.interval or CONF.check_cases_interval
+        self.timeout = compiled_case.timeout
+        # A case is never evaluated twice at the same time, the periodic
+        # runs and the runs triggered by events share its state.
+        self.lock = threading.Lock()
+        self.entry = None
+        self.runs = 0
+        self.failures = 0
+        self.overruns = 0
+        self.timeouts = 0
+        self.last_duration = None
+        self.last_started_at = None
+
+    def __str__(self):
+        last = '-' if self.last_duration is None else \
+            '%.3fs' % self.last_duration
+        return ("%s(interval: %s, runs: %d, last: %s, failures: %d, "
+                "overruns: %d, timeouts: %d, skipped: %d)" % (
+                    self.name, self.interval, self.runs, last,
+                    self.failures, self.overruns, self.timeouts,
+                    self.entry.skipped if self.entry else 0))
+
 
 class RuleManager(object):
     """
     Load all cases and run them.
+
+    Every case is checked every `interval` seconds of its JSON, or
+    check_cases_interval when it has none, on a pool of case_workers
+    threads so that a slow case does not delay the others. A run lasting
+    more than `timeout` seconds of the case does not trigger actions. The
+    cases reading the samples of a failing target are also checked as soon
+    as rock-mon reports it on the event socket.
     """
 
     def __init__(self, path):
         LOG.info('Initializing rule manager.')
         self.path = path
         self.cases = []
-        self.periodic_task = None
+        self.compiled_cases = []
+        self.case_status = {}
+        self.scheduler = None
+        self.listener = None
+        self._refresh_lock = threading.Lock()
+        self._refreshed_at = None
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
         self._load_all_cases()
 
     def _load_all_cases(self):
@@ -46,29 +106,154 @@ class RuleManager(object):
                 LOG.error("Extension path '%s' doesn't exist!", path)
 
     def after_start(self):
-        self.periodic_task = \
-                loopingcall.FixedIntervalLoopingCall(self.calculate_task)
-        self.periodic_task.start(interval=CONF.check_cases_interval)
-        self.periodic_task.wait()
+        if CONF.event_socket:
+            self.start_listener(CONF.event_socket)
+        self.start_scheduler()
+        self.scheduler.wait()
+
+    def start_scheduler(self):
+        self.scheduler = extension_manager.PeriodicScheduler(
+            max_workers=CONF.rule_engine.case_workers)
+        for name, status in sorted(self.case_status.items()):
+            status.entry = self.scheduler.add(
+                name, functools.partial(self.run_case, status),
+                status.interval)
+        self.scheduler.add('Flows-Status-Report', self.report_flows,
+                           CONF.check_cases_interval)
+        self.scheduler.add('Cases-Status-Report', self.report_status, 60,
+                           start=timeutils.now() + 60)
+        self.scheduler.start()
+
+    def start_listener(self, path):
+        self.listener = events.EventListener(path, self.on_event)
+        self.listener.start()
+        thread = threading.Thread(target=self._event_loop,
+                                  name='Event-Trigger')
+        thread.daemon = True
+        thread.start()
 
     def calculate_task(self):
-        for case in self.cases:
-            if isinstance(case, dict):
-                self._calculate(case)
+        self.calculate_cases(self.compiled_cases)
+
+    def calculate_cases(self, cases):
+        """Check cases one after the other in the calling thread."""
+        self.report_flows()
+        self.refresh_samples(force=True)
+        for case in cases:
+            self.run_case(self._status_of(case))
+
+    def report_flows(self):
+        for status in dispatcher.get_dispatcher().pop_finished():
+            LOG.info("Flow %s on target %s finished with %s in %.1f "
+                     "seconds.", status.flow_name, status.target,
+                     status.state, status.finished_at - status.started_at)
+
+    def report_status(self):
+        LOG.info("Current cases: %s",
+                 " ".join(str(status) for name, status
+                          in sorted(self.case_status.items())))
+
+    def refresh_samples(self, force=False):
+        """Read the new samples unless another case just did."""
+        if not CONF.rule_engine.sample_cache:
+            return
+        with self._refresh_lock:
+            now = timeutils.now()
+            if force or self._refreshed_at is None or \
+                    now - self._refreshed_at >= SAMPLE_REFRESH_INTERVAL:
+                sample_cache.get_cache().refresh()
+                self._refreshed_at = now
+
+    def run_case(self, status):
+        """Evaluate a case and update its counters."""
+        with status.lock:
+            self.refresh_samples()
+            start = timeutils.now()
+            status.last_started_at = start
+            deadline = start + status.timeout if status.timeout else None
+            evaluation = None
+            try:
+                evaluation = self._calculate(status.case, deadline)
+            except Exception:
+                status.failures += 1
+                LOG.exception("Failed to check case %s.", status.name)
+            used_time = timeutils.now() - start
+            CASE_DURATION.observe(used_time, case=status.name)
+            status.runs += 1
+            status.last_duration = used_time
+            if used_time > status.interval:
+                status.overruns += 1
+            if evaluation is not None and evaluation.timed_out:
+                status.timeouts += 1
+
+    def _status_of(self, compiled_case):
+        for status in self.case_status.values():
+            if status.case is compiled_case:
+                return status
+        raise ValueError("Case %s is not loaded" % compiled_case.name)
+
+    def on_event(self, model_name, targets):
+        """Remember failing targets reported by rock-mon."""
+        with self._pending_lock:
+            self._pending.setdefault(model_name, set()).update(targets)
+        self._wakeup.set()
+
+    def pop_pending(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def affected_cases(self, model_names):
+        """Compiled cases reading the samples of one of model_names."""
+        cases = []
+        for case in self.compiled_cases:
+            for value in case.rule['collect_data'].values():
+                data = value['data']
+                if len(data) > 1 and data[1] in model_names:
+                    cases.append(case)
+                    break
+        return cases
+
+    def _event_loop(self):
+        while True:
+            self._wakeup.wait()
+            # Gather the events of all the samples rock-mon is writing.
+            time.sleep(CONF.rule_engine.event_delay)
+            self._wakeup.clear()
+            pending = self.pop_pending()
+            cases = self.affected_cases(pending)
+            if not cases:
+                continue
+            LOG.info("Checking %d cases for failing targets %s.",
+                     len(cases), dict((model, sorted(targets))
+                                      for model, targets in pending.items()))
+            try:
+                self.calculate_cases(cases)
+            except Exception:
+                LOG.exception("Failed to check cases on events.")
 
     def _get_all_cases_recursively(self, path):
         for dir_path, dir_names, file_names in os.walk(path):
             for file_name in file_names:
                 with open(os.path.join(dir_path, file_name), 'r') as f:
                     try:
-                        self.cases.append(json.loads(f.read()))
+                        case = json.loads(f.read())
+                        compiled_case = rule_compiler.compile_rule(
+                            case, mode=CONF.rule_engine.evaluation_mode)
+                        name = compiled_case.name or file_name
+                        if name in self.case_status:
+                            name = os.path.join(dir_path, file_name)
+                        self.cases.append(case)
+                        self.compiled_cases.append(compiled_case)
+                        self.case_status[name] = CaseStatus(name,
+                                                            compiled_case)
+                        sample_cache.get_cache().register_case(case)
                         LOG.info("Case %s loaded", file_name)
                     except Exception as e:
                         LOG.warning(
                             'Load case error, error %s, case_file %s.' %
                             (e.message, file_name))
 
-    def _calculate(self, rule_detail):
-        LOG.info("Calculating %s", rule_detail)
-        parser = RuleParser(rule_detail)
-        parser.calculate()
+    def _calculate(self, compiled_case, deadline=None):
+        LOG.info("Calculating %s", compiled_case.rule)
+        return compiled_case.calculate(deadline=deadline)
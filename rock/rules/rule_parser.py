@@ -16,23 +16,31 @@ import json
 import datetime
 import uuid
 
+from oslo_config import cfg
 from oslo_log import log as logging
-from oslo_utils import importutils
 from oslo_utils import timeutils
 
 from rock.db import api as db_api
 from rock.rules import rule_utils
-from rock.tasks.manager import run_flow
+from rock.rules import sample_cache
+from rock import sample_ring
+from rock.tasks import dispatcher
 
 
+CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
 
 
 def data_get_by_obj_time(obj_name, delta):
-    model_name = 'model_' + obj_name
-    model = importutils.import_class(
-        'rock.db.sqlalchemy.%s.%s' %
-        (model_name, rule_utils.underline_to_camel(model_name)))
+    if CONF.sample_ring_dir:
+        rows = sample_ring.get_records(obj_name, delta)
+        if rows is not None:
+            return rows
+    if CONF.rule_engine.sample_cache:
+        rows = sample_cache.get_cache().get(obj_name, delta)
+        if rows is not None:
+            return rows
+    model = rule_utils.get_model(obj_name)
     timedelta = datetime.timedelta(seconds=delta)
     return db_api.get_period_records(model,
                                      timeutils.utcnow()-timedelta,
@@ -156,7 +164,7 @@ class RuleParser(object):
                         input_kv = input_params.split(':')
                         store_spec[input_kv[0]] = input_kv[1]
 
-                run_flow(task_uuid, store_spec, tasks)
+                dispatcher.submit(target, task_uuid, store_spec, tasks)
 
     def _calculate(self, rule, funcs):
         def _recurse_calc(arg):
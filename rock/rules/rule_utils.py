@@ -12,6 +12,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from oslo_utils import importutils
+
 
 def underline_to_camel(underline_format):
     """
@@ -21,3 +23,13 @@ def underline_to_camel(underline_format):
     for _s_ in underline_format.split('_'):
         camel_format += _s_.capitalize()
     return camel_format
+
+
+def get_model(obj_name):
+    """
+        Model class of a data model name, e.g. ping -> ModelPing.
+    """
+    model_name = 'model_' + obj_name
+    return importutils.import_class(
+        'rock.db.sqlalchemy.%s.%s' %
+        (model_name, underline_to_camel(model_name)))
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Sliding windows of samples kept in the rule engine.
+
+%get_by_time re-reads every sample of its window on every cycle although
+only the samples written since the previous cycle are new. Here the
+samples of every data model used by a loaded case are kept in memory, one
+deque per target, and each refresh only reads the rows with an id above
+the last one seen. Rows older than the largest window asked for by a case
+are evicted.
+
+Ids are assumed to be committed in increasing order, which holds with the
+single writer thread of rock-mon. In delta storage mode the stored rows
+are kept and the skipped samples are rebuilt when a window is read, so
+last_id only ever refers to stored rows.
+"""
+
+import collections
+import datetime
+import threading
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import timeutils
+
+from rock.db import api as db_api
+from rock.rules import rule_utils
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+class ModelWindow(object):
+    """Samples of one data model created in the last `seconds` seconds."""
+
+    def __init__(self, model, seconds):
+        self.model = model
+        self.seconds = seconds
+        self.last_id = 0
+        self.refreshed_at = None
+        self.rows = {}
+
+    def _horizon(self):
+        seconds = self.seconds
+        if CONF.monitor.storage_mode == 'delta':
+            seconds += CONF.monitor.keyframe_interval
+        return datetime.timedelta(seconds=seconds)
+
+    def refresh(self, now):
+        """Read the new rows and evict the expired ones.
+
+        :return: number of rows read.
+        """
+        oldest = now - self._horizon()
+        rows = db_api.get_records_after_id(self.model, self.last_id,
+                                           start_time=oldest)
+        for row in rows:
+            self.rows.setdefault(row.target, collections.deque()).append(row)
+            self.last_id = max(self.last_id, row.id)
+
+        for target, target_rows in list(self.rows.items()):
+            while target_rows and target_rows[0].created_at < oldest:
+                target_rows.popleft()
+            if not target_rows:
+                del self.rows[target]
+        self.refreshed_at = now
+        return len(rows)
+
+    def get_after(self, seconds, last_id):
+        """Stored rows of the last seconds with an id above last_id."""
+        start = self.refreshed_at - datetime.timedelta(seconds=seconds)
+        rows = []
+        for target_rows in self.rows.values():
+            # Rows of a target are appended in id order.
+            for row in reversed(target_rows):
+                if row.id <= last_id:
+                    break
+                if row.created_at >= start:
+                    rows.append(row)
+        return rows
+
+    def get(self, seconds):
+        """Rows of the last seconds before the refresh, newest first."""
+        end = self.refreshed_at
+        start = end - datetime.timedelta(seconds=seconds)
+        if CONF.monitor.storage_mode == 'delta':
+            stored = [row for target_rows in self.rows.values()
+                      for row in target_rows]
+            rows = db_api.expand_delta_records(self.model, stored, start, end)
+        else:
+            rows = [row for target_rows in self.rows.values()
+                    for row in target_rows
+                    if start <= row.created_at <= end]
+        rows.sort(key=lambda row: row.created_at, reverse=True)
+        return rows
+
+
+class SampleCache(object):
+    """Windows of every data model read by %get_by_time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._windows = {}
+
+    def register(self, obj_name, seconds):
+        """Keep at least seconds of samples of obj_name."""
+        with self._lock:
+            window = self._windows.get(obj_name)
+            if window is None:
+                self._windows[obj_name] = ModelWindow(
+                    rule_utils.get_model(obj_name), seconds)
+            elif seconds > window.seconds:
+                # Read the whole larger window again on the next refresh.
+                self._windows[obj_name] = ModelWindow(window.model, seconds)
+
+    def register_case(self, case):
+        """Register the %get_by_time windows of the collect_data of case."""
+        for value in case['collect_data'].values():
+            data = value['data']
+            if len(data) == 3 and data[0] == '%get_by_time':
+                self.register(data[1], int(data[2]))
+
+    def refresh(self, now=None):
+        """Read the rows written since the last refresh of every window.
+
+        :return: number of rows read.
+        """
+        now = now or timeutils.utcnow()
+        total = 0
+        with self._lock:
+            for obj_name, window in self._windows.items():
+                count = window.refresh(now)
+                LOG.debug("Read %d new rows of %s, last id %s.",
+                          count, obj_name, window.last_id)
+                total += count
+        return total
+
+    def get(self, obj_name, seconds):
+        """Rows of the last seconds, None if they are not cached."""
+        with self._lock:
+            window = self._windows.get(obj_name)
+            if window is None or window.refreshed_at is None or \
+                    seconds > window.seconds:
+                return None
+            return window.get(seconds)
+
+    def get_after(self, obj_name, seconds, last_id):
+        """Rows of the last seconds with an id above last_id, in no order,
+        None if they are not cached.
+        """
+        with self._lock:
+            window = self._windows.get(obj_name)
+            if window is None or window.refreshed_at is None or \
+                    seconds > window.seconds:
+                return None
+            return window.get_after(seconds, last_id)
+
+
+def get_cache():
+    """Return the process wide sample cache, creating it on first use."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = SampleCache()
+        return _CACHE
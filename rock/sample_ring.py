@@ -0,0 +1,438 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Recent samples shared by rock-mon and rock-engine in memory.
+
+rock-mon appends every sample it collects to a ring of fixed-size records
+in a memory-mapped file per table, <sample_ring_dir>/<table>.ring, when it
+is queued for the database. rock-engine maps the same files read-only and
+answers %get_by_time windows from them, unpacking the records straight
+from the mapping, so a window neither waits for the writer to flush nor
+costs a query. The database stays the durable record: readers fall back
+to it when the ring is missing, was not updated for sample_ring_max_age
+seconds, was created after the start of the window, or was overwritten
+past it.
+
+The file starts with a header, then capacity records, the record of
+sequence number seq being in slot seq % capacity. Records are framed by
+their sequence number plus one, the writer clears the head, writes the
+columns and the tail, then the head again, and readers read the tail, the
+columns and the head, keeping the record only if both match: a record
+being overwritten is skipped, never half read.
+"""
+
+import calendar
+import datetime
+import errno
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import timeutils
+import six
+import sqlalchemy
+
+from rock.rules import rule_utils
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+MAGIC = b'ROCKRING'
+VERSION = 1
+# magic, version, record size, capacity, layout checksum, records written,
+# started at and updated at in microseconds since the epoch.
+HEADER = struct.Struct('<8sIIIIqqq')
+HEADER_SIZE = 64
+FRAME = struct.Struct('<q')
+MAX_STRING = 255
+NULL_INT = -2 ** 63
+
+# Samples of different extensions are stamped before they are appended,
+# a few may reach the ring slightly out of order.
+SKEW = datetime.timedelta(seconds=1)
+
+_READERS = {}
+_READERS_LOCK = threading.Lock()
+
+
+def _to_us(value):
+    if value is None:
+        return NULL_INT
+    return calendar.timegm(value.utctimetuple()) * 1000000 + \
+        value.microsecond
+
+
+def _from_us(value):
+    if value == NULL_INT:
+        return None
+    return datetime.datetime(1970, 1, 1) + \
+        datetime.timedelta(microseconds=value)
+
+
+def _pack_bool(value):
+    return -1 if value is None else int(bool(value))
+
+
+def _unpack_bool(values, index):
+    value = values[index]
+    return None if value < 0 else value == 1
+
+
+def _pack_float(value):
+    return float('nan') if value is None else float(value)
+
+
+def _unpack_float(values, index):
+    value = values[index]
+    return None if value != value else value
+
+
+def _pack_int(value):
+    return NULL_INT if value is None else int(value)
+
+
+def _unpack_int(values, index):
+    value = values[index]
+    return None if value == NULL_INT else value
+
+
+def _unpack_datetime(values, index):
+    return _from_us(values[index])
+
+
+def _unpack_string(values, index):
+    if not values[index]:
+        return None
+    return values[index + 1].rstrip(b'\0').decode('utf-8', 'replace')
+
+
+class RingLayout(object):
+    """Fixed-size record of the columns of a sample model.
+
+    Every column but id is stored, booleans as a signed byte, floats as
+    doubles, integers and datetimes as 64 bits integers and strings as
+    their utf-8 bytes padded to their length, None being encoded by a
+    reserved value or a flag byte.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.columns = []
+        formats = []
+        self._packers = []
+        self._unpackers = []
+        index = 0
+        for column in model.__table__.columns:
+            if column.name == 'id':
+                continue
+            column_type = column.type
+            width = 1
+            if isinstance(column_type, sqlalchemy.Boolean):
+                formats.append('b')
+                codec = (_pack_bool, _unpack_bool)
+            elif isinstance(column_type, sqlalchemy.Float):
+                formats.append('d')
+                codec = (_pack_float, _unpack_float)
+            elif isinstance(column_type, sqlalchemy.Integer):
+                formats.append('q')
+                codec = (_pack_int, _unpack_int)
+            elif isinstance(column_type, sqlalchemy.DateTime):
+                formats.append('q')
+                codec = (_to_us, _unpack_datetime)
+            elif isinstance(column_type, sqlalchemy.String):
+                length = min(column_type.length or MAX_STRING, MAX_STRING)
+                formats.append('B%ds' % length)
+                codec = (self._pack_string(length), _unpack_string)
+                width = 2
+            else:
+                raise ValueError("Column %s of %s can't be stored in a "
+                                 "sample ring" % (column.name,
+                                                  model.__tablename__))
+            if column.name == 'created_at':
+                # Windows are cut on the raw value, before unpacking.
+                self.created_at_index = index
+            self.columns.append(column.name)
+            self._packers.append((column.name, codec[0], width))
+            self._unpackers.append((column.name, codec[1], index))
+            index += width
+        self.description = ','.join(
+            '%s:%s' % (name, fmt) for name, fmt in zip(self.columns,
+                                                       formats))
+        self.checksum = zlib.crc32(self.description.encode('utf-8')) & \
+            0xffffffff
+        self.payload = struct.Struct('<' + ''.join(formats))
+        self.record_size = FRAME.size * 2 + self.payload.size
+
+    @staticmethod
+    def _pack_string(length):
+        def _pack(value):
+            if value is None:
+                return (0, b'')
+            return (1, six.text_type(value).encode('utf-8')[:length])
+        return _pack
+
+    def pack(self, sample):
+        values = []
+        for name, pack, width in self._packers:
+            packed = pack(sample.get(name))
+            if width == 1:
+                values.append(packed)
+            else:
+                values.extend(packed)
+        return values
+
+    def unpack(self, values):
+        row = {'id': None}
+        for name, unpack, index in self._unpackers:
+            row[name] = unpack(values, index)
+        return row
+
+
+def ring_path(directory, model):
+    return os.path.join(directory, '%s.ring' % model.__tablename__)
+
+
+class RingWriter(object):
+    """Append the samples of a model to a new ring file at path."""
+
+    def __init__(self, path, model, capacity):
+        self.path = path
+        self.layout = RingLayout(model)
+        self.capacity = capacity
+        self.written = 0
+        self.started_at = _to_us(timeutils.utcnow())
+        size = HEADER_SIZE + capacity * self.layout.record_size
+
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # Readers keep mapping the previous file until the new one is
+        # complete and renamed over it.
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.truncate(size)
+        self._file = open(tmp_path, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._write_header(self.started_at)
+        os.rename(tmp_path, path)
+
+    def _write_header(self, updated_at):
+        HEADER.pack_into(self._map, 0, MAGIC, VERSION,
+                         self.layout.record_size, self.capacity,
+                         self.layout.checksum, self.written,
+                         self.started_at, updated_at)
+
+    def append(self, sample):
+        """Append sample, a dict of column values with its created_at."""
+        values = self.layout.pack(sample)
+        frame = self.written + 1
+        offset = HEADER_SIZE + \
+            (self.written % self.capacity) * self.layout.record_size
+        FRAME.pack_into(self._map, offset, 0)
+        self.layout.payload.pack_into(self._map, offset + FRAME.size,
+                                      *values)
+        FRAME.pack_into(self._map, offset + self.layout.record_size -
+                        FRAME.size, frame)
+        FRAME.pack_into(self._map, offset, frame)
+        self.written += 1
+        self._write_header(_to_us(timeutils.utcnow()))
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class SamplePublisher(object):
+    """Publish samples of every model to its ring file in directory."""
+
+    def __init__(self, directory, capacity):
+        self.directory = directory
+        self.capacity = capacity
+        self._writers = {}
+        self._lock = threading.Lock()
+
+    def _writer(self, model):
+        writer = self._writers.get(model)
+        if writer is None and model not in self._writers:
+            try:
+                writer = RingWriter(ring_path(self.directory, model), model,
+                                    self.capacity)
+                LOG.info("Publishing samples of %s to %s.",
+                         model.__tablename__, writer.path)
+            except Exception as e:
+                LOG.error("Can't publish samples of %s to %s due to %s",
+                          model.__tablename__, self.directory, e)
+            self._writers[model] = writer
+        return writer
+
+    def publish(self, model, sample):
+        with self._lock:
+            writer = self._writer(model)
+            if writer is None:
+                return
+            try:
+                writer.append(sample)
+            except Exception as e:
+                LOG.warning("Can't publish sample of %s due to %s",
+                            model.__tablename__, e)
+
+    def close(self):
+        with self._lock:
+            for writer in self._writers.values():
+                if writer is not None:
+                    writer.close()
+            self._writers = {}
+
+
+class RingReader(object):
+    """Read the samples of a model from the ring file at path."""
+
+    def __init__(self, path, model):
+        self.path = path
+        self.layout = RingLayout(model)
+        self._inode = None
+        self._map = None
+        self._warned = False
+        self._warned_size = False
+        self._lock = threading.Lock()
+
+    def _mapping(self):
+        """Map the current ring file, None when there is none."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self._close()
+            return None
+        if self._map is None or (stat.st_dev, stat.st_ino) != self._inode:
+            self._close()
+            with open(self.path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._inode = (stat.st_dev, stat.st_ino)
+        return self._map
+
+    def _close(self):
+        if self._map is not None:
+            self._map.close()
+        self._map = None
+        self._inode = None
+
+    def _header(self, buf):
+        if len(buf) < HEADER_SIZE:
+            return None
+        (magic, version, record_size, capacity, checksum, written,
+         started_at, updated_at) = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION or \
+                record_size != self.layout.record_size or \
+                checksum != self.layout.checksum or \
+                len(buf) < HEADER_SIZE + capacity * record_size:
+            if not self._warned:
+                LOG.warning("Ring %s does not match the layout of %s, "
+                            "reading the database instead.", self.path,
+                            self.layout.model.__tablename__)
+                self._warned = True
+            return None
+        return capacity, written, _from_us(started_at), _from_us(updated_at)
+
+    def _record(self, buf, capacity, seq):
+        size = self.layout.record_size
+        offset = HEADER_SIZE + (seq % capacity) * size
+        tail = FRAME.unpack_from(buf, offset + size - FRAME.size)[0]
+        values = self.layout.payload.unpack_from(buf, offset + FRAME.size)
+        head = FRAME.unpack_from(buf, offset)[0]
+        if head != seq + 1 or tail != seq + 1:
+            return None
+        return values
+
+    def get(self, seconds, now=None, max_age=None):
+        """Samples of the last seconds, newest first.
+
+        :return: list of dicts of column values, None if the ring can't
+                 tell every sample of the window.
+        """
+        with self._lock:
+            return self._get(seconds, now, max_age)
+
+    def _get(self, seconds, now, max_age):
+        buf = self._mapping()
+        if buf is None:
+            return None
+        header = self._header(buf)
+        if header is None:
+            return None
+        capacity, written, started_at, updated_at = header
+        now = now or timeutils.utcnow()
+        start = now - datetime.timedelta(seconds=seconds)
+        if max_age is not None and \
+                now - updated_at > datetime.timedelta(seconds=max_age):
+            LOG.debug("Ring %s was last updated at %s, reading the "
+                      "database instead.", self.path, updated_at)
+            return None
+        if started_at > start:
+            return None
+
+        start_us = _to_us(start)
+        oldest_us = _to_us(start - SKEW)
+        now_us = _to_us(now)
+        created_at_index = self.layout.created_at_index
+        unpack = self.layout.unpack
+        rows = []
+        covered = written <= capacity
+        for seq in range(written - 1, max(written - capacity, 0) - 1, -1):
+            values = self._record(buf, capacity, seq)
+            if values is None:
+                # Overwritten while read, older records are too.
+                break
+            created_at = values[created_at_index]
+            if created_at < start_us:
+                if created_at < oldest_us:
+                    covered = True
+                    break
+                continue
+            if created_at <= now_us:
+                rows.append(unpack(values))
+        if not covered:
+            if not self._warned_size:
+                LOG.warning("Ring %s holds less than %d seconds of samples, "
+                            "sample_ring_size is too small.", self.path,
+                            seconds)
+                self._warned_size = True
+            return None
+        rows.sort(key=lambda row: row['created_at'], reverse=True)
+        return rows
+
+
+def get_records(obj_name, seconds):
+    """Samples of obj_name of the last seconds from its ring file.
+
+    :return: rows like get_period_records, None when they must be read
+             from the database.
+    """
+    with _READERS_LOCK:
+        reader = _READERS.get(obj_name)
+        if reader is None:
+            model = rule_utils.get_model(obj_name)
+            reader = _READERS[obj_name] = RingReader(
+                ring_path(CONF.sample_ring_dir, model), model)
+    try:
+        return reader.get(seconds,
+                          max_age=CONF.rule_engine.sample_ring_max_age)
+    except Exception as e:
+        LOG.warning("Can't read samples of %s from %s due to %s",
+                    obj_name, reader.path, e)
+        return None
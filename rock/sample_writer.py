@@ -0,0 +1,389 @@
+# Copyright 2011 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Single writer that batches monitor samples into the database."""
+
+import datetime
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+from six.moves import queue
+
+from rock.db import api as db_api
+from rock import events
+from rock import metrics
+from rock import sample_ring
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+_WRITER = None
+_WRITER_LOCK = threading.Lock()
+
+WRITE_ROWS = metrics.histogram(
+    'rock_db_write_batch_rows',
+    'Samples written to a table per batch of the writer.',
+    ['table'], buckets=metrics.SIZE_BUCKETS)
+WRITE_DURATION = metrics.histogram(
+    'rock_db_write_duration_seconds',
+    'Duration of the batch inserts of the writer.',
+    ['table'])
+
+
+class DeltaFilter(object):
+    """Drop samples equal to the last sample written for their target.
+
+    A sample is kept when one of the delta_columns of its model differs
+    from the last kept sample of the same target, or when that sample is
+    keyframe_interval seconds old, so that readers can tell a target which
+    did not change from one which is no longer monitored. A kept sample
+    which is then dropped or fails to be inserted is forgotten, the next
+    sample of its target is kept whatever its state.
+    """
+
+    def __init__(self, keyframe_interval=300):
+        self.keyframe_interval = datetime.timedelta(seconds=keyframe_interval)
+        self._last = {}
+        self._lock = threading.Lock()
+        self.unchanged = 0
+
+    def keep(self, model, sample):
+        key = (model, sample.get('target'))
+        state = tuple(sample.get(column) for column in model.delta_columns)
+        created_at = sample['created_at']
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and last[0] == state and \
+                    created_at - last[1] < self.keyframe_interval:
+                self.unchanged += 1
+                return False
+            self._last[key] = (state, created_at)
+            return True
+
+    def forget(self, model, sample):
+        """Forget sample if it is still the last kept one of its target."""
+        key = (model, sample.get('target'))
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and last[1] == sample['created_at']:
+                del self._last[key]
+
+
+class HostStatusTracker(object):
+    """Latest status of every target, kept in the host_status table.
+
+    Every sample updates the status of its (model, target) in memory, the
+    statuses changed since the last write are upserted by the writer
+    thread. Samples dropped by the delta filter still update the status,
+    so failure_count counts every sample.
+    """
+
+    def __init__(self):
+        self._status = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def load(self, rows):
+        """Continue from the statuses stored by a previous run."""
+        with self._lock:
+            for row in rows:
+                self._status[(row.model, row.target)] = {
+                    'model': row.model,
+                    'target': row.target,
+                    'result': row.result,
+                    'failure_count': row.failure_count,
+                    'last_changed_at': row.last_changed_at,
+                    'updated_at': row.updated_at,
+                    'data': row.data}
+
+    def update(self, model, sample):
+        key = (model.__tablename__, sample.get('target'))
+        result = bool(sample.get('result'))
+        created_at = sample['created_at']
+        with self._lock:
+            last = self._status.get(key)
+            if last is not None and last['updated_at'] > created_at:
+                return
+            if last is None or last['result'] != result:
+                last_changed_at = created_at
+                failure_count = 0 if result else 1
+            else:
+                last_changed_at = last['last_changed_at']
+                failure_count = 0 if result else last['failure_count'] + 1
+            data = dict((k, v) for k, v in sample.items()
+                        if k != 'created_at')
+            self._status[key] = {
+                'model': key[0],
+                'target': key[1],
+                'result': result,
+                'failure_count': failure_count,
+                'last_changed_at': last_changed_at,
+                'updated_at': created_at,
+                'data': jsonutils.dumps(data)}
+            self._dirty.add(key)
+
+    def pop_dirty(self):
+        """Return the statuses changed since the previous call."""
+        with self._lock:
+            rows = [dict(self._status[key]) for key in self._dirty]
+            self._dirty = set()
+        return rows
+
+
+class SampleWriter(object):
+    """Collect samples from all extensions and write them in batches.
+
+    A sample is a plain dict of column values for a model. Extensions put
+    samples into a bounded queue and return immediately, a single writer
+    thread drains it and bulk inserts one batch per table when either
+    flush_size samples are pending or the oldest pending sample is
+    flush_interval seconds old. When the queue is full, put() blocks for
+    at most put_timeout seconds and then drops the sample, put_all() waits
+    put_timeout seconds at most for the whole batch.
+
+    With a delta_filter, samples equal to the previous one of their target
+    are not written at all. With a host_status tracker, the latest status
+    of every target is also upserted at most every flush_interval seconds.
+    With an events sender, the target of a failing sample is sent once the
+    sample can be read from the database, for the first event_failures
+    consecutive failing samples of the target only: the judges of the cases
+    trip within that many, and a target which stays down is left to the
+    periodic check of rock-engine. With a ring publisher,
+    every sample is also published to the shared memory ring of its table
+    as soon as it is put, delta filter or not.
+    """
+
+    def __init__(self, queue_size=10000, flush_size=500, flush_interval=2.0,
+                 put_timeout=5.0, delta_filter=None, host_status=None,
+                 events=None, ring=None, event_failures=8):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.delta_filter = delta_filter
+        self.host_status = host_status
+        self.events = events
+        self.ring = ring
+        self.event_failures = event_failures
+        # Consecutive failing samples of (table, target).
+        self._failures = {}
+        self._failures_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stopped = threading.Event()
+        self._thread = None
+        self.dropped = 0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        if self.host_status is not None:
+            try:
+                self.host_status.load(db_api.get_host_status())
+            except Exception as err:
+                LOG.warning("Can't load host status due to %s", err)
+        self._thread = threading.Thread(target=self._run,
+                                        name='Sample-Writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the writer thread after flushing pending samples."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self.ring is not None:
+            self.ring.close()
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def put(self, model, sample):
+        """Queue one sample of model, return False if it was dropped."""
+        return self._put(model, sample, self.put_timeout)
+
+    def _report(self, model, sample):
+        """Return True if rock-engine must hear of sample."""
+        if self.events is None:
+            return False
+        key = (model.__tablename__, sample.get('target'))
+        with self._failures_lock:
+            if sample.get('result'):
+                self._failures.pop(key, None)
+                return False
+            count = self._failures.get(key, 0) + 1
+            self._failures[key] = count
+            return count <= self.event_failures
+
+    def _put(self, model, sample, timeout):
+        # Stamp the sample now, it may reach the database seconds later.
+        if sample.get('created_at') is None:
+            sample['created_at'] = timeutils.utcnow()
+        if self.ring is not None:
+            self.ring.publish(model, sample)
+        if self.host_status is not None:
+            self.host_status.update(model, sample)
+        report = self._report(model, sample)
+        if self.delta_filter is not None and \
+                not self.delta_filter.keep(model, sample):
+            # The sample equals the last one written, readers already
+            # see it.
+            if report:
+                self.events.send(model.__tablename__, [sample.get('target')])
+            return True
+        try:
+            self._queue.put((model, sample, report), timeout > 0, timeout)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.delta_filter is not None:
+                self.delta_filter.forget(model, sample)
+            LOG.warning("Sample queue is full, dropped sample of %s. "
+                        "Total dropped: %d.", model.__name__, self.dropped)
+            return False
+
+    def put_all(self, model, samples):
+        """Queue samples of model, return the number of dropped samples.
+
+        The batch shares one deadline, once it has passed the samples which
+        don't fit in the queue are dropped without waiting, so a stalled
+        database holds the calling extension put_timeout seconds at most.
+        """
+        deadline = time.time() + self.put_timeout
+        dropped = 0
+        for sample in samples:
+            if not self._put(model, sample, deadline - time.time()):
+                dropped += 1
+        return dropped
+
+    def _run(self):
+        batch = []
+        batch_start = None
+        status_flushed_at = time.time()
+        while True:
+            if batch:
+                wait = batch_start + self.flush_interval - time.time()
+            else:
+                wait = self.flush_interval
+            try:
+                sample = self._queue.get(timeout=max(wait, 0.01))
+                if not batch:
+                    batch_start = time.time()
+                batch.append(sample)
+                while len(batch) < self.flush_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            stopping = self._stopped.is_set()
+            if batch and (stopping or len(batch) >= self.flush_size or
+                          time.time() - batch_start >= self.flush_interval):
+                self._flush(batch)
+                batch = []
+            if self.host_status is not None and (
+                    stopping or
+                    time.time() - status_flushed_at >= self.flush_interval):
+                self._flush_status()
+                status_flushed_at = time.time()
+            if stopping and self._queue.empty():
+                break
+
+    def _flush(self, batch):
+        tables = {}
+        for model, sample, report in batch:
+            samples, reported = tables.setdefault(model, ([], set()))
+            samples.append(sample)
+            if report:
+                reported.add(sample.get('target'))
+        for model, (samples, reported) in tables.items():
+            start = time.time()
+            try:
+                db_api.bulk_insert(model, samples)
+            except Exception as err:
+                LOG.error("Failed to write %d samples of %s due to %s",
+                          len(samples), model.__name__, err)
+                if self.delta_filter is not None:
+                    for sample in samples:
+                        self.delta_filter.forget(model, sample)
+                continue
+            used_time = time.time() - start
+            WRITE_ROWS.observe(len(samples), table=model.__tablename__)
+            WRITE_DURATION.observe(used_time, table=model.__tablename__)
+            LOG.debug("Wrote %d samples of %s in %.3f seconds.",
+                      len(samples), model.__name__, used_time)
+            if reported:
+                self.events.send(model.__tablename__, reported)
+
+    def _flush_status(self):
+        rows = self.host_status.pop_dirty()
+        if not rows:
+            return
+        try:
+            db_api.upsert_host_status(rows)
+        except Exception as err:
+            LOG.error("Failed to write %d host status due to %s",
+                      len(rows), err)
+
+
+def get_writer():
+    """Return the process wide sample writer, creating it on first use."""
+    global _WRITER
+    with _WRITER_LOCK:
+        if _WRITER is None:
+            delta_filter = None
+            if CONF.monitor.storage_mode == 'delta':
+                delta_filter = DeltaFilter(CONF.monitor.keyframe_interval)
+            host_status = None
+            if CONF.monitor.track_host_status:
+                host_status = HostStatusTracker()
+            sender = None
+            if CONF.event_socket:
+                sender = events.EventSender(CONF.event_socket)
+            ring = None
+            if CONF.sample_ring_dir:
+                ring = sample_ring.SamplePublisher(
+                    CONF.sample_ring_dir, CONF.monitor.sample_ring_size)
+            _WRITER = SampleWriter(
+                queue_size=CONF.monitor.sample_queue_size,
+                flush_size=CONF.monitor.flush_size,
+                flush_interval=CONF.monitor.flush_interval,
+                put_timeout=CONF.monitor.put_timeout,
+                delta_filter=delta_filter,
+                host_status=host_status,
+                events=sender,
+                ring=ring,
+                event_failures=CONF.monitor.event_failures)
+        return _WRITER
+
+
+def _queued():
+    return _WRITER.qsize() if _WRITER is not None else 0
+
+
+metrics.gauge('rock_sample_queue_size',
+              'Samples waiting for the writer.', _queued)
+
+
+def put(model, sample):
+    """Queue one sample into the process wide writer."""
+    return get_writer().put(model, sample)
+
+
+def put_all(model, samples):
+    """Queue many samples into the process wide writer."""
+    return get_writer().put_all(model, samples)
@@ -0,0 +1,153 @@
+# Copyright 2011 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Run action flows in the background so rule evaluation never waits."""
+
+import threading
+import time
+
+import futurist
+from futurist import rejection
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from rock.tasks.manager import run_flow
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+RUNNING = 'RUNNING'
+SUCCESS = 'SUCCESS'
+FAILURE = 'FAILURE'
+
+_DISPATCHER = None
+_DISPATCHER_LOCK = threading.Lock()
+
+
+class FlowStatus(object):
+    """State of the last flow submitted for a target."""
+
+    def __init__(self, target, flow_name, tasks):
+        self.target = target
+        self.flow_name = flow_name
+        self.tasks = tasks
+        self.state = RUNNING
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {'flow_name': self.flow_name,
+                'tasks': list(self.tasks),
+                'state': self.state,
+                'error': self.error,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at}
+
+
+class FlowDispatcher(object):
+    """Run flows on a bounded pool of worker threads.
+
+    At most one flow runs per target: submitting a target whose previous
+    flow is still running is refused. The status of the last flow of every
+    target is kept, and flows finished since the previous call are handed
+    out by pop_finished(), so the next evaluation cycle can see them.
+    """
+
+    def __init__(self, max_workers=4, max_backlog=None):
+        check = None
+        if max_backlog:
+            check = rejection.reject_when_reached(max_backlog)
+        self._executor = futurist.ThreadPoolExecutor(
+            max_workers=max_workers, check_and_reject=check)
+        self._lock = threading.Lock()
+        self._status = {}
+        self._finished = []
+
+    def submit(self, target, flow_name, store_spec, tasks):
+        """Queue a flow for target, return False if it was not queued."""
+        with self._lock:
+            current = self._status.get(target)
+            if current is not None and current.state == RUNNING:
+                LOG.info("Skipped target %s, flow %s is still running.",
+                         target, current.flow_name)
+                return False
+            status = FlowStatus(target, flow_name, tasks)
+            self._status[target] = status
+        try:
+            self._executor.submit(self._run, status, store_spec)
+        except futurist.RejectedSubmission:
+            LOG.warning("Too many pending flows, skipped target %s.", target)
+            with self._lock:
+                if self._status.get(target) is status:
+                    del self._status[target]
+            return False
+        LOG.info("Dispatched flow %s on target %s.", flow_name, target)
+        return True
+
+    def _run(self, status, store_spec):
+        try:
+            run_flow(status.flow_name, store_spec, list(status.tasks))
+            state = SUCCESS
+        except Exception as e:
+            LOG.exception("Flow %s on target %s failed.",
+                          status.flow_name, status.target)
+            status.error = e.message or str(e)
+            state = FAILURE
+        with self._lock:
+            status.state = state
+            status.finished_at = time.time()
+            self._finished.append(status)
+
+    def is_running(self, target):
+        with self._lock:
+            status = self._status.get(target)
+            return status is not None and status.state == RUNNING
+
+    def status(self, target):
+        """Return the FlowStatus of the last flow of target, or None."""
+        with self._lock:
+            return self._status.get(target)
+
+    def snapshot(self):
+        """Return {target: status dict} of the last flow of every target."""
+        with self._lock:
+            return dict((target, status.to_dict())
+                        for target, status in self._status.items())
+
+    def pop_finished(self):
+        """Return the flows finished since the previous call."""
+        with self._lock:
+            finished, self._finished = self._finished, []
+        return finished
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+def get_dispatcher():
+    """Return the process wide dispatcher, creating it on first use."""
+    global _DISPATCHER
+    with _DISPATCHER_LOCK:
+        if _DISPATCHER is None:
+            _DISPATCHER = FlowDispatcher(
+                max_workers=CONF.rule_engine.flow_workers,
+                max_backlog=CONF.rule_engine.flow_backlog)
+        return _DISPATCHER
+
+
+def submit(target, flow_name, store_spec, tasks):
+    """Queue a flow on the process wide dispatcher."""
+    return get_dispatcher().submit(target, flow_name, store_spec, tasks)
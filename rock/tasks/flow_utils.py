@@ -14,18 +14,26 @@
 #    under the License.
 
 import os
+import time
 
 from oslo_log import log as logging
 from oslo_config import cfg
-from keystoneauth1 import identity, session
-from novaclient import client
 from taskflow.listeners import base
 from taskflow.listeners import logging as logging_listener
+from taskflow import states
 from taskflow import task
 
+from rock import clients
+from rock import metrics
+
 LOG = logging.getLogger(__name__)
 CONF = cfg.CONF
 
+TASK_DURATION = metrics.histogram(
+    'rock_flow_task_duration_seconds',
+    'Duration of the tasks of action flows, by final state.',
+    ['task', 'state'])
+
 
 def _make_task_name(cls, addons=None):
     """Makes a pretty name for a task class."""
@@ -85,16 +93,26 @@ class DynamicLogListener(logging_listener.DynamicLoggingListener):
             return super(DynamicLogListener, self)._format_failure(fail)
 
 
+class TaskMetricsListener(base.Listener):
+    """Observe the duration of every task of a flow in TASK_DURATION."""
+
+    def __init__(self, engine):
+        super(TaskMetricsListener, self).__init__(
+            engine,
+            task_listen_for=(states.RUNNING, states.SUCCESS, states.FAILURE),
+            flow_listen_for=(),
+            retry_listen_for=())
+        self._started = {}
+
+    def _task_receiver(self, state, details):
+        name = details['task_name']
+        if state == states.RUNNING:
+            self._started[name] = time.time()
+        elif name in self._started:
+            TASK_DURATION.observe(time.time() - self._started.pop(name),
+                                  task=name.split('.')[-1],
+                                  state=state.lower())
+
+
 def get_nova_client():
-    auth = identity.Password(
-        username=CONF.openstack_credential.username,
-        password=CONF.openstack_credential.password,
-        project_name=CONF.openstack_credential.project_name,
-        auth_url=CONF.openstack_credential.auth_url,
-        project_domain_id=CONF.openstack_credential.project_domain_id,
-        user_domain_id=CONF.openstack_credential.user_domain_id)
-
-    sess = session.Session(auth=auth, verify=False)
-    nova_client_version = CONF.openstack_credential.nova_client_version
-    n_client = client.Client(nova_client_version, session=sess)
-    return n_client
+    return clients.get_nova_client()
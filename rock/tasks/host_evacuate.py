@@ -19,6 +19,7 @@ import time
 
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_utils import timeutils
 from rock.tasks import flow_utils
 
 LOG = logging.getLogger(__name__)
@@ -70,16 +71,33 @@ class HostEvacuate(flow_utils.BaseTask):
             time_delta=CONF.host_evacuate.check_interval)
         """
 
-        for server in servers:
-            self.evacuate_servers([server], n_client)
-            self.check_evacuate_status(
-                n_client, [server.id], target,
+        # Evacuated servers are updated from now on, so they can be listed
+        # with changes-since on the hosts they moved to.
+        changes_since = self.changes_since()
+        destination_hosts = set()
+        max_concurrent = CONF.host_evacuate.max_concurrent_evacuations
+        if max_concurrent > 1:
+            self.evacuate_in_parallel(
+                n_client, servers, target, max_concurrent,
                 check_times=CONF.host_evacuate.check_times,
-                time_delta=CONF.host_evacuate.check_interval)
+                time_delta=CONF.host_evacuate.check_interval,
+                changes_since=changes_since,
+                destination_hosts=destination_hosts)
+        else:
+            for server in servers:
+                self.evacuate_servers([server], n_client)
+                self.check_evacuate_status(
+                    n_client, [server.id], target,
+                    check_times=CONF.host_evacuate.check_times,
+                    time_delta=CONF.host_evacuate.check_interval,
+                    changes_since=changes_since,
+                    destination_hosts=destination_hosts)
 
         evacuate_result = self.get_evacuate_results(
             n_client, servers_id, target, taskflow_uuid,
-            message_generator=message_generator)
+            message_generator=message_generator,
+            changes_since=changes_since,
+            destination_hosts=destination_hosts)
 
         if not evacuate_result[2]:
             self.reset_state(n_client, evacuate_result[1])
@@ -104,6 +122,63 @@ class HostEvacuate(flow_utils.BaseTask):
             servers_id.append(server.id)
         return servers, servers_id
 
+    @staticmethod
+    def changes_since(margin=60):
+        """Timestamp for the changes-since filter of servers.list
+
+        The margin covers clock skew between rock and the nova database.
+        """
+        return (timeutils.utcnow() -
+                datetime.timedelta(seconds=margin)).isoformat()
+
+    @staticmethod
+    def get_servers_by_id(n_client, vms_uuid, vm_origin_host,
+                          changes_since=None, destination_hosts=None):
+        """Get many servers with a few servers.list calls
+
+        Servers still on the origin host are listed by host, servers which
+        have left it are listed by the destination hosts seen so far, with
+        changes-since when given. Only servers of vms_uuid are kept, and
+        the ones found by neither list are fetched one by one, so the
+        result always has every server of vms_uuid. The hosts the servers
+        have moved to are added to destination_hosts, pass the same set
+        to the next calls.
+        """
+        if destination_hosts is None:
+            destination_hosts = set()
+        wanted = set(vms_uuid)
+        found = {}
+        search_opts_list = [{'host': vm_origin_host, 'all_tenants': 1}]
+        for host in sorted(destination_hosts):
+            search_opts = {'host': host, 'all_tenants': 1}
+            if changes_since is not None:
+                search_opts['changes-since'] = changes_since
+            search_opts_list.append(search_opts)
+        for search_opts in search_opts_list:
+            if not wanted - set(found):
+                break
+            try:
+                servers = n_client.servers.list(search_opts=search_opts)
+            except Exception as err:
+                LOG.warning("Can't list servers with %s due to %s"
+                            % (search_opts, err.message))
+                continue
+            for server in servers:
+                if server.id in wanted:
+                    found[server.id] = server
+
+        missing = wanted - set(found)
+        if missing:
+            LOG.debug("Getting %s servers one by one: %s"
+                      % (len(missing), ' '.join(missing)))
+        for vm_id in missing:
+            found[vm_id] = n_client.servers.get(vm_id)
+        for server in found.values():
+            host = getattr(server, 'OS-EXT-SRV-ATTR:host', None)
+            if host is not None and host != vm_origin_host:
+                destination_hosts.add(host)
+        return found
+
     @staticmethod
     def evacuate_servers(servers, n_client):
         """Evacuate servers"""
@@ -150,7 +225,8 @@ class HostEvacuate(flow_utils.BaseTask):
 
     @staticmethod
     def check_evacuate_status(n_client, vms_uuid, vm_origin_host,
-                              check_times=6, time_delta=15):
+                              check_times=6, time_delta=15,
+                              changes_since=None, destination_hosts=None):
         """Check the evacuate status
 
         Because this function is only designed for waiting some times to
@@ -160,20 +236,75 @@ class HostEvacuate(flow_utils.BaseTask):
         """
         LOG.info("Checking evacuate status. Check times: %s, check "
                  "interval: %ss." % (check_times, time_delta))
-        continue_flag = True
+        pending = set(vms_uuid)
+        if destination_hosts is None:
+            destination_hosts = set()
         time.sleep(time_delta)
         for i in range(check_times - 1):
-            if continue_flag:
-                for vm_id in vms_uuid:
-                    vm = n_client.servers.get(vm_id)
-                    vm_task_state = getattr(vm, 'OS-EXT-STS:task_state', None)
-                    if vm_task_state is not None:
-                        time.sleep(time_delta)
-                        continue_flag = True
-                        break
-                    continue_flag = False
-            else:
+            vms = HostEvacuate.get_servers_by_id(
+                n_client, pending, vm_origin_host, changes_since,
+                destination_hosts)
+            pending = set(vm_id for vm_id, vm in vms.items()
+                          if getattr(vm, 'OS-EXT-STS:task_state', None)
+                          is not None)
+            if not pending:
                 break
+            time.sleep(time_delta)
+
+    @staticmethod
+    def evacuate_in_parallel(n_client, servers, vm_origin_host,
+                             max_concurrent, check_times=6, time_delta=15,
+                             changes_since=None, destination_hosts=None):
+        """Evacuate servers with at most max_concurrent in progress
+
+        Evacuation requests are sent for the first max_concurrent servers,
+        then the task state of all in progress servers is checked every
+        time_delta seconds. A server leaves its slot when its vm_task is
+        None or when it has been waited for check_times * time_delta
+        seconds, as check_evacuate_status does, and the slot is refilled
+        with the next server. Whether a server was really evacuated is
+        decided later by get_evacuate_results.
+        """
+        LOG.info("Evacuating %s servers of host %s, at most %s at a time. "
+                 "Check times: %s, check interval: %ss." %
+                 (len(servers), vm_origin_host, max_concurrent,
+                  check_times, time_delta))
+        pending = list(servers)
+        in_progress = {}
+        if destination_hosts is None:
+            destination_hosts = set()
+        max_wait = check_times * time_delta
+        while pending or in_progress:
+            while pending and len(in_progress) < max_concurrent:
+                server = pending.pop(0)
+                HostEvacuate.evacuate_servers([server], n_client)
+                in_progress[server.id] = time.time()
+
+            time.sleep(time_delta)
+            now = time.time()
+            try:
+                vms = HostEvacuate.get_servers_by_id(
+                    n_client, in_progress, vm_origin_host, changes_since,
+                    destination_hosts)
+            except Exception as err:
+                LOG.warning("Can't get servers %s due to %s"
+                            % (' '.join(in_progress), err.message))
+                vms = {}
+            for vm_id, started_at in list(in_progress.items()):
+                if vm_id in vms:
+                    vm_task_state = getattr(vms[vm_id],
+                                            'OS-EXT-STS:task_state', None)
+                else:
+                    vm_task_state = 'unknown'
+                if vm_task_state is None:
+                    LOG.debug("Server %s finished evacuation in %.1fs"
+                              % (vm_id, now - started_at))
+                    del in_progress[vm_id]
+                elif now - started_at >= max_wait:
+                    LOG.warning("Server %s is still in task state %s after "
+                                "%ss, stop waiting for it"
+                                % (vm_id, vm_task_state, max_wait))
+                    del in_progress[vm_id]
 
     @staticmethod
     def judge(instance, origin_host):
@@ -214,7 +345,8 @@ class HostEvacuate(flow_utils.BaseTask):
 
     def get_evacuate_results(
             self, n_client, vms_uuid, vm_origin_host, taskflow_uuid,
-            message_generator='message_generator_for_activemq'):
+            message_generator='message_generator_for_activemq',
+            changes_since=None, destination_hosts=None):
         """Get evacuate results and generate messages
 
         Before this method is executed, we have involved check_evacuate_status.
@@ -223,12 +355,14 @@ class HostEvacuate(flow_utils.BaseTask):
 
         messages = []
         failed_uuid_and_state = {}
+        vms = self.get_servers_by_id(n_client, vms_uuid, vm_origin_host,
+                                     changes_since, destination_hosts)
 
         generator = getattr(self, message_generator, None)
         if generator is None:
             LOG.error("Invalid message generator: %s" % message_generator)
             for vm_id in vms_uuid:
-                vm = n_client.servers.get(vm_id)
+                vm = vms[vm_id]
                 res = self.judge(vm, vm_origin_host)
                 if not res[0]:
                     failed_uuid_and_state[vm_id] = res[1]
@@ -238,7 +372,7 @@ class HostEvacuate(flow_utils.BaseTask):
                 return messages, failed_uuid_and_state, True
 
         for vm_id in vms_uuid:
-            vm = n_client.servers.get(vm_id)
+            vm = vms[vm_id]
             res = self.judge(vm, vm_origin_host)
             if res[0]:
                 messages.append(generator(vm, True,
@@ -25,8 +25,6 @@ from oslo_utils import importutils
 
 LOG = logging.getLogger(__name__)
 
-CONF = dict(connection=cfg.CONF.database.connection)
-
 
 def get_tasks_objects(task_cls_name):
     result = []
@@ -56,11 +54,15 @@ def create_flow(flow_name, tasks):
     return task_flow
 
 
-def run_flow(flow_name, store_spec, tasks):
+def run_flow(flow_name, store_spec, tasks, listeners=()):
     """Constructs and run a task flow.
+
+    :param listeners: callables taking the flow engine and returning a
+                      taskflow listener, attached while the flow runs.
     """
 
-    backend = impl_sqlalchemy.SQLAlchemyBackend(CONF)
+    backend = impl_sqlalchemy.SQLAlchemyBackend(
+        dict(connection=cfg.CONF.database.connection))
 
     book = models.LogBook(flow_name)
 
@@ -75,6 +77,14 @@ def run_flow(flow_name, store_spec, tasks):
                                                      book=None,
                                                      engine='serial')
 
-    with flow_utils.DynamicLogListener(flow_engine, logger=LOG):
-        flow_engine.run()
-        LOG.info("taskflow execute is successfully.")
+    attached = [listener(flow_engine) for listener in listeners]
+    for listener in attached:
+        listener.register()
+    try:
+        with flow_utils.DynamicLogListener(flow_engine, logger=LOG), \
+                flow_utils.TaskMetricsListener(flow_engine):
+            flow_engine.run()
+            LOG.info("taskflow execute is successfully.")
+    finally:
+        for listener in attached:
+            listener.deregister()
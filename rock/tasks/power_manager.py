@@ -18,9 +18,11 @@ import json
 import commands
 
 from flow_utils import BaseTask
+from oslo_config import cfg
 from oslo_log import log as logging
 
 LOG = logging.getLogger(__name__)
+CONF = cfg.CONF
 
 
 class PowerManager(BaseTask):
@@ -35,8 +37,8 @@ class PowerManager(BaseTask):
             if status_code != 0:
                 LOG.warning("Failed to power off host %s" % target)
                 return False
-            LOG.info("Waiting 30s...")
-            time.sleep(30)
+            LOG.info("Waiting %ss..." % CONF.power_manager.power_off_wait)
+            time.sleep(CONF.power_manager.power_off_wait)
             code, output = ipmi.power_status()
             if code == 0 and output.split(' ')[-1] == 'off':
                 LOG.info("Power status of %s: %s" % (target, output))
@@ -54,7 +56,7 @@ class PowerManager(BaseTask):
 
 class IPMIAction(object):
     def __init__(self, hostname):
-        with open('/etc/rock/target.json', 'r') as f:
+        with open(CONF.power_manager.target_file, 'r') as f:
             data = json.load(f)
         self._ip = data[hostname]['ip']
         self._username = data[hostname]['username']
@@ -0,0 +1,23 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from oslo_config import cfg
+from oslo_db import options as db_options
+
+from rock import utils
+
+# rock.db.sqlalchemy.api opens a session at import time, so tests must point
+# the database at sqlite before anything imports it.
+utils.register_all_options()
+db_options.set_defaults(cfg.CONF, connection='sqlite://')
+# Tests never share samples with a rock-mon running on the node.
+cfg.CONF.set_default('sample_ring_dir', '')
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_archive
+----------------------------------
+
+Tests for `rock.db.archive` module, on sqlite with the history database
+attached as rock_history.
+"""
+
+import datetime
+
+import mock
+import sqlalchemy as sa
+from sqlalchemy import pool
+
+from rock.db import archive
+from rock.db.sqlalchemy.model_archive_checkpoint import ModelArchiveCheckpoint
+from rock.db.sqlalchemy.model_ping import ModelPing
+from rock.tests import base
+
+NOW = datetime.datetime(2016, 10, 20, 12, 0, 0)
+
+
+class TestArchiver(base.TestCase):
+
+    def setUp(self):
+        super(TestArchiver, self).setUp()
+        self.engine = sa.create_engine('sqlite://',
+                                       poolclass=pool.StaticPool)
+        self.engine.execute("ATTACH DATABASE ':memory:' AS rock_history")
+        ModelPing.__table__.create(self.engine)
+        self.archiver = archive.Archiver(self.engine, 'rock_history',
+                                         chunk_size=3, chunk_interval=0)
+        self.archiver._history_table(ModelPing.__table__).create(self.engine)
+        ModelArchiveCheckpoint.__table__.create(self.engine)
+        self.engine.execute(ModelPing.__table__.insert(), [
+            {'target': 'host-1', 'result': True,
+             'created_at': NOW - datetime.timedelta(hours=10 - i)}
+            for i in range(10)])
+        self.history = self.archiver._history_table(ModelPing.__table__)
+
+    def _ids(self, table):
+        return [row[0] for row in self.engine.execute(
+            sa.select([table.c.id]).order_by(table.c.id))]
+
+    def test_archive_moves_old_rows_in_chunks(self):
+        moved = self.archiver.archive(ModelPing,
+                                      NOW - datetime.timedelta(hours=2.5))
+        self.assertEqual(8, moved)
+        self.assertEqual(list(range(1, 9)), self._ids(self.history))
+        self.assertEqual([9, 10], self._ids(ModelPing.__table__))
+        self.assertEqual((None, 0), self.archiver.get_checkpoint('ping'))
+
+    def test_interrupted_archive_resumes_from_checkpoint(self):
+        cutoff = NOW - datetime.timedelta(hours=2.5)
+        original_insert = self.archiver._save_checkpoint
+        calls = []
+
+        def _fail_second_chunk(conn, table_name, chunk_cutoff, last_id):
+            calls.append(last_id)
+            if len(calls) == 2:
+                raise sa.exc.OperationalError('insert', {}, 'lost')
+            original_insert(conn, table_name, chunk_cutoff, last_id)
+
+        with mock.patch.object(self.archiver, '_save_checkpoint',
+                               side_effect=_fail_second_chunk):
+            self.assertRaises(sa.exc.OperationalError,
+                              self.archiver.archive, ModelPing, cutoff)
+        # The failed chunk was rolled back as a whole.
+        self.assertEqual([1, 2, 3], self._ids(self.history))
+        self.assertEqual((cutoff, 3), self.archiver.get_checkpoint('ping'))
+
+        # A later run finishes the interrupted one with its cutoff first.
+        with mock.patch.object(self.archiver, '_save_checkpoint',
+                               side_effect=original_insert) as save:
+            self.assertEqual(7, self.archiver.archive(ModelPing, NOW))
+        self.assertEqual(mock.call(mock.ANY, 'ping', cutoff, 8),
+                         save.call_args_list[1])
+        self.assertEqual(mock.call(mock.ANY, 'ping', None, 0),
+                         save.call_args_list[2])
+        self.assertEqual(list(range(1, 11)), self._ids(self.history))
+        self.assertEqual([], self._ids(ModelPing.__table__))
+        self.assertEqual((None, 0), self.archiver.get_checkpoint('ping'))
+
+    def test_resumed_archive_continues_with_new_cutoff(self):
+        self.archiver._save_checkpoint(
+            self.engine, 'ping', NOW - datetime.timedelta(hours=8.5), 1)
+        # Row 2 finishes the resumed run, the new one starts over at id 1.
+        self.assertEqual(9, self.archiver.archive(
+            ModelPing, NOW - datetime.timedelta(hours=1.5)))
+        self.assertEqual(list(range(1, 10)), self._ids(self.history))
+        self.assertEqual([10], self._ids(ModelPing.__table__))
+        self.assertEqual((None, 0), self.archiver.get_checkpoint('ping'))
+
+    def test_purge_deletes_expired_history(self):
+        self.archiver.archive(ModelPing, NOW)
+        self.assertEqual(7, self.archiver.purge(
+            ModelPing, NOW - datetime.timedelta(hours=3.5)))
+        self.assertEqual([8, 9, 10], self._ids(self.history))
+
+    def test_history_table_is_in_history_schema(self):
+        self.assertEqual('ping', self.history.name)
+        self.assertEqual('rock_history', self.history.schema)
+        self.assertIsNone(self.archiver.checkpoints.schema)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_benchmarks
+----------------------------------
+
+Smoke tests of the benchmarks on tiny regions.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+from oslo_config import cfg
+
+from rock.benchmarks import base as bench_base
+from rock.benchmarks import fakes
+from rock.benchmarks import ingestion
+from rock.benchmarks import recovery
+from rock.benchmarks import rules
+from rock import clients
+from rock.db import api as db_api
+from rock.db.sqlalchemy import api
+from rock.db.sqlalchemy.model_host_status import ModelHostStatus
+from rock.db.sqlalchemy.model_nova_service import ModelNovaService
+from rock.db.sqlalchemy.model_ping import ModelPing
+from rock import sample_writer
+from rock.tasks import dispatcher
+from rock.tasks import host_disable
+from rock.tasks import host_evacuate
+from rock.tasks import message_report
+from rock.tasks import power_manager
+from rock.tests import base
+
+CONF = cfg.CONF
+
+
+class TestBenchmarkBase(base.TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, bench_base.percentile(values, 50))
+        self.assertEqual(99, bench_base.percentile(values, 99))
+        self.assertEqual(100, bench_base.percentile(values, 100))
+        self.assertIsNone(bench_base.percentile([], 50))
+
+    def test_db_timer_restores_functions(self):
+        original = db_api.get_period_records
+        with bench_base.DBTimer() as timer:
+            self.assertIsNot(original, db_api.get_period_records)
+            db_api.bulk_insert(ModelPing, [])
+            self.assertEqual(1, timer.calls)
+        self.assertIs(original, db_api.get_period_records)
+
+
+class TestRulesBenchmark(base.TestCase):
+
+    def setUp(self):
+        super(TestRulesBenchmark, self).setUp()
+        CONF.set_override('sample_cache', False, group='rule_engine')
+        self.addCleanup(CONF.clear_override, 'sample_cache',
+                        group='rule_engine')
+        engine = api.get_engine()
+        self.addCleanup(ModelPing.metadata.drop_all, engine)
+        self.addCleanup(ModelNovaService.metadata.drop_all, engine)
+
+    def test_host_down_triggers_once_per_cycle(self):
+        submit = dispatcher.submit
+        rows = rules.run_size(20, mode='tree', pattern='host_down', cycles=2)
+        self.assertIs(submit, dispatcher.submit)
+        self.assertEqual([1, 2], [row[1] for row in rows])
+        self.assertEqual([1, 1], [row[-1] for row in rows])
+        # Both windows are read from the database on every cycle.
+        self.assertEqual([2, 2], [row[4] for row in rows])
+
+    def test_rack_down_does_not_trigger(self):
+        rows = rules.run_size(20, pattern='rack_down', cycles=1,
+                              failure_rate=0.2)
+        self.assertEqual(0, rows[0][-1])
+
+
+class TestIngestionBenchmark(base.TestCase):
+
+    def setUp(self):
+        super(TestIngestionBenchmark, self).setUp()
+        # The in-memory database has a single connection, writing from
+        # two workers at once would mix their transactions.
+        CONF.set_override('scheduler_workers', 1, group='monitor')
+        self.addCleanup(CONF.clear_override, 'scheduler_workers',
+                        group='monitor')
+        self.addCleanup(setattr, sample_writer, '_WRITER', None)
+        engine = api.get_engine()
+        for model in (ModelPing, ModelNovaService, ModelHostStatus):
+            self.addCleanup(model.metadata.drop_all, engine)
+
+    def _run(self, strategy):
+        bulk_insert = db_api.bulk_insert
+        row, timeline = ingestion.run_size(5, strategy, interval=0.2,
+                                           duration=0.5)
+        self.assertIs(bulk_insert, db_api.bulk_insert)
+        self.assertTrue(timeline)
+        return dict(zip(ingestion.HEADERS, row))
+
+    def test_writer(self):
+        result = self._run('writer')
+        # Every sample collected reaches the database once the writer
+        # is stopped.
+        self.assertEqual(result['samples/s'] * 0.5, result['db rows'])
+        self.assertEqual(0, result['dropped'])
+        self.assertIsNotNone(result['p99 ms'])
+
+    def test_save_all(self):
+        result = self._run('save_all')
+        self.assertEqual(result['samples/s'] * 0.5, result['db rows'])
+        self.assertIsNotNone(result['slowest cycle ms'])
+
+
+class TestRecoveryFakes(base.TestCase):
+
+    def setUp(self):
+        super(TestRecoveryFakes, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.cloud = fakes.FakeCloud(evacuate_latency=0.1)
+        self.cloud.start()
+        self.addCleanup(self.cloud.stop)
+        self.broker = fakes.FakeStompBroker()
+        self.broker.start()
+        self.addCleanup(self.broker.stop)
+
+        fakes.write_ipmitool(self.tmp)
+        path = os.environ.get('PATH', '')
+        os.environ['PATH'] = self.tmp + os.pathsep + path
+        self.addCleanup(os.environ.__setitem__, 'PATH', path)
+        target_file = os.path.join(self.tmp, 'target.json')
+        with open(target_file, 'w') as f:
+            json.dump({'compute-0': {'ip': '10.255.0.1', 'username': 'root',
+                                     'password': 'secret'}}, f)
+
+        overrides = recovery.overrides({
+            ('openstack_credential', 'auth_url'): self.cloud.url + '/v3',
+            ('openstack_credential', 'password'): 'secret',
+            ('host_mgmt_ping', 'compute_hosts'): [recovery.HOST,
+                                                  recovery.SPARE],
+            ('host_mgmt_ping', 'management_network_ip'):
+                recovery.MANAGEMENT_IPS,
+            ('activemq', 'server_port'): self.broker.port,
+            ('power_manager', 'target_file'): target_file,
+            ('power_manager', 'power_off_wait'): 0,
+            ('host_evacuate', 'check_interval'): 1,
+            ('host_evacuate', 'max_concurrent_evacuations'): 2})
+        overrides.__enter__()
+        self.addCleanup(overrides.__exit__, None, None, None)
+        clients.reset()
+        self.addCleanup(clients.reset)
+
+    def test_recovery_tasks(self):
+        self.cloud.add_host(recovery.HOST, 3, recovery.SPARE)
+        evacuate = dict(method='POST',
+                        endpoint='/v2.1/servers/{id}/action evacuate')
+        observed = clients.API_DURATION.count(**evacuate)
+
+        self.assertTrue(power_manager.PowerManager().execute('compute-0'))
+        messages, evacuated = host_evacuate.HostEvacuate().execute(
+            'compute-0', 'flow-1', True)
+        self.assertTrue(evacuated)
+        self.assertEqual(['compute-1'] * 3,
+                         [server.host for server
+                          in self.cloud.servers.values()])
+        self.assertTrue(host_disable.HostDisable().execute(
+            'compute-0', 'host_down_disable_by_rock', evacuated))
+        message_report.MessageReport().execute(messages)
+        self.assertTrue(self.broker.wait_closed())
+
+        self.assertEqual(3, len(self.broker.messages))
+        self.assertEqual(3, self.cloud.requests[
+            ('nova', 'POST /servers/{id}/action evacuate')])
+        self.assertEqual(observed + 3, clients.API_DURATION.count(**evacuate))
+        self.assertEqual(1, self.cloud.requests[
+            ('keystone', 'POST /v3/auth/tokens')])
+        self.assertEqual('disabled',
+                         self.cloud.services['compute-0']['status'])
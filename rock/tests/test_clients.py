@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_clients
+----------------------------------
+
+Tests for the process wide OpenStack clients.
+"""
+
+from oslo_config import cfg
+
+from rock import clients
+from rock.tests import base
+
+CONF = cfg.CONF
+
+
+class TestClients(base.TestCase):
+
+    def setUp(self):
+        super(TestClients, self).setUp()
+        clients.reset()
+        self.addCleanup(clients.reset)
+        CONF.set_override('auth_url', 'http://keystone:5000/v3',
+                          group='openstack_credential')
+        CONF.set_override('password', 'secret',
+                          group='openstack_credential')
+        self.addCleanup(CONF.clear_override, 'auth_url',
+                        group='openstack_credential')
+        self.addCleanup(CONF.clear_override, 'password',
+                        group='openstack_credential')
+
+    def test_client_is_shared(self):
+        first = clients.get_nova_client()
+        self.assertIs(first, clients.get_nova_client())
+        self.assertIs(clients.get_session(), first.client.session)
+
+    def test_region_gets_its_own_client_and_shares_the_session(self):
+        default = clients.get_nova_client()
+        other = clients.get_nova_client(region_name='RegionTwo')
+        self.assertIsNot(default, other)
+        self.assertIs(default.client.session, other.client.session)
+
+    def test_credential_change_gets_a_new_session(self):
+        first = clients.get_session()
+        CONF.set_override('password', 'rotated',
+                          group='openstack_credential')
+        self.assertIsNot(first, clients.get_session())
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_db_api
+----------------------------------
+
+Tests for `rock.db.sqlalchemy.api` module.
+"""
+
+import datetime
+
+import mock
+from oslo_config import cfg
+
+from rock.db.sqlalchemy import api
+from rock.db.sqlalchemy.model_host_status import ModelHostStatus
+from rock.db.sqlalchemy.model_nova_service import ModelNovaService
+from rock.db.sqlalchemy.model_ping import ModelPing
+from rock.db.sqlalchemy.model_rollup import ModelNovaServiceRollup
+from rock.tests import base
+
+CONF = cfg.CONF
+T0 = datetime.datetime(2016, 10, 1, 12, 0, 0)
+
+
+def at(seconds):
+    return T0 + datetime.timedelta(seconds=seconds)
+
+
+class TestDBApi(base.TestCase):
+
+    def setUp(self):
+        super(TestDBApi, self).setUp()
+        self.engine = api.get_engine()
+        for model in (ModelPing, ModelNovaService, ModelHostStatus,
+                      ModelNovaServiceRollup):
+            model.metadata.create_all(self.engine)
+            self.addCleanup(model.metadata.drop_all, self.engine)
+
+    def _count(self, model):
+        return self.engine.execute(model.__table__.count()).scalar()
+
+    def test_bulk_insert_dicts_in_batches(self):
+        rows = [{'target': 'host-%d' % i, 'result': i % 2 == 0}
+                for i in range(5)]
+        api.Connection.bulk_insert(ModelPing, rows, batch_size=2)
+        self.assertEqual(5, self._count(ModelPing))
+
+    def test_bulk_insert_copies_rows(self):
+        rows = [{'target': 'host-1', 'result': True},
+                {'target': 'host-2', 'result': False,
+                 'management_ip_result': False}]
+        api.Connection.bulk_insert(ModelPing, rows)
+        self.assertEqual(2, self._count(ModelPing))
+        self.assertEqual([{'target': 'host-1', 'result': True},
+                          {'target': 'host-2', 'result': False,
+                           'management_ip_result': False}], rows)
+
+    def test_bulk_insert_raises(self):
+        with mock.patch.object(api, 'get_engine') as get_engine:
+            get_engine.return_value.begin.side_effect = RuntimeError('gone')
+            self.assertRaises(RuntimeError, api.Connection.bulk_insert,
+                              ModelPing, [{'target': 'host-1'}])
+
+    def test_bulk_insert_tuples(self):
+        rows = [('host-1', True, True, True, None),
+                ('host-2', False, False, True, u'reason')]
+        api.Connection.bulk_insert(
+            ModelNovaService, rows,
+            columns=('target', 'result', 'service_state', 'service_status',
+                     'disabled_reason'))
+        records = api.model_query(ModelNovaService).all()
+        self.assertEqual(['host-1', 'host-2'],
+                         sorted(r.target for r in records))
+        self.assertTrue(all(r.created_at for r in records))
+
+    def test_delta_period_records_are_rebuilt(self):
+        CONF.set_override('storage_mode', 'delta', group='monitor')
+        self.addCleanup(CONF.clear_override, 'storage_mode', group='monitor')
+        # host-1 went down at 40s, its samples at 10s..30s and 50s..90s
+        # were not written. host-2 has only a keyframe from before the
+        # window.
+        api.Connection.bulk_insert(ModelPing, [
+            {'target': 'host-1', 'result': True, 'created_at': at(0.2)},
+            {'target': 'host-1', 'result': False, 'created_at': at(40.1)},
+            {'target': 'host-2', 'result': True, 'created_at': at(-250)},
+        ])
+        records = api.Connection.get_period_records(
+            ModelPing, at(0), at(95), sort_key='created_at')
+
+        host_1 = [r for r in records if r.target == 'host-1']
+        self.assertEqual(10, len(host_1))
+        self.assertEqual([False] * 6 + [True] * 4,
+                         [r.result for r in host_1])
+        self.assertEqual(at(90.1), host_1[0].created_at)
+        # host-2 is only rebuilt until its next keyframe was due.
+        host_2 = [r for r in records if r.target == 'host-2']
+        self.assertEqual(at(40), host_2[0].created_at)
+        self.assertEqual(5, len(host_2))
+
+    def test_upsert_host_status(self):
+        row = {'model': 'ping', 'target': 'host-1', 'result': True,
+               'failure_count': 0, 'last_changed_at': at(0),
+               'updated_at': at(0), 'data': '{}'}
+        api.Connection.upsert_host_status([row])
+        api.Connection.upsert_host_status([
+            dict(row, result=False, failure_count=1, last_changed_at=at(10),
+                 updated_at=at(10)),
+            dict(row, target='host-2')])
+
+        self.assertEqual(2, self._count(ModelHostStatus))
+        status = api.Connection.get_host_status('ping', 'host-1')
+        self.assertEqual(1, len(status))
+        self.assertFalse(status[0].result)
+        self.assertEqual(1, status[0].failure_count)
+        self.assertEqual(at(10), status[0].last_changed_at)
+
+    def test_upsert_host_status_raises(self):
+        row = {'model': 'ping', 'target': 'host-1', 'result': True,
+               'failure_count': 0, 'last_changed_at': at(0),
+               'updated_at': at(0), 'data': '{}'}
+        with mock.patch.object(api, 'get_engine') as get_engine:
+            get_engine.return_value.begin.side_effect = RuntimeError('gone')
+            self.assertRaises(RuntimeError,
+                              api.Connection.upsert_host_status, [row])
+
+    def test_pick_resolution(self):
+        day = datetime.timedelta(days=1)
+        self.assertEqual(60, api.pick_resolution(T0, T0 + day, 1440))
+        self.assertEqual(3600, api.pick_resolution(T0, T0 + day, 1000))
+        self.assertEqual(3600, api.pick_resolution(T0, T0 + 90 * day, 1000))
+
+    def test_get_rollup_records_at_picked_resolution(self):
+        self.engine.execute(ModelNovaServiceRollup.__table__.insert(), [
+            {'resolution': resolution, 'target': target,
+             'period_start': at(seconds), 'sample_count': 1,
+             'failure_count': 0, 'state_changes': 0, 'last_result': True}
+            for resolution, seconds in ((60, 0), (60, 60), (3600, 0))
+            for target in ('host-1', 'host-2')])
+
+        resolution, records = api.Connection.get_rollup_records(
+            'nova_service', at(30), at(90), max_points=10)
+        self.assertEqual(60, resolution)
+        self.assertEqual([(at(0), 'host-1'), (at(0), 'host-2'),
+                          (at(60), 'host-1'), (at(60), 'host-2')],
+                         [(r.period_start, r.target) for r in records])
+
+        resolution, records = api.Connection.get_rollup_records(
+            ModelNovaService, at(0), at(7200), target='host-2',
+            max_points=10)
+        self.assertEqual(3600, resolution)
+        self.assertEqual(['host-2'], [r.target for r in records])
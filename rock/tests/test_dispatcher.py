@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_dispatcher
+----------------------------------
+
+Tests for the background flow dispatcher.
+"""
+
+import threading
+import time
+
+import mock
+
+from rock.tasks import dispatcher
+from rock.tests import base
+
+
+class TestFlowDispatcher(base.TestCase):
+
+    def setUp(self):
+        super(TestFlowDispatcher, self).setUp()
+        self.release = threading.Event()
+        self.calls = []
+
+        def _run_flow(flow_name, store_spec, tasks):
+            self.calls.append((flow_name, store_spec['target']))
+            self.release.wait(5)
+            if store_spec.get('fail'):
+                raise ValueError('power off failed')
+
+        patcher = mock.patch.object(dispatcher, 'run_flow',
+                                    side_effect=_run_flow)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dispatcher = dispatcher.FlowDispatcher(max_workers=2)
+        self.addCleanup(self.dispatcher.shutdown)
+        self.addCleanup(self.release.set)
+
+    def test_submit_returns_before_flow_finishes(self):
+        self.assertTrue(self.dispatcher.submit(
+            'server-1', 'flow-1', {'target': 'server-1'}, ['host_evacuate']))
+        self.assertTrue(self.dispatcher.is_running('server-1'))
+        self.assertEqual(dispatcher.RUNNING,
+                         self.dispatcher.snapshot()['server-1']['state'])
+
+    def test_running_target_is_not_submitted_twice(self):
+        spec = {'target': 'server-1'}
+        self.assertTrue(self.dispatcher.submit('server-1', 'flow-1', spec,
+                                               []))
+        self.assertFalse(self.dispatcher.submit('server-1', 'flow-2', spec,
+                                                []))
+        self.assertTrue(self.dispatcher.submit(
+            'server-2', 'flow-3', {'target': 'server-2'}, []))
+
+    def test_finished_flows_are_reported_once(self):
+        self.dispatcher.submit('server-1', 'flow-1', {'target': 'server-1'},
+                               [])
+        self.dispatcher.submit('server-2', 'flow-2',
+                               {'target': 'server-2', 'fail': True}, [])
+        self.release.set()
+        self.dispatcher.shutdown()
+
+        finished = dict((status.target, status)
+                        for status in self.dispatcher.pop_finished())
+        self.assertEqual(dispatcher.SUCCESS, finished['server-1'].state)
+        self.assertEqual(dispatcher.FAILURE, finished['server-2'].state)
+        self.assertEqual('power off failed', finished['server-2'].error)
+        self.assertEqual([], self.dispatcher.pop_finished())
+        self.assertFalse(self.dispatcher.is_running('server-1'))
+        # A finished target can be triggered again.
+        self.assertEqual(dispatcher.SUCCESS,
+                         self.dispatcher.status('server-1').state)
+
+    def test_backlog_is_bounded(self):
+        bounded = dispatcher.FlowDispatcher(max_workers=1, max_backlog=1)
+        self.addCleanup(bounded.shutdown)
+        self.assertTrue(bounded.submit('server-0', 'flow-0',
+                                       {'target': 'server-0'}, []))
+        # Wait for the worker to take the first flow off the backlog.
+        for _ in range(100):
+            if self.calls:
+                break
+            time.sleep(0.01)
+        results = [bounded.submit('server-%d' % i, 'flow-%d' % i,
+                                  {'target': 'server-%d' % i}, [])
+                   for i in range(1, 4)]
+        self.assertEqual([True, False, False], results)
+        self.assertFalse(bounded.is_running('server-3'))
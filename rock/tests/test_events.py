@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_events
+----------------------------------
+
+Tests for the events rock-mon sends to rock-engine.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+
+import mock
+
+from rock.db.sqlalchemy.model_ping import ModelPing
+from rock import events
+from rock.rules import rule_manager
+from rock import sample_writer
+from rock.tests import base
+
+CASES_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'etc',
+                         'cases')
+
+
+class TestEvents(base.TestCase):
+
+    def setUp(self):
+        super(TestEvents, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, 'run', 'engine.sock')
+
+    def test_failing_targets_reach_the_listener(self):
+        received = []
+        done = threading.Event()
+
+        def _callback(model_name, targets):
+            received.append((model_name, targets))
+            if len(received) == 2:
+                done.set()
+
+        listener = events.EventListener(self.path, _callback)
+        listener.start()
+        self.addCleanup(listener.stop)
+        sender = events.EventSender(self.path)
+        self.addCleanup(sender.close)
+        targets = ['server-%03d' % i for i in range(150)]
+        sender.send('ping', targets)
+
+        self.assertTrue(done.wait(5))
+        self.assertEqual([('ping', targets[:100]), ('ping', targets[100:])],
+                         received)
+        self.assertEqual(2, sender.sent)
+
+    def test_send_without_listener_is_dropped(self):
+        sender = events.EventSender(self.path)
+        self.addCleanup(sender.close)
+        sender.send('ping', ['server-1'])
+        self.assertEqual(1, sender.dropped)
+
+    @mock.patch.object(sample_writer.db_api, 'bulk_insert')
+    def test_writer_sends_failing_targets_after_flush(self, bulk_insert):
+        sender = mock.Mock()
+        writer = sample_writer.SampleWriter(flush_size=3, flush_interval=60,
+                                            events=sender)
+        writer.put(ModelPing, {'target': 'a', 'result': True})
+        writer.put(ModelPing, {'target': 'b', 'result': False})
+        writer.put(ModelPing, {'target': 'c', 'result': False})
+        writer.start()
+        writer.stop(timeout=5)
+        sender.send.assert_called_once_with('ping', set(['b', 'c']))
+
+    @mock.patch.object(sample_writer.db_api, 'bulk_insert')
+    def test_writer_sends_first_failures_only(self, bulk_insert):
+        sender = mock.Mock()
+        writer = sample_writer.SampleWriter(flush_size=1, flush_interval=60,
+                                            events=sender, event_failures=2)
+        for result in (False, False, False, True, False):
+            writer.put(ModelPing, {'target': 'a', 'result': result})
+        writer.start()
+        writer.stop(timeout=5)
+        self.assertEqual(5, bulk_insert.call_count)
+        # Not the third failure, counting restarts after a success.
+        self.assertEqual([mock.call('ping', set(['a']))] * 3,
+                         sender.send.call_args_list)
+
+
+class TestRuleManagerEvents(base.TestCase):
+
+    def setUp(self):
+        super(TestRuleManagerEvents, self).setUp()
+        self.manager = rule_manager.RuleManager(CASES_DIR)
+
+    def test_affected_cases(self):
+        self.assertEqual(1, len(self.manager.affected_cases(set(['ping']))))
+        self.assertEqual([], self.manager.affected_cases(set(['other'])))
+
+    def test_pending_events_are_merged(self):
+        self.manager.on_event('ping', ['server-1'])
+        self.manager.on_event('ping', ['server-2'])
+        self.manager.on_event('nova_service', ['server-1'])
+        self.assertEqual({'ping': set(['server-1', 'server-2']),
+                          'nova_service': set(['server-1'])},
+                         self.manager.pop_pending())
+        self.assertEqual({}, self.manager.pop_pending())
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_extension_manager
+----------------------------------
+
+Tests for the periodic task scheduler of extensions.
+"""
+
+import threading
+import time
+
+from rock import extension_manager
+from rock.extension_manager import ExtensionDescriptor
+from rock.tests import base
+
+
+class FakeExtension(ExtensionDescriptor):
+
+    def __init__(self):
+        super(FakeExtension, self).__init__()
+        self.calls = []
+
+    def get_name(self):
+        return 'Fake'
+
+    def get_alias(self):
+        return 'fake'
+
+    def get_description(self):
+        return 'Fake extension'
+
+    @ExtensionDescriptor.period_decorator(0.05, jitter=0.01)
+    def periodic_task(self):
+        self.calls.append(time.time())
+        if len(self.calls) == 1:
+            raise ValueError('first run fails')
+
+
+class TestPeriodicScheduler(base.TestCase):
+
+    def setUp(self):
+        super(TestPeriodicScheduler, self).setUp()
+        self.scheduler = extension_manager.PeriodicScheduler(max_workers=2)
+        self.addCleanup(self.scheduler.stop)
+
+    def test_decorated_task_is_scheduled(self):
+        ext = FakeExtension()
+        entry = self.scheduler.add_periodic_task('fake', ext.periodic_task)
+        self.assertEqual(0.05, entry.interval)
+        self.assertEqual(0.01, entry.jitter)
+        self.scheduler.start()
+        time.sleep(0.3)
+        self.scheduler.stop()
+        # The failed first run does not stop the task.
+        self.assertEqual(1, entry.failures)
+        self.assertTrue(len(ext.calls) >= 3)
+
+    def test_deadlines_do_not_drift(self):
+        starts = []
+
+        def _task():
+            starts.append(time.time())
+            time.sleep(0.02)
+
+        self.scheduler.add('slow', _task, 0.05)
+        self.scheduler.start()
+        time.sleep(0.52)
+        self.scheduler.stop()
+        # With sleep(interval - used_time) every run would start a bit
+        # later than the previous deadline, here they stay on the grid.
+        self.assertTrue(10 <= len(starts) <= 11)
+
+    def _overrun(self, policy):
+        release = threading.Event()
+        calls = []
+
+        def _task():
+            calls.append(time.time())
+            if len(calls) == 1:
+                release.wait(1)
+
+        entry = self.scheduler.add('overrun', _task, 0.05, policy=policy)
+        self.scheduler.start()
+        time.sleep(0.23)
+        calls_before_release = len(calls)
+        release.set()
+        time.sleep(0.1)
+        self.scheduler.stop()
+        return entry, calls_before_release, calls
+
+    def test_skip_policy_drops_overlapping_runs(self):
+        entry, before, calls = self._overrun(extension_manager.SKIP)
+        self.assertEqual(1, before)
+        self.assertTrue(entry.skipped >= 4)
+        self.assertTrue(len(calls) <= 3)
+
+    def test_catch_up_policy_runs_missed_ticks(self):
+        entry, before, calls = self._overrun(extension_manager.CATCH_UP)
+        self.assertEqual(1, before)
+        self.assertEqual(0, entry.skipped)
+        # The four ticks missed during the first run, then regular ones.
+        self.assertTrue(len(calls) >= 5)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_host_evacuate
+----------------------------------
+
+Tests for parallel evacuation and batched polling in HostEvacuate.
+"""
+
+import mock
+
+from rock.tasks import host_evacuate
+from rock.tests import base
+
+
+class FakeServer(object):
+
+    def __init__(self, server_id, polls, host='server-1'):
+        self.id = server_id
+        self.host = host
+        # Number of status polls before the evacuation finishes, None
+        # means it never finishes.
+        self.polls = polls
+
+    def __getattr__(self, name):
+        if name == 'OS-EXT-STS:task_state':
+            if self.polls is not None and self.polls <= 0:
+                return None
+            return 'rebuilding'
+        if name == 'OS-EXT-SRV-ATTR:host':
+            return self.host
+        if name == 'OS-EXT-STS:vm_state':
+            return 'active'
+        raise AttributeError(name)
+
+
+class FakeServers(object):
+
+    def __init__(self, servers, clock):
+        self.servers = dict((server.id, server) for server in servers)
+        self.clock = clock
+        self.evacuated = []
+        self.max_in_progress = 0
+        self.list_calls = []
+        self.get_calls = []
+
+    def evacuate(self, server, on_shared_storage):
+        self.evacuated.append((self.clock[0], server))
+        started = set(e[1] for e in self.evacuated)
+        in_progress = [s for s in self.servers.values()
+                       if s.id in started and s.polls != 0]
+        self.max_in_progress = max(self.max_in_progress, len(in_progress))
+        return mock.Mock(status_code=200), None
+
+    def _poll(self, server):
+        if server.polls is not None:
+            server.polls -= 1
+        return server
+
+    def get(self, server_id):
+        self.get_calls.append(server_id)
+        return self._poll(self.servers[server_id])
+
+    def list(self, search_opts):
+        self.list_calls.append(search_opts)
+        return [self._poll(server) for server in self.servers.values()
+                if server.host == search_opts['host']]
+
+
+class TestParallelEvacuate(base.TestCase):
+
+    def setUp(self):
+        super(TestParallelEvacuate, self).setUp()
+        self.clock = [0.0]
+
+        def _sleep(seconds):
+            self.clock[0] += seconds
+
+        for name, side_effect in (('sleep', _sleep),
+                                  ('time', lambda: self.clock[0])):
+            patcher = mock.patch.object(host_evacuate.time, name,
+                                        side_effect=side_effect)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _evacuate(self, servers, max_concurrent, check_times=6):
+        n_client = mock.Mock()
+        n_client.servers = FakeServers(servers, self.clock)
+        with mock.patch.object(host_evacuate, 'LOG') as log:
+            host_evacuate.HostEvacuate.evacuate_in_parallel(
+                n_client, servers, 'server-1', max_concurrent,
+                check_times=check_times, time_delta=15,
+                changes_since='2016-10-01T12:00:00')
+        self.accepted = [args[0] for args, _ in log.info.call_args_list
+                         if 'accepted' in args[0]]
+        return n_client.servers
+
+    def test_slots_are_refilled(self):
+        servers = [FakeServer('vm-%d' % i, 1) for i in range(6)]
+        fake = self._evacuate(servers, 3)
+        self.assertEqual(['vm-%d' % i for i in range(6)],
+                         [e[1] for e in fake.evacuated])
+        self.assertEqual(6, len(self.accepted))
+        self.assertEqual(3, fake.max_in_progress)
+        # Two rounds of three servers, one check interval each.
+        self.assertEqual(30, self.clock[0])
+
+    def test_stuck_server_does_not_block_others(self):
+        servers = [FakeServer('vm-0', None)] + \
+            [FakeServer('vm-%d' % i, 1) for i in range(1, 5)]
+        fake = self._evacuate(servers, 2, check_times=3)
+        self.assertEqual(5, len(fake.evacuated))
+        self.assertEqual(5, len(self.accepted))
+        # vm-0 is given up after check_times * check_interval, while the
+        # other slot evacuated vm-1 to vm-3 meanwhile.
+        self.assertEqual(45, fake.evacuated[-1][0])
+        self.assertEqual(60, self.clock[0])
+
+
+class TestBatchedPolling(base.TestCase):
+
+    def setUp(self):
+        super(TestBatchedPolling, self).setUp()
+        self.servers = [FakeServer('vm-0', 0, host='server-2'),
+                        FakeServer('vm-1', 0, host='server-3'),
+                        FakeServer('vm-2', 0)]
+        self.n_client = mock.Mock()
+        self.n_client.servers = FakeServers(self.servers, [0.0])
+
+    def test_destination_hosts_are_listed(self):
+        destination_hosts = set()
+        vms_uuid = ['vm-0', 'vm-1', 'vm-2']
+        vms = host_evacuate.HostEvacuate.get_servers_by_id(
+            self.n_client, vms_uuid, 'server-1',
+            changes_since='2016-10-01T12:00:00',
+            destination_hosts=destination_hosts)
+        self.assertEqual(set(vms_uuid), set(vms))
+        self.assertEqual(['vm-0', 'vm-1'],
+                         sorted(self.n_client.servers.get_calls))
+        self.assertEqual(set(['server-2', 'server-3']), destination_hosts)
+
+        # Later calls list the hosts the servers moved to.
+        self.n_client.servers.list_calls = []
+        self.n_client.servers.get_calls = []
+        vms = host_evacuate.HostEvacuate.get_servers_by_id(
+            self.n_client, vms_uuid, 'server-1',
+            changes_since='2016-10-01T12:00:00',
+            destination_hosts=destination_hosts)
+        self.assertEqual(set(vms_uuid), set(vms))
+        self.assertEqual([], self.n_client.servers.get_calls)
+        self.assertEqual([
+            {'host': 'server-1', 'all_tenants': 1},
+            {'host': 'server-2', 'all_tenants': 1,
+             'changes-since': '2016-10-01T12:00:00'},
+            {'host': 'server-3', 'all_tenants': 1,
+             'changes-since': '2016-10-01T12:00:00'}],
+            self.n_client.servers.list_calls)
+
+    def test_unlisted_servers_are_fetched(self):
+        vms = host_evacuate.HostEvacuate.get_servers_by_id(
+            self.n_client, ['vm-0', 'vm-2'], 'server-1')
+        self.assertEqual(set(['vm-0', 'vm-2']), set(vms))
+        self.assertEqual(['vm-0'], self.n_client.servers.get_calls)
+
+    def test_get_evacuate_results(self):
+        task = host_evacuate.HostEvacuate()
+        messages, failed, success = task.get_evacuate_results(
+            self.n_client, ['vm-0', 'vm-1', 'vm-2'], 'server-1', 'uuid',
+            message_generator='no_such_generator',
+            changes_since='2016-10-01T12:00:00',
+            destination_hosts=set(['server-2', 'server-3']))
+        self.assertFalse(success)
+        self.assertEqual({'vm-2': 'active'}, failed)
+        self.assertEqual([], self.n_client.servers.get_calls)
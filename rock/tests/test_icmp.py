@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_icmp
+----------------------------------
+
+Tests for `rock.icmp` module.
+"""
+
+import errno
+import itertools
+import os
+import socket
+import struct
+
+import mock
+
+from rock import icmp
+from rock.tests import base
+
+
+class TestIcmp(base.TestCase):
+
+    def test_checksum_of_packet_is_zero(self):
+        packet = icmp.build_echo_request(0x1234, 7)
+        self.assertEqual(0, icmp.checksum(packet))
+
+    def test_parse_reply_without_ip_header(self):
+        reply = struct.pack('!BBHHH', icmp.ICMP_ECHO_REPLY, 0, 0, 0x1234, 7)
+        self.assertEqual((0x1234, 7), icmp.parse_echo_reply(reply, False))
+
+    def test_parse_reply_with_ip_header(self):
+        ip_header = b'\x45' + b'\x00' * 19
+        reply = struct.pack('!BBHHH', icmp.ICMP_ECHO_REPLY, 0, 0, 1, 2)
+        self.assertEqual((1, 2),
+                         icmp.parse_echo_reply(ip_header + reply, True))
+
+    def test_parse_ignores_echo_request(self):
+        request = icmp.build_echo_request(1, 2)
+        self.assertIsNone(icmp.parse_echo_reply(request, False))
+
+
+class FakeSocket(object):
+    """Datagram ICMP socket answering from replies, on a fake clock.
+
+    replies maps an address to the peer and the delay of its echo replies,
+    send_errors yields the errno of every sendto call, None to send it.
+    """
+
+    def __init__(self, clock, replies, send_errors=()):
+        self.clock = clock
+        self.replies = replies
+        self.send_errors = iter(send_errors)
+        self.sent = []
+        self.incoming = []
+
+    def sendto(self, packet, address):
+        error = next(self.send_errors, None)
+        if error is not None:
+            raise socket.error(error, os.strerror(error))
+        self.sent.append(address[0])
+        if address[0] in self.replies:
+            peer, delay = self.replies[address[0]]
+            _type, _code, _csum, ident, seq = struct.unpack_from(
+                '!BBHHH', packet)
+            reply = struct.pack('!BBHHH', icmp.ICMP_ECHO_REPLY, 0, 0,
+                                ident, seq)
+            self.incoming.append((self.clock[0] + delay, reply, (peer, 0)))
+            self.incoming.sort()
+        return len(packet)
+
+    def recvfrom(self, size):
+        if self.incoming and self.incoming[0][0] <= self.clock[0]:
+            _arrival, packet, peer = self.incoming.pop(0)
+            return packet, peer
+        raise socket.error(errno.EAGAIN, os.strerror(errno.EAGAIN))
+
+    def select(self, rlist, wlist, xlist, timeout):
+        if self.incoming and self.incoming[0][0] <= self.clock[0]:
+            return rlist, wlist, []
+        if wlist:
+            return [], wlist, []
+        if self.incoming:
+            timeout = min(timeout, self.incoming[0][0] - self.clock[0])
+        self.clock[0] += timeout
+        return [], [], []
+
+
+class TestIcmpProbe(base.TestCase):
+
+    def setUp(self):
+        super(TestIcmpProbe, self).setUp()
+        self.clock = [0.0]
+        patcher = mock.patch.object(icmp.time, 'time',
+                                    side_effect=lambda: self.clock[0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _probe(self, addresses, replies, send_errors=()):
+        sock = FakeSocket(self.clock, replies, send_errors)
+        prober = icmp.IcmpProber(count=3, interval=0.3, timeout=1.0)
+        prober._sock = sock
+        with mock.patch.object(icmp.select, 'select',
+                               side_effect=sock.select):
+            return prober.probe(addresses), sock
+
+    def test_replies_are_matched_to_requests(self):
+        result, sock = self._probe(
+            ['10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.4'],
+            {'10.0.0.1': ('10.0.0.1', 0.002),
+             # Too late.
+             '10.0.0.2': ('10.0.0.2', 1.5),
+             # From another host.
+             '10.0.0.3': ('10.0.0.9', 0.002)})
+        self.assertEqual({'10.0.0.1': 2.0, '10.0.0.2': None,
+                          '10.0.0.3': None, '10.0.0.4': None}, result)
+        self.assertEqual(12, len(sock.sent))
+
+    def test_full_send_buffer_is_retried(self):
+        replies = dict(('10.0.0.%d' % i, ('10.0.0.%d' % i, 0.001))
+                       for i in range(1, 4))
+        errors = [None, errno.EAGAIN, errno.EAGAIN, None, errno.ENOBUFS]
+        result, sock = self._probe(list(replies), replies, errors)
+        self.assertEqual(dict((address, 1.0) for address in replies),
+                         result)
+        self.assertEqual(9, len(sock.sent))
+
+    def test_unsent_requests_time_out(self):
+        result, sock = self._probe(
+            ['10.0.0.1'], {'10.0.0.1': ('10.0.0.1', 0.001)},
+            itertools.repeat(errno.ENOBUFS))
+        self.assertEqual({'10.0.0.1': None}, result)
+        self.assertEqual([], sock.sent)
+        self.assertGreaterEqual(self.clock[0], 1.0)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_metrics
+----------------------------------
+
+Tests for the Prometheus metrics of rock-mon and rock-engine.
+"""
+
+import mock
+from oslo_config import cfg
+from six.moves.urllib import error as urlerror
+from six.moves.urllib import request as urlrequest
+from taskflow import states
+
+from rock import clients
+from rock.db.sqlalchemy.model_ping import ModelPing
+from rock import metrics
+from rock import sample_writer
+from rock.tasks import flow_utils
+from rock.tests import base
+
+CONF = cfg.CONF
+
+
+class TestMetrics(base.TestCase):
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_seconds', 'Test.', ['case'],
+                                      buckets=(0.1, 1))
+        histogram.observe(0.05, case='a')
+        histogram.observe(0.1, case='a')
+        histogram.observe(5, case='a')
+        histogram.observe(0.5, case='b"\n')
+        lines = histogram.render()
+        self.assertEqual(['# HELP test_seconds Test.',
+                          '# TYPE test_seconds histogram',
+                          'test_seconds_bucket{case="a",le="0.1"} 2',
+                          'test_seconds_bucket{case="a",le="1.0"} 2',
+                          'test_seconds_bucket{case="a",le="+Inf"} 3',
+                          'test_seconds_sum{case="a"} 5.15',
+                          'test_seconds_count{case="a"} 3',
+                          'test_seconds_bucket{case="b\\"\\n",le="0.1"} 0',
+                          'test_seconds_bucket{case="b\\"\\n",le="1.0"} 1',
+                          'test_seconds_bucket{case="b\\"\\n",le="+Inf"} 1',
+                          'test_seconds_sum{case="b\\"\\n"} 0.5',
+                          'test_seconds_count{case="b\\"\\n"} 1'], lines)
+        self.assertEqual(3, histogram.count(case='a'))
+
+    def test_register_returns_the_same_metric(self):
+        histogram = metrics.histogram('rock_test_seconds', 'Test.')
+        self.assertIs(histogram, metrics.histogram('rock_test_seconds',
+                                                   'Test.'))
+        self.assertRaises(ValueError, metrics.gauge, 'rock_test_seconds',
+                          'Test.', lambda: 1)
+
+    def test_failing_gauge_has_no_value(self):
+        gauge = metrics.Gauge('test_gauge', 'Test.', lambda: 1 / 0)
+        self.assertEqual(['# HELP test_gauge Test.',
+                          '# TYPE test_gauge gauge'], gauge.render())
+
+    def test_server(self):
+        self.addCleanup(setattr, sample_writer, '_WRITER', None)
+        writer = sample_writer.get_writer()
+        writer.put(ModelPing, {'target': 'server-01', 'result': True})
+        server = metrics.MetricsServer(port=0)
+        server.start()
+        self.addCleanup(server.stop)
+        url = 'http://127.0.0.1:%d' % server.port
+
+        response = urlrequest.urlopen(url + '/metrics')
+        self.assertEqual(metrics.CONTENT_TYPE,
+                         response.info().get('Content-Type'))
+        body = response.read().decode('utf-8').splitlines()
+        self.assertIn('# TYPE rock_threads gauge', body)
+        self.assertIn('rock_sample_queue_size 1.0', body)
+        self.assertIn('# TYPE rock_db_write_batch_rows histogram', body)
+
+        error = self.assertRaises(urlerror.HTTPError, urlrequest.urlopen,
+                                  url + '/other')
+        self.assertEqual(404, error.code)
+
+    def test_serve_disabled(self):
+        CONF.set_override('rock_engine_port', 0, group='metrics')
+        self.addCleanup(CONF.clear_override, 'rock_engine_port',
+                        group='metrics')
+        self.assertIsNone(metrics.serve('rock-engine'))
+
+    def test_endpoint_of(self):
+        request = mock.Mock(
+            url='http://nova:8774/v2.1/servers/'
+                '0b5f6e4c-1f4e-4a7e-9d43-2f0d1f8f4d11/action',
+            body='{"evacuate": {"onSharedStorage": true}}')
+        self.assertEqual('/v2.1/servers/{id}/action evacuate',
+                         clients.endpoint_of(request))
+        request = mock.Mock(
+            url='http://nova:8774/v2.1/0123456789abcdef0123456789abcdef/'
+                'os-services?binary=nova-compute', body=None)
+        self.assertEqual('/v2.1/{id}/os-services',
+                         clients.endpoint_of(request))
+
+    def test_flow_task_durations(self):
+        listener = flow_utils.TaskMetricsListener(mock.Mock())
+        labels = dict(task='HostDisable', state='success')
+        count = flow_utils.TASK_DURATION.count(**labels)
+        name = 'rock.tasks.host_disable.HostDisable'
+        listener._task_receiver(states.RUNNING, {'task_name': name})
+        listener._task_receiver(states.SUCCESS, {'task_name': name})
+        self.assertEqual(count + 1, flow_utils.TASK_DURATION.count(**labels))
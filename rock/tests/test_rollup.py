@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_rollup
+----------------------------------
+
+Tests for `rock.db.rollup` module.
+"""
+
+import datetime
+
+import sqlalchemy as sa
+
+from rock.db import rollup
+from rock.db.sqlalchemy.model_ping import ModelPing
+from rock.db.sqlalchemy.model_ping import UNREACHABLE_DELAY
+from rock.db.sqlalchemy.model_rollup import ModelPingRollup
+from rock.tests import base
+
+T0 = datetime.datetime(2016, 10, 1, 12, 0, 0)
+
+
+def at(seconds):
+    return T0 + datetime.timedelta(seconds=seconds)
+
+
+def ping(seconds, result=True, delay=None, target='host-1'):
+    return {'target': target, 'result': result, 'created_at': at(seconds),
+            'management_ip_result': result,
+            'management_ip_delay': delay}
+
+
+class TestAggregate(base.TestCase):
+
+    def test_samples_are_aggregated_per_target_and_minute(self):
+        rows = [ping(0, delay=1.0), ping(10, delay=3.0),
+                ping(20, result=False), ping(30, delay=2.0),
+                ping(60, delay=4.0), ping(5, target='host-2')]
+        rows.sort(key=lambda row: row['created_at'])
+        samples = [ModelPing(**row) for row in rows]
+        previous = {'host-1': False}
+
+        result = rollup.aggregate(ModelPingRollup, 60, samples, previous)
+        first, second, other = result
+        self.assertEqual(('host-1', at(0), 4, 1),
+                         (first['target'], first['period_start'],
+                          first['sample_count'], first['failure_count']))
+        # From the previous period, then down and up again.
+        self.assertEqual(3, first['state_changes'])
+        self.assertEqual((1.0, 2.0, 3.0, 3),
+                         (first['management_ip_delay_min'],
+                          first['management_ip_delay_avg'],
+                          first['management_ip_delay_max'],
+                          first['management_ip_delay_count']))
+        self.assertIsNone(first['tunnel_ip_delay_avg'])
+        self.assertEqual((at(60), 0), (second['period_start'],
+                                       second['state_changes']))
+        self.assertEqual(('host-2', 1), (other['target'],
+                                         other['sample_count']))
+        self.assertEqual({'host-1': True, 'host-2': True}, previous)
+
+    def test_unreachable_delay_is_not_a_stat(self):
+        samples = [ModelPing(**ping(0, delay=2.0)),
+                   ModelPing(**ping(10, result=False,
+                                    delay=UNREACHABLE_DELAY))]
+        row, = rollup.aggregate(ModelPingRollup, 60, samples)
+        self.assertEqual((2.0, 2.0, 2.0, 1),
+                         (row['management_ip_delay_min'],
+                          row['management_ip_delay_avg'],
+                          row['management_ip_delay_max'],
+                          row['management_ip_delay_count']))
+
+
+class TestRollup(base.TestCase):
+
+    def setUp(self):
+        super(TestRollup, self).setUp()
+        self.engine = sa.create_engine('sqlite://')
+        ModelPing.__table__.create(self.engine)
+        ModelPingRollup.__table__.create(self.engine)
+        self.rollup = rollup.Rollup(self.engine, window=1800)
+
+    def _insert(self, start, end, down=()):
+        self.engine.execute(ModelPing.__table__.insert(), [
+            ping(second, result=second not in down, delay=float(second % 7))
+            for second in range(start, end, 10)])
+
+    def _rollups(self, resolution):
+        table = ModelPingRollup.__table__
+        return self.engine.execute(table.select().where(
+            table.c.resolution == resolution).order_by(
+            table.c.period_start)).fetchall()
+
+    def test_rollup_continues_from_high_water_mark(self):
+        self._insert(0, 7200, down=(100, 110, 4000))
+        self.assertEqual(120, self.rollup.rollup(ModelPing, 60, at(7230)))
+        self.assertEqual(2, self.rollup.rollup(ModelPing, 3600, at(7230)))
+        self.assertEqual(at(7200), self.rollup.high_water(ModelPingRollup,
+                                                          60))
+
+        self._insert(7200, 7800)
+        self.assertEqual(10, self.rollup.rollup(ModelPing, 60, at(7830)))
+        # The third hour is not over yet.
+        self.assertEqual(0, self.rollup.rollup(ModelPing, 3600, at(7830)))
+
+        minutes = self._rollups(60)
+        self.assertEqual(130, len(minutes))
+        self.assertEqual(780, sum(row.sample_count for row in minutes))
+        hours = self._rollups(3600)
+        self.assertEqual([360, 360], [row.sample_count for row in hours])
+        self.assertEqual([2, 1], [row.failure_count for row in hours])
+        self.assertEqual([2, 2], [row.state_changes for row in hours])
+        self.assertEqual(6.0, hours[0].management_ip_delay_max)
+        self.assertAlmostEqual(
+            sum(row.management_ip_delay_avg for row in minutes[:60]) / 60,
+            hours[0].management_ip_delay_avg)
+
+    def test_expire_keeps_periods_not_rolled_up(self):
+        self._insert(0, 7800)
+        self.rollup.rollup(ModelPing, 60, at(7830))
+        self.assertEqual(0, self.rollup.expire(ModelPingRollup, 60,
+                                               at(7800)))
+        self.rollup.rollup(ModelPing, 3600, at(7830))
+        # Minutes of the third hour are kept until it is rolled up.
+        self.assertEqual(120, self.rollup.expire(ModelPingRollup, 60,
+                                                 at(7800)))
+        self.assertEqual(at(7200), self._rollups(60)[0].period_start)
+        self.assertEqual(1, self.rollup.expire(ModelPingRollup, 3600,
+                                               at(3600)))
+        self.assertEqual(1, len(self._rollups(3600)))
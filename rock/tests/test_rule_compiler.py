@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_rule_compiler
+----------------------------------
+
+Compare compiled cases with RuleParser on the shipped host_down case.
+"""
+
+import datetime
+import json
+import os
+
+import mock
+from oslo_utils import timeutils
+import testtools
+
+from rock.rules import columnar
+from rock.rules import incremental
+from rock.rules import rule_compiler
+from rock.rules import rule_parser
+from rock.tasks import dispatcher
+from rock.tests import base
+
+CASE_FILE = os.path.join(os.path.dirname(__file__), '..', '..', 'etc',
+                         'cases', 'host_down.json')
+NOW = datetime.datetime(2016, 10, 1, 12, 0, 0)
+HOSTS = ['server-%d' % i for i in range(1, 6)]
+
+
+def make_rows(failures, samples=30, extra=None):
+    """Rows newest first, failures maps a host to its leading failures."""
+    rows = []
+    for i in range(samples):
+        for host in HOSTS:
+            row = {'target': host,
+                   'created_at': NOW - datetime.timedelta(seconds=10 * i),
+                   'result': i >= failures.get(host, 0)}
+            row.update((extra or {}).get(host, {}))
+            rows.append(row)
+    return rows
+
+
+def make_service_rows(failures, status=None):
+    extra = {}
+    for host in HOSTS:
+        enabled, reason = (status or {}).get(host, (True, None))
+        extra[host] = {'service_status': enabled,
+                       'disabled_reason': reason}
+    rows = make_rows(failures, extra=extra)
+    for row in rows:
+        row['service_state'] = row['result']
+    return rows
+
+
+class TestRuleCompiler(base.TestCase):
+
+    mode = 'tree'
+
+    def setUp(self):
+        super(TestRuleCompiler, self).setUp()
+        with open(CASE_FILE) as f:
+            self.case = json.load(f)
+
+    def _run_both(self, data):
+        def _get_data(obj_name, delta):
+            return data[obj_name]
+
+        flows = {'parser': [], 'compiled': []}
+
+        def _recorder(name):
+            def _submit(target, flow_name, store_spec, tasks):
+                spec = dict(store_spec)
+                spec.pop('taskflow_uuid')
+                flows[name].append((spec, tasks))
+            return _submit
+
+        with mock.patch.object(rule_parser, 'data_get_by_obj_time',
+                               side_effect=_get_data):
+            with mock.patch.object(dispatcher, 'submit',
+                                   side_effect=_recorder('parser')):
+                parser = rule_parser.RuleParser(self.case)
+                parser._collect_data()
+                l2_result = parser._rule_mapping_per_target()
+                if l2_result:
+                    parser._action()
+            with mock.patch.object(dispatcher, 'submit',
+                                   side_effect=_recorder('compiled')):
+                compiled = rule_compiler.compile_rule(self.case,
+                                                      mode=self.mode)
+                evaluation = compiled.calculate()
+
+        self.assertEqual(parser.target_data, evaluation.target_data)
+        self.assertEqual(parser.l1_data, evaluation.l1_data)
+        self.assertEqual(l2_result, evaluation.l2_result)
+        self.assertEqual(sorted(flows['parser']), sorted(flows['compiled']))
+        return evaluation, flows['compiled']
+
+    def test_all_hosts_up(self):
+        evaluation, flows = self._run_both({
+            'nova_service': make_service_rows({}),
+            'ping': make_rows({})})
+        self.assertFalse(evaluation.l2_result)
+        self.assertEqual([], flows)
+
+    def test_one_host_down(self):
+        evaluation, flows = self._run_both({
+            'nova_service': make_service_rows({'server-2': 5}),
+            'ping': make_rows({'server-2': 10})})
+        self.assertTrue(evaluation.l2_result)
+        self.assertEqual(1, len(flows))
+        self.assertEqual('server-2', flows[0][0]['target'])
+        self.assertEqual('host_down_disable_by_rock',
+                         flows[0][0]['disabled_reason'])
+
+    def test_two_hosts_down(self):
+        evaluation, flows = self._run_both({
+            'nova_service': make_service_rows({'server-2': 5, 'server-3': 4}),
+            'ping': make_rows({'server-2': 10, 'server-3': 9})})
+        self.assertFalse(evaluation.l2_result)
+        self.assertEqual([], flows)
+
+    def test_host_disabled_by_rock_is_filtered(self):
+        evaluation, flows = self._run_both({
+            'nova_service': make_service_rows(
+                {'server-2': 5},
+                status={'server-2': (False, u'host_down_disable_by_rock')}),
+            'ping': make_rows({'server-2': 10})})
+        self.assertEqual([], flows)
+
+    def test_short_failures_do_not_trigger(self):
+        evaluation, flows = self._run_both({
+            'nova_service': make_service_rows({'server-2': 2}),
+            'ping': make_rows({'server-2': 7})})
+        self.assertEqual([], flows)
+
+    def test_host_without_ping_data_is_dropped(self):
+        ping = [row for row in make_rows({'server-2': 10})
+                if row['target'] != 'server-5']
+        evaluation, flows = self._run_both({
+            'nova_service': make_service_rows({'server-2': 5}),
+            'ping': ping})
+        self.assertNotIn('server-5', evaluation.target_data)
+
+    def test_empty_window(self):
+        evaluation, flows = self._run_both({'nova_service': [], 'ping': []})
+        self.assertFalse(evaluation.l2_result)
+        self.assertEqual([], flows)
+
+    def test_disjoint_targets(self):
+        ping = make_rows({'server-2': 10})
+        for row in ping:
+            row['target'] = 'other-' + row['target']
+        evaluation, flows = self._run_both({
+            'nova_service': make_service_rows({'server-2': 5}),
+            'ping': ping})
+        self.assertEqual({}, evaluation.target_data)
+        self.assertEqual([], flows)
+
+
+@testtools.skipUnless(columnar.available(), 'numpy is not installed')
+class TestColumnarRuleCompiler(TestRuleCompiler):
+
+    mode = 'columnar'
+
+    def _run_both(self, data):
+        evaluation, flows = super(TestColumnarRuleCompiler,
+                                  self)._run_both(data)
+        self.assertIsNotNone(evaluation.l1_vector)
+        return evaluation, flows
+
+    def test_leading_false_runs(self):
+        np = columnar.np
+        is_false = np.array([True, True, False, True,
+                             False, True, True, True], dtype=bool)
+        runs = columnar.leading_false_runs(is_false, np.array([0, 4, 5]),
+                                           np.array([4, 1, 3]))
+        self.assertEqual([2, 0, 3], runs.tolist())
+
+    def test_unsupported_case_falls_back_to_tree(self):
+        case = dict(self.case, l1_rule=['%count', '$l1_data', 'x', True])
+        compiled = rule_compiler.compile_rule(case, mode='columnar')
+        self.assertIsNone(compiled.columnar)
+
+
+class TestIncrementalRuleCompiler(TestRuleCompiler):
+
+    mode = 'incremental'
+
+    def setUp(self):
+        super(TestIncrementalRuleCompiler, self).setUp()
+        timeutils.set_time_override(NOW)
+        self.addCleanup(timeutils.clear_time_override)
+        self.rows = {}
+        patcher = mock.patch.object(incremental, 'new_rows',
+                                    side_effect=self._new_rows)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _new_rows(self, obj_name, seconds, last_id, now):
+        return [row for row in self.rows.get(obj_name, [])
+                if row['id'] > last_id]
+
+    def _add_rows(self, obj_name, rows):
+        table = self.rows.setdefault(obj_name, [])
+        # Oldest first, as rock-mon writes them.
+        for row in reversed(rows):
+            row['id'] = len(table) + 1
+            table.append(row)
+
+    def _run_both(self, data):
+        for obj_name, rows in data.items():
+            self._add_rows(obj_name, rows)
+        evaluation, flows = super(TestIncrementalRuleCompiler,
+                                  self)._run_both(data)
+        return evaluation, flows
+
+    def test_only_changed_targets_are_evaluated(self):
+        compiled = rule_compiler.compile_rule(self.case, mode=self.mode)
+        state = compiled.incremental
+        self._add_rows('nova_service', make_service_rows({}))
+        self._add_rows('ping', make_rows({}))
+        with mock.patch.object(dispatcher, 'submit') as submit:
+            self.assertFalse(compiled.calculate().l2_result)
+            self.assertEqual({'samples': 300, 'l1': 5, 'l2': 1}, state.stats)
+
+            # A new sample of every host, server-2 goes down.
+            for i in range(1, 9):
+                timeutils.advance_time_seconds(10)
+                now = NOW + datetime.timedelta(seconds=10 * i)
+                for obj_name in ('nova_service', 'ping'):
+                    self._add_rows(obj_name, [
+                        {'target': host, 'created_at': now,
+                         'result': host != 'server-2',
+                         'service_state': True, 'service_status': True,
+                         'disabled_reason': None}
+                        for host in HOSTS])
+                evaluation = compiled.calculate()
+                if i == 1:
+                    # No judge flipped, l1 and l2 inputs are unchanged.
+                    self.assertEqual({'samples': 310, 'l1': 5, 'l2': 1},
+                                     state.stats)
+            # The service judge of server-2 flipped at 30s, its ping judge
+            # at 80s, which flipped its l1 result.
+            self.assertFalse(evaluation.l1_data['server-2']['l1_result'])
+            self.assertEqual(7, state.stats['l1'])
+            self.assertEqual(2, state.stats['l2'])
+            self.assertTrue(evaluation.l2_result)
+            self.assertEqual('server-2', submit.call_args[0][0])
+
+    def test_unsupported_case_falls_back_to_tree(self):
+        case = dict(self.case, l2_rule=['%count', '$raw_data', 'x', True])
+        compiled = rule_compiler.compile_rule(case, mode='incremental')
+        self.assertIsNone(compiled.incremental)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_rule_manager
+----------------------------------
+
+Tests for the per case schedules of the rule manager.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import mock
+from oslo_config import cfg
+from oslo_utils import timeutils
+
+from rock.rules import rule_compiler
+from rock.rules import rule_manager
+from rock.tests import base
+
+CONF = cfg.CONF
+CASE_FILE = os.path.join(os.path.dirname(__file__), '..', '..', 'etc',
+                         'cases', 'host_down.json')
+
+
+class TestRuleManager(base.TestCase):
+
+    def setUp(self):
+        super(TestRuleManager, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        with open(CASE_FILE) as f:
+            self.case = json.load(f)
+        CONF.set_override('sample_cache', False, group='rule_engine')
+        self.addCleanup(CONF.clear_override, 'sample_cache',
+                        group='rule_engine')
+
+    def _write_case(self, name, **kwargs):
+        case = dict(self.case, rule_name=name)
+        case.update(kwargs)
+        with open(os.path.join(self.tmp, name + '.json'), 'w') as f:
+            json.dump(case, f)
+
+    def test_case_interval_and_timeout(self):
+        self._write_case('fast', interval=5, timeout=2.5)
+        self._write_case('default')
+        self._write_case('broken', interval=-1)
+        manager = rule_manager.RuleManager(self.tmp)
+
+        self.assertEqual(['default', 'fast'], sorted(manager.case_status))
+        fast = manager.case_status['fast']
+        self.assertEqual(5, fast.interval)
+        self.assertEqual(2.5, fast.timeout)
+        default = manager.case_status['default']
+        self.assertEqual(CONF.check_cases_interval, default.interval)
+        self.assertIsNone(default.timeout)
+
+    def test_slow_case_does_not_delay_others(self):
+        self._write_case('slow', interval=0.05)
+        self._write_case('fast', interval=0.05)
+        manager = rule_manager.RuleManager(self.tmp)
+
+        def _calculate(case, deadline=None):
+            if case.name == 'slow':
+                time.sleep(0.3)
+            return rule_compiler.Evaluation()
+
+        with mock.patch.object(manager, '_calculate',
+                               side_effect=_calculate), \
+                mock.patch.object(manager, 'report_flows'):
+            manager.start_scheduler()
+            time.sleep(0.4)
+            manager.scheduler.stop()
+
+        slow = manager.case_status['slow']
+        fast = manager.case_status['fast']
+        self.assertTrue(fast.runs >= 4)
+        self.assertTrue(slow.runs >= 1)
+        self.assertEqual(slow.runs, slow.overruns)
+        self.assertTrue(slow.entry.skipped >= 1)
+        self.assertEqual(0, fast.overruns)
+        self.assertTrue(slow.last_duration >= 0.3)
+
+    def test_failed_run_is_counted(self):
+        self._write_case('case')
+        manager = rule_manager.RuleManager(self.tmp)
+        status = manager.case_status['case']
+        with mock.patch.object(manager, '_calculate',
+                               side_effect=ValueError('boom')):
+            manager.run_case(status)
+        self.assertEqual(1, status.runs)
+        self.assertEqual(1, status.failures)
+
+    def test_timed_out_run_skips_actions(self):
+        self._write_case('case', timeout=1)
+        manager = rule_manager.RuleManager(self.tmp)
+        status = manager.case_status['case']
+        evaluation = rule_compiler.Evaluation()
+        evaluation.l2_result = True
+        now = timeutils.now()
+
+        with mock.patch.object(status.case, 'evaluate',
+                               return_value=evaluation), \
+                mock.patch.object(status.case, '_action') as action, \
+                mock.patch.object(rule_compiler.timeutils, 'now',
+                                  side_effect=[now, now + 2, now + 2]):
+            manager.run_case(status)
+
+        self.assertFalse(action.called)
+        self.assertTrue(evaluation.timed_out)
+        self.assertEqual(1, status.timeouts)
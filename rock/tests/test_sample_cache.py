@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_sample_cache
+----------------------------------
+
+Tests for the sliding windows of samples of the rule engine.
+"""
+
+import datetime
+
+import mock
+from oslo_config import cfg
+
+from rock.db.sqlalchemy import api
+from rock.db.sqlalchemy.model_ping import ModelPing
+from rock.rules import rule_parser
+from rock.rules import sample_cache
+from rock.tests import base
+
+CONF = cfg.CONF
+T0 = datetime.datetime(2016, 10, 1, 12, 0, 0)
+
+
+def at(seconds):
+    return T0 + datetime.timedelta(seconds=seconds)
+
+
+class TestSampleCache(base.TestCase):
+
+    def setUp(self):
+        super(TestSampleCache, self).setUp()
+        self.engine = api.get_engine()
+        ModelPing.metadata.create_all(self.engine)
+        self.addCleanup(ModelPing.metadata.drop_all, self.engine)
+        self.cache = sample_cache.SampleCache()
+        self.cache.register('ping', 60)
+
+    def _insert(self, start, end, result=True):
+        api.Connection.bulk_insert(ModelPing, [
+            {'target': target, 'result': result, 'created_at': at(second)}
+            for second in range(start, end, 10)
+            for target in ('host-1', 'host-2')])
+
+    def test_only_new_rows_are_read(self):
+        self._insert(-100, 0)
+        self.assertEqual(12, self.cache.refresh(at(0)))
+        rows = self.cache.get('ping', 60)
+        self.assertEqual(12, len(rows))
+        self.assertEqual(at(-10), rows[0].created_at)
+
+        self._insert(0, 30, result=False)
+        self.assertEqual(6, self.cache.refresh(at(30)))
+        rows = self.cache.get('ping', 60)
+        # Rows of -40s and older were evicted.
+        self.assertEqual(12, len(rows))
+        self.assertEqual(at(-30), min(row.created_at for row in rows))
+        self.assertEqual([False] * 6, [row.result for row in rows[:6]])
+        self.assertEqual(4, len(self.cache.get('ping', 20)))
+
+    def test_rows_after_id(self):
+        self._insert(-50, 0)
+        self.cache.refresh(at(0))
+        last_id = max(row.id for row in self.cache.get('ping', 60))
+        self._insert(0, 20)
+        self.cache.refresh(at(20))
+
+        rows = self.cache.get_after('ping', 60, last_id)
+        self.assertEqual(4, len(rows))
+        self.assertTrue(all(row.id > last_id for row in rows))
+        self.assertIsNone(self.cache.get_after('ping', 300, last_id))
+
+    def test_uncached_windows_are_read_from_the_database(self):
+        self.assertIsNone(self.cache.get('ping', 60))
+        self.cache.refresh(at(0))
+        self.assertIsNone(self.cache.get('ping', 300))
+        self.assertIsNone(self.cache.get('nova_service', 60))
+        self.assertEqual([], self.cache.get('ping', 60))
+
+    def test_data_get_by_obj_time_uses_the_cache(self):
+        self._insert(-50, 0)
+        self.cache.refresh(at(0))
+        with mock.patch.object(sample_cache, 'get_cache',
+                               return_value=self.cache), \
+                mock.patch.object(rule_parser.db_api,
+                                  'get_period_records') as period:
+            rows = rule_parser.data_get_by_obj_time('ping', 60)
+            self.assertFalse(period.called)
+            self.assertEqual(10, len(rows))
+
+            rule_parser.data_get_by_obj_time('ping', 300)
+            self.assertTrue(period.called)
+
+    def test_delta_rows_are_rebuilt(self):
+        CONF.set_override('storage_mode', 'delta', group='monitor')
+        self.addCleanup(CONF.clear_override, 'storage_mode', group='monitor')
+        api.Connection.bulk_insert(ModelPing, [
+            {'target': 'host-1', 'result': True, 'created_at': at(-200)},
+            {'target': 'host-1', 'result': False, 'created_at': at(-25)}])
+        self.cache.refresh(at(0))
+
+        rows = self.cache.get('ping', 60)
+        self.assertEqual([False] * 3 + [True] * 3,
+                         [row.result for row in rows])
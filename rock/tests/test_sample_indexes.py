@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_sample_indexes
+----------------------------------
+
+Run the migrations on sqlite and check with EXPLAIN that the sample window
+queries are served by the created_at indexes.
+"""
+
+import datetime
+import imp
+import os
+
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from rock.db.sqlalchemy import api
+from rock.db.sqlalchemy.model_host_status import ModelHostStatus
+from rock.db.sqlalchemy.model_nova_service import ModelNovaService
+from rock.db.sqlalchemy.model_ping import ModelPing
+from rock.tests import base
+
+VERSIONS_DIR = os.path.join(
+    os.path.dirname(api.__file__), 'alembic', 'versions')
+
+
+def _load_migration(name):
+    return imp.load_source('rock_migration_' + name.split('_')[0],
+                           os.path.join(VERSIONS_DIR, name))
+
+
+class TestSampleIndexes(base.TestCase):
+
+    def setUp(self):
+        super(TestSampleIndexes, self).setUp()
+        self.engine = sa.create_engine('sqlite://')
+        self.conn = self.engine.connect()
+        self.addCleanup(self.conn.close)
+        with Operations.context(MigrationContext.configure(self.conn)):
+            _load_migration('9b7a49e317a6_initial_revision.py').upgrade()
+            _load_migration('3f1c2a8d7b64_add_sample_indexes.py').upgrade()
+            _load_migration('5d2e8b1c9a47_add_host_status.py').upgrade()
+            # MySQL only, a no-op on sqlite.
+            _load_migration(
+                '8a3f6c2d4e15_partition_sample_tables.py').upgrade()
+            _load_migration(
+                'b4c71e9f0a26_add_archive_checkpoint.py').upgrade()
+            _load_migration('d2a95e7c3f18_add_sample_rollups.py').upgrade()
+        self.session = orm.sessionmaker(bind=self.conn)()
+        self.now = datetime.datetime(2016, 10, 1, 12, 0, 0)
+
+    def _plan(self, query):
+        compiled = query.statement.compile(dialect=self.engine.dialect)
+        params = [compiled.params[key] for key in compiled.positiontup]
+        rows = self.conn.execute('EXPLAIN QUERY PLAN ' + str(compiled),
+                                 params).fetchall()
+        return ' '.join(row[-1] for row in rows)
+
+    def test_period_query_uses_created_at_index(self):
+        for model in (ModelPing, ModelNovaService):
+            query = api.Connection.period_query(
+                model, self.now - datetime.timedelta(seconds=300), self.now,
+                sort_key='created_at', session=self.session)
+            plan = self._plan(query)
+            self.assertIn('ix_%s_created_at' % model.__tablename__, plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_target_period_query_uses_composite_index(self):
+        for model in (ModelPing, ModelNovaService):
+            query = api.Connection.period_query(
+                model, self.now - datetime.timedelta(seconds=300), self.now,
+                sort_key='created_at', target='server-68',
+                session=self.session)
+            plan = self._plan(query)
+            self.assertIn('ix_%s_target_created_at' % model.__tablename__,
+                          plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_target_last_n_query_uses_composite_index(self):
+        query = api.Connection.last_n_query(ModelPing, 30,
+                                            target='server-68',
+                                            session=self.session)
+        plan = self._plan(query)
+        self.assertIn('ix_ping_target_created_at', plan)
+
+    def test_period_query_returns_window_in_order(self):
+        rows = [{'target': 'server-68', 'result': True,
+                 'created_at': self.now - datetime.timedelta(seconds=s)}
+                for s in (400, 200, 100, 0)]
+        self.conn.execute(ModelPing.__table__.insert(), rows)
+        query = api.Connection.period_query(
+            ModelPing, self.now - datetime.timedelta(seconds=300), self.now,
+            sort_key='created_at', session=self.session)
+        self.assertEqual([self.now - datetime.timedelta(seconds=s)
+                          for s in (0, 100, 200)],
+                         [record.created_at for record in query])
+
+    def test_host_status_lookup_uses_primary_key(self):
+        query = self.session.query(ModelHostStatus).filter(
+            ModelHostStatus.model == 'ping',
+            ModelHostStatus.target == 'server-68')
+        plan = self._plan(query)
+        self.assertIn('sqlite_autoindex_host_status_1', plan)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_sample_ring
+----------------------------------
+
+Tests for the recent samples rock-mon shares with rock-engine in memory.
+"""
+
+import datetime
+import os
+import shutil
+import tempfile
+
+import mock
+from oslo_config import cfg
+from oslo_utils import timeutils
+
+from rock.db.sqlalchemy.model_nova_service import ModelNovaService
+from rock.db.sqlalchemy.model_ping import ModelPing
+from rock.rules import rule_parser
+from rock import sample_ring
+from rock import sample_writer
+from rock.tests import base
+
+CONF = cfg.CONF
+T0 = datetime.datetime(2016, 10, 1, 12, 0, 0)
+
+
+def at(seconds):
+    return T0 + datetime.timedelta(seconds=seconds)
+
+
+class TestSampleRing(base.TestCase):
+
+    def setUp(self):
+        super(TestSampleRing, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = sample_ring.ring_path(self.tmp, ModelPing)
+        timeutils.set_time_override(at(-600))
+        self.addCleanup(timeutils.clear_time_override)
+
+    def _writer(self, capacity=100):
+        writer = sample_ring.RingWriter(self.path, ModelPing, capacity)
+        self.addCleanup(writer.close)
+        return writer
+
+    def _append(self, writer, start, end, result=True):
+        for second in range(start, end, 10):
+            timeutils.set_time_override(at(second))
+            for target in ('host-1', 'host-2'):
+                writer.append({'target': target, 'result': result,
+                               'management_ip_result': result,
+                               'management_ip_delay': 0.2 if result else None,
+                               'created_at': at(second)})
+
+    def test_layout_round_trip(self):
+        layout = sample_ring.RingLayout(ModelNovaService)
+        sample = {'target': u'server-01', 'result': False,
+                  'service_state': False, 'service_status': True,
+                  'disabled_reason': u'host_down_disable_by_rock',
+                  'created_at': datetime.datetime(2016, 10, 1, 12, 0, 0,
+                                                  123456)}
+        values = layout.pack(sample)
+        buf = bytearray(layout.payload.size)
+        layout.payload.pack_into(buf, 0, *values)
+        row = layout.unpack(layout.payload.unpack_from(buf, 0))
+        self.assertEqual(dict(sample, id=None), row)
+
+        sample['disabled_reason'] = None
+        values = layout.pack(sample)
+        layout.payload.pack_into(buf, 0, *values)
+        row = layout.unpack(layout.payload.unpack_from(buf, 0))
+        self.assertIsNone(row['disabled_reason'])
+
+    def test_window_is_read_newest_first(self):
+        writer = self._writer()
+        self._append(writer, -100, 0)
+        self._append(writer, 0, 30, result=False)
+        reader = sample_ring.RingReader(self.path, ModelPing)
+
+        rows = reader.get(60, now=at(20))
+        self.assertEqual(14, len(rows))
+        self.assertEqual(at(20), rows[0]['created_at'])
+        self.assertEqual(at(-40), rows[-1]['created_at'])
+        self.assertEqual([False] * 6, [row['result'] for row in rows[:6]])
+        self.assertIsNone(rows[0]['management_ip_delay'])
+        self.assertEqual(0.2, rows[-1]['management_ip_delay'])
+
+    def test_falls_back_to_the_database(self):
+        reader = sample_ring.RingReader(self.path, ModelPing)
+        # No ring.
+        self.assertIsNone(reader.get(60, now=at(0)))
+
+        writer = self._writer(capacity=10)
+        self._append(writer, -30, 0)
+        # The ring was created after the start of the window.
+        self.assertIsNone(reader.get(900, now=at(0)))
+        # rock-mon stopped updating it.
+        self.assertIsNone(reader.get(20, now=at(60), max_age=30))
+        self.assertEqual(4, len(reader.get(20, now=at(0), max_age=30)))
+        # 10 records hold the last 50 seconds only, which is logged once.
+        self._append(writer, 0, 30)
+        with mock.patch.object(sample_ring, 'LOG') as log:
+            self.assertIsNone(reader.get(60, now=at(20)))
+            self.assertIsNone(reader.get(60, now=at(20)))
+        self.assertEqual(1, log.warning.call_count)
+        self.assertEqual(8, len(reader.get(30, now=at(20))))
+
+    def test_overwritten_records_are_skipped(self):
+        writer = self._writer(capacity=4)
+        self._append(writer, -30, 0)
+        # Clear the head of the oldest record, holding a sample of -20s,
+        # like an append in progress.
+        sample_ring.FRAME.pack_into(
+            writer._map,
+            sample_ring.HEADER_SIZE + 2 * writer.layout.record_size, 0)
+        reader = sample_ring.RingReader(self.path, ModelPing)
+        self.assertEqual(2, len(reader.get(5, now=at(-10))))
+        self.assertIsNone(reader.get(15, now=at(-10)))
+
+    def test_new_ring_is_mapped_again(self):
+        writer = self._writer()
+        self._append(writer, -30, 0)
+        reader = sample_ring.RingReader(self.path, ModelPing)
+        self.assertEqual(6, len(reader.get(60, now=at(-10))))
+
+        timeutils.set_time_override(at(-100))
+        writer = self._writer()
+        self._append(writer, -10, 0, result=False)
+        rows = reader.get(60, now=at(-10))
+        self.assertEqual([False, False], [row['result'] for row in rows])
+
+
+class TestSampleRingPublishing(base.TestCase):
+
+    def setUp(self):
+        super(TestSampleRingPublishing, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        CONF.set_override('sample_ring_dir', self.tmp)
+        self.addCleanup(CONF.clear_override, 'sample_ring_dir')
+        self.addCleanup(sample_ring._READERS.clear)
+        timeutils.set_time_override(at(-600))
+        self.addCleanup(timeutils.clear_time_override)
+
+    def test_engine_reads_samples_put_by_the_monitor(self):
+        ring = sample_ring.SamplePublisher(self.tmp, 100)
+        self.addCleanup(ring.close)
+        writer = sample_writer.SampleWriter(ring=ring)
+        writer.put(ModelPing, {'target': 'host-2', 'result': True})
+        timeutils.set_time_override(at(0))
+        # Never written to the database, the writer is not started.
+        writer.put(ModelPing, {'target': 'host-1', 'result': False})
+        self.assertTrue(os.path.exists(
+            sample_ring.ring_path(self.tmp, ModelPing)))
+
+        timeutils.set_time_override(at(5))
+        rows = rule_parser.data_get_by_obj_time('ping', 60)
+        self.assertEqual([('host-1', False, at(0))],
+                         [(row['target'], row['result'], row['created_at'])
+                          for row in rows])
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_sample_writer
+----------------------------------
+
+Tests for `rock.sample_writer` module.
+"""
+
+import datetime
+import time
+
+import mock
+
+from rock import sample_writer
+from rock.db.sqlalchemy.model_nova_service import ModelNovaService
+from rock.db.sqlalchemy.model_ping import ModelPing
+from rock.tests import base
+
+
+class TestSampleWriter(base.TestCase):
+
+    @mock.patch.object(sample_writer.db_api, 'bulk_insert')
+    def test_flush_groups_samples_per_table(self, bulk_insert):
+        writer = sample_writer.SampleWriter(flush_size=3, flush_interval=60)
+        writer.put(ModelPing, {'target': 'a'})
+        writer.put(ModelNovaService, {'target': 'a'})
+        writer.put(ModelPing, {'target': 'b'})
+        writer.start()
+        writer.stop(timeout=5)
+        self.assertEqual(2, bulk_insert.call_count)
+        rows = dict((call[0][0], call[0][1])
+                    for call in bulk_insert.call_args_list)
+        self.assertEqual(['a', 'b'],
+                         [row['target'] for row in rows[ModelPing]])
+        self.assertEqual(1, len(rows[ModelNovaService]))
+
+    @mock.patch.object(sample_writer.db_api, 'bulk_insert',
+                       side_effect=RuntimeError('gone'))
+    def test_failed_flush_is_not_reported(self, bulk_insert):
+        sender = mock.Mock()
+        writer = sample_writer.SampleWriter(flush_size=1, flush_interval=60,
+                                            events=sender)
+        count = sample_writer.WRITE_ROWS.count(table='ping')
+        writer.put(ModelPing, {'target': 'a', 'result': False})
+        writer.start()
+        writer.stop(timeout=5)
+        self.assertEqual(1, bulk_insert.call_count)
+        self.assertEqual(count, sample_writer.WRITE_ROWS.count(table='ping'))
+        self.assertFalse(sender.send.called)
+
+    def test_put_stamps_created_at(self):
+        writer = sample_writer.SampleWriter()
+        sample = {'target': 'a'}
+        writer.put(ModelPing, sample)
+        self.assertIsNotNone(sample['created_at'])
+        self.assertEqual(1, writer.qsize())
+
+    def test_put_drops_when_queue_is_full(self):
+        writer = sample_writer.SampleWriter(queue_size=1, put_timeout=0.01)
+        self.assertTrue(writer.put(ModelPing, {}))
+        self.assertFalse(writer.put(ModelPing, {}))
+        self.assertEqual(1, writer.dropped)
+
+    def test_put_all_waits_once_per_batch(self):
+        writer = sample_writer.SampleWriter(queue_size=1, put_timeout=0.2)
+        start = time.time()
+        self.assertEqual(4, writer.put_all(ModelPing,
+                                           [{} for _ in range(5)]))
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(4, writer.dropped)
+
+    def test_delta_filter_keeps_changes_and_keyframes(self):
+        writer = sample_writer.SampleWriter(
+            delta_filter=sample_writer.DeltaFilter(keyframe_interval=30))
+        start = datetime.datetime(2016, 10, 1, 12, 0, 0)
+        kept = []
+        for i, result in enumerate([True, True, False, False, False,
+                                    False, False, True]):
+            sample = {'target': 'a', 'result': result,
+                      'management_ip_result': result,
+                      'management_ip_delay': 0.1 * i,
+                      'created_at': start + datetime.timedelta(seconds=10 * i)}
+            writer.put(ModelPing, sample)
+            kept.append(writer.qsize())
+        # Changes at 0s, 20s and 70s, a keyframe at 50s, and the delay
+        # alone never counts as a change.
+        self.assertEqual([1, 1, 2, 2, 2, 3, 3, 4], kept)
+        self.assertEqual(4, writer.delta_filter.unchanged)
+
+    def test_dropped_sample_is_not_filtered_as_written(self):
+        writer = sample_writer.SampleWriter(
+            queue_size=1, put_timeout=0.01,
+            delta_filter=sample_writer.DeltaFilter(keyframe_interval=300))
+        start = datetime.datetime(2016, 10, 1, 12, 0, 0)
+        self.assertTrue(writer.put(ModelPing, {
+            'target': 'h1', 'result': True, 'created_at': start}))
+        self.assertFalse(writer.put(ModelPing, {
+            'target': 'h2', 'result': False, 'created_at': start}))
+        writer._queue.get_nowait()
+        self.assertTrue(writer.put(ModelPing, {
+            'target': 'h2', 'result': False,
+            'created_at': start + datetime.timedelta(seconds=10)}))
+        self.assertEqual(1, writer.qsize())
+
+    @mock.patch.object(sample_writer.db_api, 'bulk_insert',
+                       side_effect=RuntimeError('gone'))
+    def test_failed_sample_is_not_filtered_as_written(self, bulk_insert):
+        writer = sample_writer.SampleWriter(
+            flush_size=1, flush_interval=60,
+            delta_filter=sample_writer.DeltaFilter(keyframe_interval=300))
+        start = datetime.datetime(2016, 10, 1, 12, 0, 0)
+        writer.put(ModelPing, {'target': 'h2', 'result': False,
+                               'created_at': start})
+        writer.start()
+        writer.stop(timeout=5)
+        writer.put(ModelPing, {
+            'target': 'h2', 'result': False,
+            'created_at': start + datetime.timedelta(seconds=10)})
+        self.assertEqual(1, writer.qsize())
+
+    def test_host_status_counts_failures(self):
+        tracker = sample_writer.HostStatusTracker()
+        writer = sample_writer.SampleWriter(
+            delta_filter=sample_writer.DeltaFilter(keyframe_interval=300),
+            host_status=tracker)
+        start = datetime.datetime(2016, 10, 1, 12, 0, 0)
+        for i, result in enumerate([True, False, False, False]):
+            writer.put(ModelPing, {
+                'target': 'a', 'result': result,
+                'created_at': start + datetime.timedelta(seconds=10 * i)})
+        rows = tracker.pop_dirty()
+        self.assertEqual(1, len(rows))
+        # Samples dropped by the delta filter are counted too.
+        self.assertEqual(2, writer.qsize())
+        self.assertEqual(('ping', 'a', False, 3),
+                         (rows[0]['model'], rows[0]['target'],
+                          rows[0]['result'], rows[0]['failure_count']))
+        self.assertEqual(start + datetime.timedelta(seconds=10),
+                         rows[0]['last_changed_at'])
+        self.assertEqual([], tracker.pop_dirty())